@@ -6,7 +6,7 @@ Usage:
   python main-blob-pipeline.py load_configuration ai_pipeline config/ai_pipeline_config.json
   python main-blob-pipeline.py create_storage_containers
   python main-blob-pipeline.py upload_blobs_into_raw_container ../data/docs/
-  python main-blob-pipeline.py load_documents_table_per_raw_container
+  python main-blob-pipeline.py load_documents_table_per_raw_container [--per-document]
   python main-blob-pipeline.py extract_text_from_documents
   python main-blob-pipeline.py ai_process_extracted_text
   python main-blob-pipeline.py evaluate_extracted_qnas
@@ -48,6 +48,7 @@ from sqlalchemy.orm import Session
 
 from src.db.pg_util import PGUtil
 from src.db.sqlalchemy_models import AppEngine, Configuration, Document
+from src.db.sqlalchemy_models import AsyncAppEngine
 from src.db.sqlalchemy_models import CommonOperations
 
 from src.io.fs import FS
@@ -116,8 +117,7 @@ async def load_configuration(name: str, json_filename: str):
 
 async def create_storage_containers():
     storage_util = _build_storage_util()
-    AppEngine.initialize()
-    await asyncio.sleep(0.1) 
+    AsyncAppEngine.initialize()
     try:
         config_name = _ai_pipeline_config_name()
         config = await CommonOperations.read_configuration_object(config_name)
@@ -147,8 +147,7 @@ async def create_storage_containers():
 
 async def upload_blobs_into_raw_container(sample_docs_dir: str = "../data/docs/"):
     storage_util = _build_storage_util()
-    AppEngine.initialize()
-    await asyncio.sleep(0.1) 
+    AsyncAppEngine.initialize()
     try:
         config_name = _ai_pipeline_config_name()
         logging.info(f"config_name: {config_name}")
@@ -185,8 +184,7 @@ async def upload_blobs_into_raw_container(sample_docs_dir: str = "../data/docs/"
 
 async def load_documents_table_per_raw_container():
     storage_util = _build_storage_util()
-    AppEngine.initialize()
-    await asyncio.sleep(0.1) 
+    AsyncAppEngine.initialize()
     try:
         config_name = _ai_pipeline_config_name()
         config = await CommonOperations.read_configuration_object(config_name)
@@ -196,9 +194,10 @@ async def load_documents_table_per_raw_container():
         raw_container = config["containers"]["raw"]
         logging.info(f"raw_container: {raw_container}")
         blobs = storage_util.list_container(raw_container, names_only=False)
+        docs = list()
         for b in blobs:
             logging.info(b)
-            doc = Document(
+            docs.append(Document(
                 source_system="test",
                 source_path=b["name"],
                 raw_container=raw_container,
@@ -216,18 +215,28 @@ async def load_documents_table_per_raw_container():
                 preprocessed_at=None,
                 qna_extracted_at=None,
                 qna_extracted_messages=None,
-            )
-            logging.info("Document to be loaded: {}".format(doc))
+            ))
 
-            existing_doc = await CommonOperations.read_document(doc)
-            logging.info("existing_doc: {}".format(existing_doc))
+        if "--per-document" not in sys.argv:
+            # reconcile the blob listing with the documents table as one
+            # set-based operation, rather than a lookup per blob
+            count = await CommonOperations.reconcile_documents(docs)
+            logging.info("{} blobs, {} documents loaded".format(len(docs), count))
+            return
 
+        # the lookups execute concurrently, then the new documents are
+        # inserted in a single transaction
+        existing_docs = await CommonOperations.read_documents(docs)
+        new_docs = list()
+        for doc, existing_doc in zip(docs, existing_docs):
             if existing_doc is None:
-                with Session(AppEngine.get_engine()) as session:
-                    session.add_all([doc])
-                    session.commit()
+                logging.info("Document to be loaded: {}".format(doc))
+                new_docs.append(doc)
             else:
                 logging.info("Document already exists in DB, skipping: {}".format(doc))
+        if len(new_docs) > 0:
+            await CommonOperations.add_all(new_docs)
+        logging.info("{} blobs, {} documents loaded".format(len(docs), len(new_docs)))
     except Exception as e:
         #logging.critical("Exception in load_configuration: {}".format(str(e)))
         logging.critical(e, stack_info=True, exc_info=True)
@@ -325,12 +334,15 @@ async def async_main():
         logging.exception(e, stack_info=True, exc_info=True)
 
     try:
+        if PGUtil.pool is not None:
+            logging.info("PGUtil pool stats: {}".format(PGUtil.get_pool_stats()))
         await PGUtil.close_pool()
     except Exception as e:
         logging.critical(str(e))
 
     try:
         AppEngine.dispose()
+        await AsyncAppEngine.dispose()
     except Exception as e:
         logging.critical(str(e))
 
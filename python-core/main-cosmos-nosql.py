@@ -2,15 +2,27 @@
 Usage:
   Example use of the Cosmos NoSQL API.
   python main-cosmos-nosql.py load_airports dev airports pk --load
+      [--resume | --retry-failed] [--source json|raw]
   python main-cosmos-nosql.py test_cosmos_nosql dbname, db_ru, cname, c_ru, pkpath
   python main-cosmos-nosql.py test_cosmos_nosql dev 0 test 1000 /pk
   python main-cosmos-nosql.py load_python_libraries dev python_libraries
+      [--resume | --retry-failed] [--read-workers 4] [--queue-size 256]
   python main-cosmos-nosql.py vector_search_similar_libs <dbname> <cname> <id>
   python main-cosmos-nosql.py vector_search_similar_libs dev pythonlibs fastai
+  python main-cosmos-nosql.py local_similar_libs <id> [--k 12] [--nlist 100 --nprobe 8]
+      [--index-file tmp/pypi_vector_index.npz]
+  python main-cosmos-nosql.py local_similar_libs pypi_flask --nlist 100 --nprobe 8
+  python main-cosmos-nosql.py route_hops <from-iata> <to-iata>
+      [--within 2] [--index-dir tmp/route_graph]
+  python main-cosmos-nosql.py route_hops CLT GKA --within 1
+  python main-cosmos-nosql.py bench <dbname> <cname> <count>
+      [--modes upsert,batch,bulk] [--concurrency 1,8,32] [--pk-count 10] [--emulator]
+  python main-cosmos-nosql.py bench dev bench 1000 --concurrency 4,16 --emulator
 """
 
 import asyncio
 import json
+import os
 import sys
 import time
 import logging
@@ -24,8 +36,14 @@ from faker import Faker
 
 from src.os.env import Env
 from src.io.fs import FS
+from src.db.cosmos_file_ingest import CosmosFileIngest
+from src.ai.vector_index import VectorIndex
 from src.db.cosmos_nosql_util import CosmosNoSqlUtil
+from src.io.checkpoint import Checkpoint
+from src.io.checkpoint import MODE_ALL
 from src.util.data_gen import DataGenerator
+from src.util.openflights import OpenFlights
+from src.util.route_graph import RouteGraph
 
 fake = Faker()
 
@@ -40,42 +58,15 @@ async def load_airports(dbname: str, cname: str, pkpath: str):
     # See the dotnet-cosmos/ directory in this repo for a faster
     # implementation based on bulk-loading.
     try:
-        infile = "../data/openflights/json/airports.json"
-        json_lines = FS.read_lines(infile)
-        documents = list()
-        for line in json_lines:
-            if len(line) > 10:
-                try:
-                    rawdoc = json.loads(line)
-                    newdoc = dict()
-                    for key in sorted(rawdoc.keys()):
-                        value = rawdoc[key]
-                        newkey = key.lower()
-                        newdoc[newkey] = value
-                    newdoc["id"] = str(uuid.uuid4())
-                    newdoc["airportid"] = int(newdoc["airportid"])
-                    newdoc[pkpath] = newdoc["country"]
-                    newdoc["altitude"] = float(newdoc["altitude"])
-                    latitude = float(newdoc["latitude"])
-                    longitude = float(newdoc["longitude"])
-                    newdoc["latitude"] = latitude
-                    newdoc["longitude"] = longitude
-
-                    # See https://learn.microsoft.com/en-us/azure/cosmos-db/nosql/query/geospatial?tabs=javascript
-                    # Google: "azure ai search index nested geojson attributes"
-                    geojson = dict()
-                    geojson["type"] = "Point"
-                    geojson["coordinates"] = [ longitude, latitude]
-                    newdoc["location"] = geojson
-
-                    if newdoc[pkpath] != "\\N":
-                        if newdoc["iata"] != "\\N":
-                            print(json.dumps(newdoc, sort_keys=False, indent=2))
-                            documents.append(newdoc)
-                except:
-                    print("bad json on line: {}".format(line))
-        print("{} documents parsed and filtered from {} file lines".format(
-            len(documents), len(json_lines)))
+        # the airports are read, typed, filtered, and given GeoJSON locations
+        # in columnar form by DuckDB; --source raw reads airports.dat
+        openflights = OpenFlights()
+        source = Env.flag_arg("--source", "json")
+        t1 = time.time()
+        documents = list(openflights.airport_documents(source, pk_attr=pkpath))
+        openflights.close()
+        print("{} airport documents transformed from the {} data in {:.3f} secs".format(
+            len(documents), source, time.time() - t1))
 
         opts = dict()
         opts["enable_diagnostics_logging"] = True
@@ -89,19 +80,41 @@ async def load_airports(dbname: str, cname: str, pkpath: str):
         print("ctrproxy: {}".format(ctrproxy))
 
         if "--load" in sys.argv:
-            for doc in documents:
-                try:
-                    cdb_doc = await nosql_util.upsert_item(doc)
-                    print("upserted doc: {}".format(json.dumps(cdb_doc, indent=2)))
-                    time.sleep(0.05)
-                except Exception as e:
-                    logging.info("Error upserting doc: {}".format(str(e)))
-                    logging.info(traceback.format_exc())
-                    time.sleep(1.0)
+            stats = dict()
+            concurrency = Env.cosmosdb_nosql_bulk_concurrency()
+            controller = await nosql_util.create_rate_controller(
+                max_concurrency=concurrency
+            )
+            checkpoint = open_checkpoint("tmp/load_airports_checkpoint.jsonl")
+            mode = Checkpoint.mode_from_args(sys.argv)
+            pending = (
+                doc for doc in documents if checkpoint.is_pending(doc["id"], mode)
+            )
+            # the documents are grouped by country, the partition key value,
+            # into transactional batches of up to 100 upserts each
+            async for result in nosql_util.batch_write(
+                pending, "/" + pkpath, concurrency, stats, controller
+            ):
+                for id in result["ids"]:
+                    if result["ok"]:
+                        checkpoint.mark_completed(id)
+                    else:
+                        checkpoint.mark_failed(id, result["error"])
+                if not result["ok"]:
+                    logging.info(
+                        "Error in batch for pk {}: {}".format(result["pk"], result["error"])
+                    )
+            checkpoint.compact()
+            print("batch_write stats: {}".format(json.dumps(stats)))
+            print("checkpoint stats: {}".format(json.dumps(checkpoint.get_stats())))
+            print("rate controller stats: {}".format(json.dumps(controller.get_stats())))
+            FS.write_json(nosql_util.get_request_metrics(), "tmp/request_metrics.json")
+        await nosql_util.close()
     except Exception as e:
         logging.info(str(e))
         logging.info(traceback.format_exc())
 
+
 async def test_cosmos_nosql(
     dbname: str, db_ru: int, cname: str, c_ru: int, pkpath: str):
     logging.info(
@@ -219,25 +232,41 @@ async def load_python_libraries(dbname: str, cname: str):
 
         # For DiskANN Vector Search, first enable the Feature as described here:
         # https://learn.microsoft.com/en-us/azure/cosmos-db/nosql/vector-search#enable-the-vector-indexing-and-search-feature
-        for idx, entry in enumerate(entries):
-            if idx < 999999:
-                abspath = entry["abspath"]
-                print("processing file index {}: {}".format(idx, abspath))
-                try:
-                    doc = FS.read_json(abspath)
-                    if doc is not None:
-                        # There is approx 600MB in this dataset, so it will fit in a
-                        # 20GB physical partition; the partition key value is "pypi".
-                        doc["pk"] = "pypi"
-                        await nosql_util.upsert_item(doc)
-                except Exception as e:
-                    logging.info("Error processing file {}: {}".format(abspath, str(e)))
-                    logging.info(traceback.format_exc())
-                    time.sleep(0.1)  # to avoid throttling and 429 errors
+        def library_document(abspath):
+            # this is executed in the thread pool of the CosmosFileIngest pipeline
+            doc = FS.read_json(abspath)
+            if doc is not None:
+                # There is approx 600MB in this dataset, so it will fit in a
+                # 20GB physical partition; the partition key value is "pypi".
+                doc["pk"] = "pypi"
+            return doc
+
+        concurrency = Env.cosmosdb_nosql_bulk_concurrency()
+        controller = await nosql_util.create_rate_controller(max_concurrency=concurrency)
+        checkpoint = open_checkpoint("tmp/load_python_libraries_checkpoint.jsonl")
+        paths = checkpoint.pending(
+            [entry["abspath"] for entry in entries], Checkpoint.mode_from_args(sys.argv)
+        )
+        pipeline = CosmosFileIngest(
+            nosql_util,
+            concurrency=concurrency,
+            read_workers=int(Env.flag_arg("--read-workers", "4")),
+            queue_size=int(Env.flag_arg("--queue-size", "256")),
+            checkpoint=checkpoint,
+            rate_controller=controller,
+        )
+        stats = await pipeline.run(paths, library_document)
+        checkpoint.compact()
+        print("ingest stats: {}".format(json.dumps(stats)))
+        print("checkpoint stats: {}".format(json.dumps(checkpoint.get_stats())))
+        print("rate controller stats: {}".format(json.dumps(controller.get_stats())))
+        FS.write_json(nosql_util.get_request_metrics(), "tmp/request_metrics.json")
 
         print(
             "entry count: {}".format(len(entries))
         )  # 10855 docs, 10761 loaded on 6/10
+        # the failed files and their errors are in the checkpoint file;
+        # rerun with --retry-failed to load only those files
         await nosql_util.close()
 
     except Exception as e:
@@ -259,10 +288,11 @@ async def vector_search_similar_libs(dbname: str, cname: str, id: str):
         else:
             embedding = docs[0]["embedding"]
             print("embedding length: {}".format(len(embedding)))
-            sql = vector_search_sql(12, embedding)
-            FS.write(sql, "tmp/vector_search_sql.txt")
-            results = await nosql_util.query_items(sql, True)
-            for idx, result in enumerate(results):
+            # the embedding is passed once as the @embedding query parameter
+            results = nosql_util.vector_search(
+                embedding, 12, projection=["id", "pk", "name"]
+            )
+            async for result in results:
                 print(result)
 
             # results for pypi_flask:
@@ -285,14 +315,194 @@ async def vector_search_similar_libs(dbname: str, cname: str, id: str):
     await nosql_util.close()
 
 
-def vector_search_sql(top_n: int, embedding: list):
-    return """
-SELECT TOP {} c.id, c.pk, c.name, VectorDistance(c.embedding, {}) AS SimilarityScore
- FROM c
- ORDER BY VectorDistance(c.embedding, {})
-""".format(
-        top_n, embedding, embedding
-    ).lstrip()
+def local_similar_libs(id: str):
+    """
+    Display the libraries most similar to the given library id per a local
+    VectorIndex of the embeddings of the CosmosAIGraph pypi library documents,
+    without querying Cosmos DB.  The index is loaded from --index-file if
+    present, else built from the documents and saved there.  With --nlist
+    the IVF clusters are built, and --nprobe clusters are searched.
+    """
+    index_file = Env.flag_arg("--index-file", "tmp/pypi_vector_index.npz")
+    t1 = time.time()
+    if os.path.exists(index_file):
+        index = VectorIndex.load(index_file)
+    else:
+        input_dir = "../../CosmosAIGraph/data/pypi/wrangled_libs/"
+        entries = FS.walk(input_dir, include_dirs=[], include_types=["json"])
+        docs = (FS.read_json(entry["abspath"]) for entry in entries)
+        index = VectorIndex.from_documents(docs)
+        nlist = Env.flag_arg("--nlist")
+        if nlist is not None:
+            index.build_ivf(int(nlist))
+        index.save(index_file)
+    print("VectorIndex with {} vectors of {} dimensions loaded in {:.3f} secs".format(
+        index.size(), index.dimensions(), time.time() - t1))
+
+    k = int(Env.flag_arg("--k", "12"))
+    nprobe = Env.flag_arg("--nprobe")
+    nprobe = None if nprobe is None else int(nprobe)
+    t1 = time.perf_counter()
+    results = index.similar(id, k, nprobe)
+    elapsed_ms = (time.perf_counter() - t1) * 1000.0
+    if len(results) == 0:
+        print("No vector found with id: {}".format(id))
+    for result_id, score in results:
+        print("{}  {:.6f}".format(result_id, score))
+    print("{} results in {:.3f} ms".format(len(results), elapsed_ms))
+
+
+def route_hops(source: str, dest: str):
+    """
+    Display the shortest-hop route between the two given airports, and the
+    number of airports reachable within --within hops of the source, per
+    the RouteGraph index of routes.dat.  With --index-dir the index is
+    memory-mapped from that directory if present, else built and saved there.
+    """
+    index_dir = Env.flag_arg("--index-dir")
+    t1 = time.time()
+    if index_dir is not None and os.path.exists(index_dir):
+        graph = RouteGraph.load(index_dir)
+    else:
+        openflights = OpenFlights()
+        graph = RouteGraph.from_openflights(openflights)
+        openflights.close()
+        if index_dir is not None:
+            graph.save(index_dir)
+    print("RouteGraph with {} airports and {} routes loaded in {:.3f} secs".format(
+        graph.airport_count(), graph.route_count(), time.time() - t1))
+
+    t1 = time.perf_counter()
+    path = graph.shortest_hops(source, dest)
+    elapsed_us = (time.perf_counter() - t1) * 1000000.0
+    if path is None:
+        print("no route from {} to {}".format(source, dest))
+    else:
+        codes = [graph.iata[graph.index_of(id)] for id in path]
+        print("shortest route: {} ({} hops, {:.0f} us)".format(
+            " -> ".join(codes), len(path) - 1, elapsed_us))
+
+    k = int(Env.flag_arg("--within", "1"))
+    t1 = time.perf_counter()
+    reachable = graph.within_hops(source, k)
+    elapsed_us = (time.perf_counter() - t1) * 1000000.0
+    print("{} airports within {} hops of {} ({:.0f} us)".format(
+        len(reachable), k, source, elapsed_us))
+
+
+async def bench(dbname: str, cname: str, count: int):
+    """
+    Benchmark the upsert, batch, and bulk write paths of CosmosNoSqlUtil with
+    count random person documents at each of the given concurrency levels.
+    The documents are spread round-robin over --pk-count partition key values,
+    so that the batch mode writes full batches rather than measuring the
+    fragmentation of random keys; --pk-count 0 keeps the random state as the
+    partition key.  The --emulator flag targets the local Cosmos DB emulator.
+    The report, with docs/sec, RU/sec, and latency percentiles per run, is
+    printed and written to tmp/bench_report.json.
+    """
+    modes = Env.flag_arg("--modes", "upsert,batch,bulk").split(",")
+    levels = [int(c) for c in Env.flag_arg("--concurrency", "1,8,32").split(",")]
+    pk_count = max(0, int(Env.flag_arg("--pk-count", "10")))
+    if Env.boolean_arg("--emulator"):
+        os.environ["AZURE_COSMOSDB_NOSQL_URI"] = "emulator"
+        os.environ["AZURE_COSMOSDB_NOSQL_KEY"] = "emulator"
+        os.environ["AZURE_COSMOSDB_NOSQL_AUTHTYPE"] = "key"
+    report = dict()
+    report["uri"] = Env.cosmosdb_nosql_uri()
+    report["dbname"] = dbname
+    report["cname"] = cname
+    report["count"] = count
+    report["pk_count"] = pk_count
+    report["runs"] = list()
+    nosql_util = CosmosNoSqlUtil()
+    try:
+        await nosql_util.initialize()
+        await nosql_util.create_database(dbname)
+        nosql_util.set_db(dbname)
+        await nosql_util.create_container(cname, 0, "/pk")
+        nosql_util.set_container(cname)
+        dg = DataGenerator()
+        for mode in modes:
+            for concurrency in levels:
+                # generate the documents before the timed section of the run
+                documents = list()
+                for n in range(count):
+                    pk = "bench_pk_{}".format(n % pk_count) if pk_count > 0 else None
+                    documents.append(dg.random_person_document(pk=pk))
+                nosql_util.reset_request_metrics()
+                stats = dict()
+                t1 = time.perf_counter()
+                if mode == "upsert":
+                    await bench_upserts(nosql_util, documents, concurrency, stats)
+                elif mode == "batch":
+                    async for result in nosql_util.batch_write(
+                        documents, "/pk", concurrency, stats
+                    ):
+                        pass
+                elif mode == "bulk":
+                    async for result in nosql_util.bulk_upsert(
+                        documents, concurrency, stats
+                    ):
+                        pass
+                else:
+                    print("unknown bench mode: {}".format(mode))
+                    continue
+                elapsed = time.perf_counter() - t1
+                metrics = nosql_util.get_request_metrics()["operations"]
+                run = dict()
+                run["mode"] = mode
+                run["concurrency"] = concurrency
+                run["docs"] = count
+                run["pk_count"] = pk_count
+                run["failed"] = stats.get("failed", 0)
+                run["elapsed"] = elapsed
+                run["docs_per_sec"] = count / elapsed
+                run["requests"] = sum(m["count"] for m in metrics.values())
+                run["ru"] = sum(m["ru_total"] for m in metrics.values())
+                run["ru_per_sec"] = run["ru"] / elapsed
+                run["latency_ms"] = dict()
+                for name, m in metrics.items():
+                    run["latency_ms"][name] = m["latency_ms"]
+                print(json.dumps(run))
+                report["runs"].append(run)
+    except Exception as e:
+        logging.info(str(e))
+        logging.info(traceback.format_exc())
+    await nosql_util.close()
+    print(json.dumps(report, sort_keys=False, indent=2))
+    FS.write_json(report, "tmp/bench_report.json", sort_keys=False)
+
+
+async def bench_upserts(
+    nosql_util: CosmosNoSqlUtil, documents: list, concurrency: int, stats: dict
+):
+    """Upsert the documents one at a time with concurrency worker tasks."""
+    doc_iter = iter(documents)
+    stats["failed"] = 0
+
+    async def worker():
+        for doc in doc_iter:
+            try:
+                await nosql_util.upsert_item(doc)
+            except Exception as e:
+                stats["failed"] = stats["failed"] + 1
+                logging.info("bench upsert error: {}".format(str(e)))
+
+    await asyncio.gather(*[worker() for _ in range(concurrency)])
+
+
+def open_checkpoint(filename: str) -> Checkpoint:
+    """
+    Return the Checkpoint journal for a loader.  Unless --resume or
+    --retry-failed is specified, the previous journal is deleted and all
+    of the documents are loaded.
+    """
+    checkpoint = Checkpoint(filename)
+    if Checkpoint.mode_from_args(sys.argv) == MODE_ALL:
+        checkpoint.reset()
+    print("checkpoint stats: {}".format(json.dumps(checkpoint.get_stats())))
+    return checkpoint
 
 
 async def initialize_cosmos_nosql_util(dbname: str, cname: str):
@@ -346,6 +556,15 @@ if __name__ == "__main__":
                 cname = sys.argv[3]
                 libname = sys.argv[4]
                 asyncio.run(vector_search_similar_libs(dbname, cname, libname))
+            elif func == "local_similar_libs":
+                local_similar_libs(sys.argv[2])
+            elif func == "route_hops":
+                route_hops(sys.argv[2], sys.argv[3])
+            elif func == "bench":
+                dbname = sys.argv[2]
+                cname = sys.argv[3]
+                count = int(sys.argv[4])
+                asyncio.run(bench(dbname, cname, count))
         except Exception as e:
             logging.info(str(e))
             logging.info(traceback.format_exc())
@@ -59,6 +59,7 @@ from semantic_kernel.prompt_template import (
     InputVariable,
 )
 
+from src.ai.embedding_cache import EmbeddingCache
 from src.ai.sk_util import SKUtil
 from src.ai.sk.lights_plugin import LightsPlugin
 from src.io.fs import FS
@@ -96,6 +97,7 @@ async def smoketest():
     print("main generate_embedding opts: {}".format(opts))
     sk_util = SKUtil(opts, simple_builtin_plugins, custom_plugins, True)
     sk_util.build_kernel()
+    sk_util.set_embedding_cache(EmbeddingCache("tmp/embedding_cache"))
     text = FS.read("../data/text/gettysburg-address.txt").strip()
 
     # Generate an embedding
@@ -105,6 +107,13 @@ async def smoketest():
         print(len(embedding_array))
         FS.write_json(embedding_array, "tmp/embedding.json")
 
+    # Generate the embeddings of the sentences in token-budgeted batches
+    sentences = [line.strip() for line in text.split(".") if len(line.strip()) > 0]
+    matrix = await sk_util.generate_embeddings_batch(sentences, embedding_dep, 200)
+    if matrix is not None:
+        print("batch embeddings shape: {}, dtype: {}".format(matrix.shape, matrix.dtype))
+    print("embedding cache stats: {}".format(sk_util.get_embedding_cache_stats()))
+
     # Have an interactive Chat:
     execution_settings = AzureChatPromptExecutionSettings()
     execution_settings.function_choice_behavior = FunctionChoiceBehavior.Auto()
@@ -124,6 +133,9 @@ async def smoketest():
             print("Assistant > " + str(result))
             history.add_message(result)
 
+    print("service stats: {}".format(sk_util.get_service_stats()))
+    await sk_util.close()
+
 
 def simple_built_in_plugin_list() -> list[str]:
     # Return a list of the simple built-in plugins that have zero constructor args.
@@ -0,0 +1,168 @@
+import hashlib
+import json
+import logging
+import os
+
+from collections import OrderedDict
+
+import numpy as np
+
+# This class is a persistent cache of text embeddings, keyed by the
+# embedding deployment name and the sha256 of the text, so that re-running
+# an ingestion over a mostly-unchanged corpus makes few embedding calls.
+# The float32 vectors are appended to the vectors.f32 file, which is read
+# via a NumPy memory map, and the key, offset, and dimensions of each
+# vector are appended to the index.jsonl file.  The vectors are written
+# before their index lines, so an interrupted write leaves at most some
+# unreferenced bytes, and a partial last index line; both are truncated
+# before the next append.  The most recently used vectors are also kept in
+# an in-memory LRU tier of max_memory_items entries.
+# Chris Joakim, 2025
+
+VECTORS_FILENAME = "vectors.f32"
+INDEX_FILENAME = "index.jsonl"
+
+
+class EmbeddingCache:
+    def __init__(self, directory: str = "tmp/embedding_cache", max_memory_items=10000):
+        self.directory = directory
+        self.max_memory_items = max(0, int(max_memory_items))
+        self.vectors_filename = os.path.join(directory, VECTORS_FILENAME)
+        self.index_filename = os.path.join(directory, INDEX_FILENAME)
+        self.index = dict()  # key -> (float32 offset, dimensions)
+        self.vectors_end = 0  # the float32 offset after the last indexed vector
+        self.index_end = 0  # the byte offset after the last complete index line
+        self.memory = OrderedDict()  # key -> vector, in LRU order
+        self.vectors_file = None
+        self.index_file = None
+        self.mmap = None
+        self.stats = self._initial_stats()
+        os.makedirs(directory, exist_ok=True)
+        self.load()
+
+    @classmethod
+    def key(cls, deployment: str, text: str) -> str:
+        digest = hashlib.sha256(text.encode("utf-8")).hexdigest()
+        return "{}:{}".format(deployment, digest)
+
+    def load(self) -> int:
+        """Read the index file, ignoring entries beyond the end of the vectors."""
+        self.index, self.vectors_end, self.index_end = dict(), 0, 0
+        vectors_size = 0
+        if os.path.exists(self.vectors_filename):
+            vectors_size = os.path.getsize(self.vectors_filename) // 4
+        if os.path.exists(self.index_filename):
+            with open(self.index_filename, mode="rb") as f:
+                for line in f:
+                    if not line.endswith(b"\n"):
+                        break  # a partial last line, from an interrupted run
+                    self.index_end = self.index_end + len(line)
+                    try:
+                        entry = json.loads(line)
+                        end = entry["offset"] + entry["dims"]
+                        if end <= vectors_size:
+                            self.index[entry["key"]] = (entry["offset"], entry["dims"])
+                            self.vectors_end = max(self.vectors_end, end)
+                    except:
+                        pass  # an unparseable line
+        logging.info(
+            "EmbeddingCache#load {} vectors from {}".format(
+                len(self.index), self.directory
+            )
+        )
+        return len(self.index)
+
+    def get(self, deployment: str, text: str):
+        """Return the cached float32 vector of the given text, or None."""
+        key = self.key(deployment, text)
+        vector = self.memory.get(key)
+        if vector is not None:
+            self.memory.move_to_end(key)
+            self.stats["memory_hits"] = self.stats["memory_hits"] + 1
+            return vector
+        entry = self.index.get(key)
+        if entry is None:
+            self.stats["misses"] = self.stats["misses"] + 1
+            return None
+        offset, dims = entry
+        vector = np.array(self._mapped(offset + dims)[offset : offset + dims])
+        self._remember(key, vector)
+        self.stats["disk_hits"] = self.stats["disk_hits"] + 1
+        return vector
+
+    def put(self, deployment: str, text: str, vector) -> None:
+        """Append the given vector to the cache, unless already present."""
+        key = self.key(deployment, text)
+        vector = np.asarray(vector, dtype=np.float32).ravel()
+        if key not in self.index:
+            if self.vectors_file is None:
+                self._open_for_append()
+            offset = self.vectors_end
+            self.vectors_file.write(vector.tobytes())
+            self.vectors_file.flush()
+            entry = {"key": key, "offset": offset, "dims": len(vector)}
+            line = json.dumps(entry) + "\n"
+            self.index_file.write(line)
+            self.index_file.flush()
+            self.index_end = self.index_end + len(line.encode("utf-8"))
+            self.index[key] = (offset, len(vector))
+            self.vectors_end = offset + len(vector)
+            self.stats["puts"] = self.stats["puts"] + 1
+        self._remember(key, vector)
+
+    def size(self) -> int:
+        return len(self.index)
+
+    def get_stats(self) -> dict:
+        stats = dict(self.stats)
+        stats["vectors"] = len(self.index)
+        stats["memory_items"] = len(self.memory)
+        lookups = stats["memory_hits"] + stats["disk_hits"] + stats["misses"]
+        stats["hit_ratio"] = 0.0
+        if lookups > 0:
+            stats["hit_ratio"] = (stats["memory_hits"] + stats["disk_hits"]) / lookups
+        return stats
+
+    def close(self) -> None:
+        for f in [self.vectors_file, self.index_file]:
+            if f is not None:
+                f.close()
+        self.vectors_file, self.index_file, self.mmap = None, None, None
+
+    def _open_for_append(self) -> None:
+        """
+        Open the files, first truncating any unindexed bytes of the vectors
+        and any partial last line of the index.
+        """
+        self.vectors_file = open(self.vectors_filename, mode="ab")
+        self.vectors_file.truncate(self.vectors_end * 4)
+        self.index_file = open(self.index_filename, encoding="utf-8", mode="at")
+        self.index_file.truncate(self.index_end)
+        self.mmap = None
+
+    def _mapped(self, min_length: int):
+        """Return the memory map of the vectors file, remapped if it has grown."""
+        if self.mmap is None or len(self.mmap) < min_length:
+            length = os.path.getsize(self.vectors_filename) // 4
+            self.mmap = np.memmap(
+                self.vectors_filename, dtype=np.float32, mode="r", shape=(length,)
+            )
+        return self.mmap
+
+    def _remember(self, key: str, vector) -> None:
+        if self.max_memory_items == 0:
+            return
+        self.memory[key] = vector
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.max_memory_items:
+            self.memory.popitem(last=False)
+            self.stats["evictions"] = self.stats["evictions"] + 1
+
+    def _initial_stats(self) -> dict:
+        stats = dict()
+        stats["memory_hits"] = 0
+        stats["disk_hits"] = 0
+        stats["misses"] = 0
+        stats["puts"] = 0
+        stats["evictions"] = 0
+        return stats
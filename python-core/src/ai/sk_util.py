@@ -7,6 +7,11 @@ import traceback
 from enum import Enum
 from typing import Literal
 
+import httpx
+import numpy as np
+import tiktoken
+
+from openai import AsyncAzureOpenAI
 from openai import AzureOpenAI
 
 import semantic_kernel as sk
@@ -49,6 +54,11 @@ from semantic_kernel.utils.logging import setup_logging
 #
 # Chris Joakim, 2025
 
+# the kinds of the pooled service instances; see get_service_instance()
+CHAT_COMPLETION_KIND = "chat_completion"
+TEXT_EMBEDDING_KIND = "text_embedding"
+DEFAULT_AOAI_API_VERSION = "2024-10-21"
+
 
 class SKUtil:
 
@@ -69,11 +79,23 @@ class SKUtil:
         self.default_embedding_deployment_name = None
         self.llm_service_name = self.global_llm_service_name()
         
-        # key is deployment name, value is AzureChatCompletion instance
-        self.chat_completion_model_cache = dict()
+        self.aoai_api_version = os.getenv("AZURE_OPENAI_API_VERSION", DEFAULT_AOAI_API_VERSION)
+
+        # key is (kind, deployment name, endpoint), value is an AzureChatCompletion
+        # or AzureTextEmbedding instance; see get_service_instance()
+        self.service_instances = dict()
+        # key is endpoint, value is an AsyncAzureOpenAI client; all of these
+        # clients share the one pooled httpx.AsyncClient self.http_client
+        self.openai_clients = dict()
+        self.http_client = None
+        self.closed = False  # see close()
+        self.service_stats = self.initial_service_stats()
 
-        # key is deployment name, value is AzureTextEmbedding instance
-        self.embedding_model_cache = dict()
+        # the optional persistent EmbeddingCache; see set_embedding_cache()
+        self.embedding_cache = None
+
+        # the tokenizer of the embedding models, loaded on first use
+        self.tokenizer = None
 
         if self.verbose:
             print(f"SKUtil#__init__ aoai_api_url: {self.aoai_api_url}")
@@ -137,10 +159,14 @@ class SKUtil:
             print("SKUtil#generate_embedding - given text is None")
             return None
         if dep_name is None:
-            def_name = self.default_embedding_deployment_name
+            dep_name = self.default_embedding_deployment_name
         if dep_name is None:
             print("SKUtil#generate_embedding - given dep_name is None or no default value")
             return None
+        if self.embedding_cache is not None:
+            cached = self.embedding_cache.get(dep_name, text)
+            if cached is not None:
+                return cached.tolist()
         instance = self.get_embedding_instance(dep_name)
         if instance is None:
             print("SKUtil#generate_embedding - instance for deployment {} is None".format(dep_name))
@@ -152,12 +178,131 @@ class SKUtil:
                     print(str(type(embedding)))  # <class 'numpy.ndarray'>.
                     print(str(type(embedding[0])))
                     print(embedding[0].shape)  # (1536,)
+                if self.embedding_cache is not None:
+                    self.embedding_cache.put(dep_name, text, embedding[0])
                 return embedding[0].tolist()
             except Exception as e:
                 print(str(e))
                 print(traceback.format_exc())
                 return None
 
+    async def generate_embeddings_batch(
+            self,
+            texts: list[str],
+            dep_name: str = None,
+            max_batch_tokens: int = 8000,
+            max_batch_size: int = 2048,
+            concurrency: int = 4) -> np.ndarray | None:
+        """
+        Generate the embeddings of the given texts, and return them as one
+        contiguous float32 matrix with a row per text, in the input order.
+        The distinct texts not in the embedding cache are packed, in order,
+        into batches of at most max_batch_tokens tokens and max_batch_size
+        texts, and up to concurrency batches are sent at a time.  If any batch
+        fails then None is returned, but the embeddings of the successful
+        batches are still cached, so a retry only sends the failed batches.
+        """
+        if texts is None:
+            print("SKUtil#generate_embeddings_batch - given texts is None")
+            return None
+        if dep_name is None:
+            dep_name = self.default_embedding_deployment_name
+        if dep_name is None:
+            print("SKUtil#generate_embeddings_batch - given dep_name is None or no default value")
+            return None
+        instance = self.get_embedding_instance(dep_name)
+        if instance is None:
+            print(
+                "SKUtil#generate_embeddings_batch - instance for deployment {} is None".format(
+                    dep_name
+                )
+            )
+            return None
+
+        vectors = dict()  # text -> embedding, for the distinct texts
+        for text in texts:
+            if text not in vectors and self.embedding_cache is not None:
+                cached = self.embedding_cache.get(dep_name, text)
+                if cached is not None:
+                    vectors[text] = cached
+        uncached = [t for t in dict.fromkeys(texts) if t not in vectors]
+        batches = self.embedding_batches(uncached, max_batch_tokens, max_batch_size)
+        semaphore = asyncio.Semaphore(max(1, int(concurrency)))
+
+        async def embed(batch: list[str]):
+            async with semaphore:
+                return await instance.generate_embeddings(batch, batch_size=len(batch))
+
+        results = await asyncio.gather(
+            *[embed(batch) for batch in batches], return_exceptions=True)
+        failed_batches = 0
+        for batch, embeddings in zip(batches, results):
+            if isinstance(embeddings, BaseException):
+                failed_batches = failed_batches + 1
+                print(str(embeddings))
+                print("".join(traceback.format_exception(embeddings)))
+                continue
+            for text, embedding in zip(batch, embeddings):
+                vectors[text] = embedding
+                if self.embedding_cache is not None:
+                    self.embedding_cache.put(dep_name, text, embedding)
+        if failed_batches > 0:
+            print("SKUtil#generate_embeddings_batch - {} of {} batches failed".format(
+                failed_batches, len(batches)))
+            return None
+        if self.verbose:
+            print("SKUtil#generate_embeddings_batch texts: {}, cached: {}, batches: {}".format(
+                len(texts), len(vectors) - len(uncached), len(batches)))
+        if len(texts) == 0:
+            return np.zeros((0, 0), dtype=np.float32)
+        matrix = np.empty((len(texts), len(vectors[texts[0]])), dtype=np.float32)
+        for row, text in enumerate(texts):
+            matrix[row] = vectors[text]
+        return matrix
+
+    def embedding_batches(
+            self,
+            texts: list[str],
+            max_batch_tokens: int = 8000,
+            max_batch_size: int = 2048) -> list[list[str]]:
+        """
+        Pack the given texts, in order, into batches of at most max_batch_tokens
+        tokens and max_batch_size texts.  A text with more than max_batch_tokens
+        tokens is sent in a batch by itself.
+        """
+        batches, batch, batch_tokens = list(), list(), 0
+        for text in texts:
+            tokens = self.count_tokens(text)
+            if len(batch) > 0 and (
+                    batch_tokens + tokens > max_batch_tokens or len(batch) >= max_batch_size):
+                batches.append(batch)
+                batch, batch_tokens = list(), 0
+            batch.append(text)
+            batch_tokens = batch_tokens + tokens
+        if len(batch) > 0:
+            batches.append(batch)
+        return batches
+
+    def count_tokens(self, text: str) -> int:
+        """Return the number of tokens of the given text, per the cl100k_base encoding."""
+        if self.tokenizer is None:
+            # the encoding of the text-embedding-ada-002 and text-embedding-3 models
+            self.tokenizer = tiktoken.get_encoding("cl100k_base")
+        return len(self.tokenizer.encode(text, disallowed_special=()))
+
+    def set_embedding_cache(self, embedding_cache) -> None:
+        """
+        Set the optional EmbeddingCache used by generate_embedding, so that
+        the embedding of previously embedded text is read from the cache
+        rather than generated again.  Pass None to disable caching.
+        """
+        self.embedding_cache = embedding_cache
+
+    def get_embedding_cache_stats(self) -> dict:
+        if self.embedding_cache is None:
+            return dict()
+        return self.embedding_cache.get_stats()
+
     async def get_chat_message_content(self,
         dep_name: str,
         user_message: str,
@@ -184,42 +329,115 @@ class SKUtil:
             return "DEBUG"
            
     def get_completion_instance(self, deployment_name: str) -> AzureChatCompletion | None:
-        instance = None
-        if deployment_name is None:
-            return instance
-        else:
-            if deployment_name in self.chat_completion_model_cache.keys():
-                return self.chat_completion_model_cache[deployment_name]
-            else:
-                instance = AzureChatCompletion(
-                    api_key=self.aoai_api_key,
-                    endpoint=self.aoai_api_url,
-                    deployment_name=deployment_name)
-                if instance is not None:
-                    self.chat_completion_model_cache[deployment_name] = instance
-                    if self.verbose:
-                        print("SKUtil#get_completion_instance cached: {}".format(deployment_name))
-        return instance
+        return self.get_service_instance(CHAT_COMPLETION_KIND, deployment_name)
 
     def get_embedding_instance(self, deployment_name: str) -> AzureTextEmbedding | None:
-        instance = None
+        return self.get_service_instance(TEXT_EMBEDDING_KIND, deployment_name)
+
+    def get_service_instance(self, kind: str, deployment_name: str, endpoint: str = None):
+        """
+        Return the pooled AzureChatCompletion or AzureTextEmbedding instance of
+        the given kind, deployment, and endpoint, creating it on first use.
+        All of the instances send their requests through the one shared
+        httpx.AsyncClient, so that its connections are reused.  That client is
+        bound to the event loop that first uses it, so an SKUtil, and the
+        instances it returns, must be used from a single event loop and thread.
+        """
         if deployment_name is None:
+            return None
+        if endpoint is None:
+            endpoint = self.aoai_api_url
+        key = (kind, deployment_name, endpoint)
+        if self.closed:
+            raise RuntimeError("SKUtil#get_service_instance - this SKUtil is closed")
+        instance = self.service_instances.get(key)
+        if instance is not None:
+            self.service_stats["instances_reused"] = self.service_stats["instances_reused"] + 1
             return instance
+        client = self.get_openai_client(endpoint)
+        if kind == CHAT_COMPLETION_KIND:
+            instance = AzureChatCompletion(
+                api_key=self.aoai_api_key,
+                endpoint=endpoint,
+                deployment_name=deployment_name,
+                async_client=client)
+        elif kind == TEXT_EMBEDDING_KIND:
+            instance = AzureTextEmbedding(
+                api_key=self.aoai_api_key,
+                endpoint=endpoint,
+                deployment_name=deployment_name,
+                async_client=client)
         else:
-            if deployment_name in self.chat_completion_model_cache.keys():
-                return self.chat_completion_model_cache[deployment_name]
-            else:
-                instance = AzureTextEmbedding(
-                    api_key=self.aoai_api_key,
-                    endpoint=self.aoai_api_url,
-                    deployment_name=deployment_name)
-                if instance is not None:
-                    self.chat_completion_model_cache[deployment_name] = instance
-                    if self.verbose:
-                        print("SKUtil#get_embedding_instance cached: {}".format(deployment_name))
-
+            print("SKUtil#get_service_instance - unknown kind: {}".format(kind))
+            return None
+        self.service_instances[key] = instance
+        self.service_stats["instances_created"] = self.service_stats["instances_created"] + 1
+        if self.verbose:
+            print("SKUtil#get_service_instance cached: {}".format(key))
         return instance
 
+    def get_openai_client(self, endpoint: str) -> AsyncAzureOpenAI:
+        """Return the AsyncAzureOpenAI client of the given endpoint."""
+        if self.http_client is None:
+            self.http_client = httpx.AsyncClient(
+                limits=httpx.Limits(max_connections=100, max_keepalive_connections=20),
+                timeout=httpx.Timeout(60.0, connect=10.0),
+                event_hooks={"request": [self.on_http_request]})
+        client = self.openai_clients.get(endpoint)
+        if client is None:
+            client = AsyncAzureOpenAI(
+                api_key=self.aoai_api_key,
+                azure_endpoint=endpoint,
+                api_version=self.aoai_api_version,
+                http_client=self.http_client)
+            self.openai_clients[endpoint] = client
+        return client
+
+    async def on_http_request(self, request) -> None:
+        # the httpcore trace extension reports the new connections and TLS handshakes
+        self.service_stats["http_requests"] = self.service_stats["http_requests"] + 1
+        request.extensions["trace"] = self.on_http_trace
+
+    async def on_http_trace(self, event_name: str, info: dict) -> None:
+        if event_name == "connection.connect_tcp.complete":
+            self.service_stats["connections_opened"] = self.service_stats["connections_opened"] + 1
+        elif event_name == "connection.start_tls.complete":
+            self.service_stats["tls_handshakes"] = self.service_stats["tls_handshakes"] + 1
+
+    def get_service_stats(self) -> dict:
+        """Return the instance pool and HTTP connection reuse statistics."""
+        stats = dict(self.service_stats)
+        stats["instances"] = ["{}/{}/{}".format(*key) for key in self.service_instances.keys()]
+        stats["openai_clients"] = len(self.openai_clients)
+        stats["connections_reused"] = max(0, stats["http_requests"] - stats["connections_opened"])
+        stats["connection_reuse_ratio"] = 0.0
+        if stats["http_requests"] > 0:
+            stats["connection_reuse_ratio"] = stats["connections_reused"] / stats["http_requests"]
+        return stats
+
+    def initial_service_stats(self) -> dict:
+        stats = dict()
+        stats["instances_created"] = 0
+        stats["instances_reused"] = 0
+        stats["http_requests"] = 0
+        stats["connections_opened"] = 0
+        stats["tls_handshakes"] = 0
+        return stats
+
+    async def close(self) -> None:
+        """
+        Close the shared HTTP client, and with it the pooled connections.
+        This ends the lifetime of this SKUtil; the service instances, including
+        those added to the kernel by build_kernel(), can't send requests after
+        this, and get_service_instance() raises a RuntimeError.  Create a new
+        SKUtil, and kernel, if needed.
+        """
+        self.closed = True
+        http_client, self.http_client = self.http_client, None
+        self.service_instances, self.openai_clients = dict(), dict()
+        if http_client is not None:
+            await http_client.aclose()
+
     def global_llm_service_name(self):
         # This method, and your environment variable values, should return one
         # of the following three lowercase values".  "azureopenai" is the default
@@ -0,0 +1,186 @@
+import json
+import logging
+
+import numpy as np
+
+# This class is a local, in-process vector index for cosine similarity
+# searches, such as for the embedding attribute of the pypi library
+# documents that are loaded into Cosmos DB by main-cosmos-nosql.py.
+# The vectors are stored as a contiguous float32 NumPy matrix of unit
+# vectors, so a batch of queries is a single matrix multiplication.
+# The optional IVF (inverted file) mode partitions the vectors into
+# k-means clusters, and a query then scans only the vectors of its
+# nprobe nearest clusters.  This allows similarity queries to be
+# pre-filtered, re-ranked, or served without spending Cosmos DB RUs.
+# Chris Joakim, 2025
+
+
+class VectorIndex:
+    def __init__(self, ids: list, vectors, normalized: bool = False):
+        self.ids = list(ids)
+        self.id_rows = {id: row for row, id in enumerate(self.ids)}
+        self.matrix = np.ascontiguousarray(vectors, dtype=np.float32)
+        if not normalized:
+            self.matrix = self.normalize(self.matrix)
+        self.centroids = None  # the IVF cluster centroids, if built
+        self.ivf_rows = None  # the matrix rows, ordered by cluster
+        self.ivf_offsets = None  # cluster c rows: ivf_rows[offsets[c]:offsets[c+1]]
+
+    @classmethod
+    def from_documents(
+        cls, docs, id_attr: str = "id", embedding_attr: str = "embedding"
+    ) -> "VectorIndex":
+        """
+        Build the index from the given iterable of documents, such as the
+        pypi library documents, that have the given embedding attribute.
+        Documents without an embedding, or of a different dimension than
+        the first, are skipped.
+        """
+        ids, vectors, dims = list(), list(), None
+        for doc in docs:
+            embedding = doc.get(embedding_attr) if doc is not None else None
+            if embedding is None or len(embedding) == 0:
+                continue
+            if dims is None:
+                dims = len(embedding)
+            if len(embedding) != dims:
+                logging.info(
+                    "VectorIndex skipping {}, dims: {}".format(
+                        doc.get(id_attr), len(embedding)
+                    )
+                )
+                continue
+            ids.append(doc[id_attr])
+            vectors.append(embedding)
+        matrix = np.array(vectors, dtype=np.float32).reshape(len(ids), dims or 0)
+        return cls(ids, matrix)
+
+    @classmethod
+    def load(cls, infile: str) -> "VectorIndex":
+        """Load an index saved with save()."""
+        with np.load(infile, allow_pickle=False) as data:
+            index = cls(json.loads(str(data["ids"])), data["matrix"], True)
+            if "centroids" in data:
+                index.centroids = data["centroids"]
+                index.ivf_rows = data["ivf_rows"]
+                index.ivf_offsets = data["ivf_offsets"]
+        return index
+
+    def save(self, outfile: str) -> None:
+        arrays = dict()
+        arrays["ids"] = np.array(json.dumps(self.ids))
+        arrays["matrix"] = self.matrix
+        if self.centroids is not None:
+            arrays["centroids"] = self.centroids
+            arrays["ivf_rows"] = self.ivf_rows
+            arrays["ivf_offsets"] = self.ivf_offsets
+        np.savez(outfile, **arrays)
+
+    @classmethod
+    def normalize(cls, vectors):
+        """Return the given 2D float32 array with each row scaled to unit length."""
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0.0] = 1.0
+        return vectors / norms
+
+    def size(self) -> int:
+        return len(self.ids)
+
+    def dimensions(self) -> int:
+        return self.matrix.shape[1]
+
+    def vector(self, id):
+        """Return the normalized vector of the given id, or None."""
+        row = self.id_rows.get(id)
+        return None if row is None else self.matrix[row]
+
+    def search(
+        self, query_vectors, k: int = 10, nprobe: int = None, batch_size: int = 256
+    ) -> list:
+        """
+        Return the top k results of each of the given query vectors, as a list
+        with one list of (id, cosine_similarity) tuples per query, in
+        descending similarity order.  If the IVF clusters have been built and
+        nprobe is given, only the vectors of the nprobe nearest clusters
+        are scanned; otherwise the search is an exact brute-force search.
+        The queries are processed batch_size at a time, to bound the memory
+        of the score matrix.
+        """
+        queries = np.atleast_2d(np.asarray(query_vectors, dtype=np.float32))
+        queries = self.normalize(queries)
+        results = list()
+        for start in range(0, len(queries), batch_size):
+            batch = queries[start : start + batch_size]
+            if nprobe is not None and self.centroids is not None:
+                for query in batch:
+                    results.append(self._ivf_search(query, k, nprobe))
+            else:
+                scores = batch @ self.matrix.T
+                rows = np.arange(self.size())
+                for row_scores in scores:
+                    results.append(self._top_k(row_scores, rows, k))
+        return results
+
+    def similar(self, id, k: int = 10, nprobe: int = None) -> list:
+        """
+        Return the top k (id, cosine_similarity) tuples most similar to the
+        vector of the given id, excluding the id itself.
+        """
+        vector = self.vector(id)
+        if vector is None:
+            return list()
+        results = self.search(vector, k + 1, nprobe)[0]
+        return [r for r in results if r[0] != id][:k]
+
+    def build_ivf(
+        self, nlist: int = None, iterations: int = 10, seed: int = 42
+    ) -> None:
+        """
+        Partition the vectors into nlist clusters with spherical k-means;
+        nlist defaults to the square root of the number of vectors.
+        """
+        n = self.size()
+        if nlist is None:
+            nlist = max(1, int(np.sqrt(n)))
+        nlist = min(max(1, int(nlist)), n)
+        rng = np.random.default_rng(seed)
+        centroids = self.matrix[rng.choice(n, nlist, replace=False)].copy()
+        for _ in range(int(iterations)):
+            rows, offsets, counts = self._cluster_rows(centroids)
+            sums = self.matrix[rng.choice(n, nlist)]  # reseeds the empty clusters
+            present = counts > 0
+            sums[present] = np.add.reduceat(self.matrix[rows], offsets[:-1][present])
+            centroids = self.normalize(sums)
+        self.centroids = centroids
+        self.ivf_rows, self.ivf_offsets, _ = self._cluster_rows(centroids)
+
+    def _cluster_rows(self, centroids):
+        """
+        Assign each vector to its nearest centroid, and return the matrix rows
+        ordered by cluster, the cluster offsets into those rows, and the counts.
+        """
+        assignments = np.argmax(self.matrix @ centroids.T, axis=1)
+        rows = np.argsort(assignments, kind="stable").astype(np.int32)
+        counts = np.bincount(assignments, minlength=len(centroids))
+        offsets = np.zeros(len(centroids) + 1, dtype=np.int64)
+        np.cumsum(counts, out=offsets[1:])
+        return rows, offsets, counts
+
+    def _ivf_search(self, query, k: int, nprobe: int) -> list:
+        nprobe = min(int(nprobe), len(self.centroids))
+        nearest = np.argpartition(-(self.centroids @ query), nprobe - 1)[:nprobe]
+        rows = np.concatenate(
+            [
+                self.ivf_rows[self.ivf_offsets[c] : self.ivf_offsets[c + 1]]
+                for c in nearest
+            ]
+        )
+        return self._top_k(self.matrix[rows] @ query, rows, k)
+
+    def _top_k(self, scores, rows, k: int) -> list:
+        k = min(int(k), len(scores))
+        if k <= 0:
+            return list()
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [(self.ids[rows[i]], float(scores[i])) for i in top]
@@ -0,0 +1,188 @@
+import asyncio
+import logging
+import time
+import traceback
+
+from concurrent.futures import ThreadPoolExecutor
+
+# This class is a staged producer/consumer pipeline for loading a large
+# number of JSON files into Cosmos DB via CosmosNoSqlUtil#bulk_upsert.
+# A thread pool reads and parses the files, and the parsed documents are
+# passed through a bounded asyncio queue to the concurrent bulk writers.
+# The readers block when the queue is full, so that the memory use is
+# bounded by the queue size rather than by the size of the dataset.
+# An optional Checkpoint journal records the files that have been loaded,
+# and the files that failed with their error reasons, so that a rerun
+# skips the completed files.
+# Chris Joakim, 2025
+
+
+class CosmosFileIngest:
+    def __init__(
+        self,
+        nosql_util,
+        concurrency: int = 16,
+        read_workers: int = 4,
+        queue_size: int = 256,
+        checkpoint=None,
+        rate_controller=None,
+        progress_interval: int = 1000,
+    ):
+        self.nosql_util = nosql_util
+        self.concurrency = max(1, int(concurrency))
+        self.read_workers = max(1, int(read_workers))
+        self.queue_size = max(1, int(queue_size))
+        self.checkpoint = checkpoint
+        self.rate_controller = rate_controller
+        self.progress_interval = max(1, int(progress_interval))
+        self.stats = dict()
+
+    async def run(self, paths: list, parse_function) -> dict:
+        """
+        Load the given file paths, where parse_function(path) is called in
+        the thread pool and returns the document to upsert, or None to skip
+        the file.  Return a dict of the pipeline stats.
+        """
+        self.stats = self._initial_stats(len(paths))
+        queue = asyncio.Queue(maxsize=self.queue_size)
+        producer = asyncio.create_task(self._produce(paths, parse_function, queue))
+        try:
+            await self._consume(queue)
+            await producer
+        finally:
+            if not producer.done():
+                producer.cancel()
+            if self.checkpoint is not None:
+                self.checkpoint.flush()
+        self._update_rates()
+        return self.stats
+
+    async def _produce(self, paths: list, parse_function, queue) -> None:
+        loop = asyncio.get_running_loop()
+        try:
+            with ThreadPoolExecutor(max_workers=self.read_workers) as executor:
+                pending = set()
+                for path in paths:
+                    if self._is_completed(path):
+                        self.stats["skipped"] = self.stats["skipped"] + 1
+                        continue
+                    pending.add(
+                        loop.run_in_executor(
+                            executor, self._read_file, parse_function, path
+                        )
+                    )
+                    # keep at most two reads per worker in flight
+                    if len(pending) >= self.read_workers * 2:
+                        done, pending = await asyncio.wait(
+                            pending, return_when=asyncio.FIRST_COMPLETED
+                        )
+                        await self._enqueue(done, queue)
+                while len(pending) > 0:
+                    done, pending = await asyncio.wait(
+                        pending, return_when=asyncio.FIRST_COMPLETED
+                    )
+                    await self._enqueue(done, queue)
+        except Exception as e:
+            logging.info("CosmosFileIngest producer error: {}".format(str(e)))
+            logging.info(traceback.format_exc())
+        await queue.put(None)  # the end-of-input sentinel
+
+    def _is_completed(self, path: str) -> bool:
+        return self.checkpoint is not None and self.checkpoint.is_completed(path)
+
+    async def _enqueue(self, futures, queue) -> None:
+        for future in futures:
+            path, doc, error = future.result()
+            if error is not None:
+                self.stats["read_errors"] = self.stats["read_errors"] + 1
+                logging.info("Error reading file {}: {}".format(path, error))
+                if self.checkpoint is not None:
+                    self.checkpoint.mark_failed(path, error)
+            elif doc is None:
+                self.stats["ignored"] = self.stats["ignored"] + 1
+            else:
+                self.stats["read"] = self.stats["read"] + 1
+                # this blocks while the queue is full, which is the backpressure
+                await queue.put((path, doc))
+                self.stats["max_queue_depth"] = max(
+                    self.stats["max_queue_depth"], queue.qsize()
+                )
+
+    def _read_file(self, parse_function, path: str):
+        """Executed in the thread pool; the stats are updated by the event loop."""
+        try:
+            return path, parse_function(path), None
+        except Exception as e:
+            logging.debug(traceback.format_exc())
+            return path, None, str(e)
+
+    async def _consume(self, queue) -> None:
+        paths = dict()  # bulk_upsert index -> file path
+
+        async def documents():
+            index = 0
+            while True:
+                item = await queue.get()
+                if item is None:
+                    return
+                paths[index] = item[0]
+                index = index + 1
+                yield item[1]
+
+        async for result in self.nosql_util.bulk_upsert(
+            documents(), self.concurrency, None, self.rate_controller
+        ):
+            path = paths.pop(result["index"], None)
+            self.stats["ru"] = self.stats["ru"] + result["ru"]
+            if result["ok"]:
+                self.stats["written"] = self.stats["written"] + 1
+                if self.checkpoint is not None and path is not None:
+                    self.checkpoint.mark_completed(path)
+            else:
+                self.stats["failed"] = self.stats["failed"] + 1
+                logging.info(
+                    "Error upserting file {}: {}".format(path, result["error"])
+                )
+                if self.checkpoint is not None and path is not None:
+                    self.checkpoint.mark_failed(path, result["error"])
+            done = self.stats["written"] + self.stats["failed"]
+            if done % self.progress_interval == 0:
+                self._log_progress(queue)
+
+    def _log_progress(self, queue) -> None:
+        self._update_rates()
+        logging.info(
+            "CosmosFileIngest progress: {}/{} files, written: {}, failed: {}, "
+            "skipped: {}, queue: {}, docs/sec: {:.1f}".format(
+                self.stats["written"] + self.stats["failed"] + self.stats["skipped"],
+                self.stats["files"],
+                self.stats["written"],
+                self.stats["failed"],
+                self.stats["skipped"],
+                queue.qsize(),
+                self.stats["docs_per_sec"],
+            )
+        )
+
+    def _update_rates(self) -> None:
+        elapsed = time.time() - self.stats["start_time"]
+        self.stats["elapsed"] = elapsed
+        self.stats["docs_per_sec"] = 0.0
+        if elapsed > 0:
+            self.stats["docs_per_sec"] = self.stats["written"] / elapsed
+
+    def _initial_stats(self, file_count: int) -> dict:
+        stats = dict()
+        stats["files"] = file_count
+        stats["skipped"] = 0
+        stats["read"] = 0
+        stats["ignored"] = 0
+        stats["read_errors"] = 0
+        stats["written"] = 0
+        stats["failed"] = 0
+        stats["ru"] = 0.0
+        stats["max_queue_depth"] = 0
+        stats["start_time"] = time.time()
+        stats["elapsed"] = 0.0
+        stats["docs_per_sec"] = 0.0
+        return stats
@@ -0,0 +1,170 @@
+import math
+import time
+
+from collections import deque
+
+# This module contains the per-request RU and latency accounting used by
+# class CosmosNoSqlUtil.  Each request passes a ResponseHook instance as
+# the response_hook of the SDK method, so that the charge, latency, and
+# activity id of that specific response are captured, rather than reading
+# the last_response_headers of the client connection which is shared by
+# all in-flight requests.  The hooks record into a CosmosRequestMetrics
+# instance, which aggregates the samples per operation name.
+# Chris Joakim, 2025
+
+REQUEST_CHARGE_HEADER = "x-ms-request-charge"
+ACTIVITY_ID_HEADER = "x-ms-activity-id"
+
+
+def percentile(sorted_values: list, pct: float) -> float:
+    """
+    Return the given percentile, 0 to 100, of the given sorted list of
+    values using the nearest-rank method, or 0.0 if the list is empty.
+    """
+    if len(sorted_values) == 0:
+        return 0.0
+    rank = math.ceil((pct / 100.0) * len(sorted_values)) - 1
+    return float(sorted_values[max(0, min(rank, len(sorted_values) - 1))])
+
+
+class CosmosRequestMetrics:
+    """
+    Per-operation histograms of the request latency and RU charge.
+    The most recent max_samples values per operation are retained for the
+    percentile calculations, while the counts and totals cover all requests.
+    """
+
+    def __init__(self, max_samples: int = 10000, max_recent: int = 100):
+        self.max_samples = max(1, int(max_samples))
+        self.recent = deque(maxlen=max(1, int(max_recent)))
+        self.operations = dict()  # operation name -> dict
+        self.started_at = time.time()
+
+    def record(
+        self,
+        operation: str,
+        ru: float,
+        latency_ms: float,
+        activity_id: str = None,
+        status_code: int = None,
+    ) -> dict:
+        """Record one response and return it as a dict."""
+        op = self.operations.get(operation)
+        if op is None:
+            op = dict()
+            op["count"] = 0
+            op["errors"] = 0
+            op["ru_total"] = 0.0
+            op["latency_ms_total"] = 0.0
+            op["latency_ms"] = deque(maxlen=self.max_samples)
+            op["ru"] = deque(maxlen=self.max_samples)
+            self.operations[operation] = op
+        op["count"] = op["count"] + 1
+        if status_code is not None and status_code >= 400:
+            op["errors"] = op["errors"] + 1
+        op["ru_total"] = op["ru_total"] + ru
+        op["latency_ms_total"] = op["latency_ms_total"] + latency_ms
+        op["latency_ms"].append(latency_ms)
+        op["ru"].append(ru)
+
+        request = dict()
+        request["operation"] = operation
+        request["ru"] = ru
+        request["latency_ms"] = latency_ms
+        request["activity_id"] = activity_id
+        request["status_code"] = status_code
+        request["time"] = time.time()
+        self.recent.append(request)
+        return request
+
+    def get_stats(self) -> dict:
+        """
+        Return a JSON-serializable dict with the count, errors, RU totals and
+        the p50/p95/p99/max latency and RU values of each operation.
+        """
+        stats = dict()
+        stats["elapsed"] = time.time() - self.started_at
+        stats["operations"] = dict()
+        for name in sorted(self.operations.keys()):
+            op = self.operations[name]
+            op_stats = dict()
+            op_stats["count"] = op["count"]
+            op_stats["errors"] = op["errors"]
+            op_stats["ru_total"] = op["ru_total"]
+            op_stats["ru_per_sec"] = op["ru_total"] / max(stats["elapsed"], 0.001)
+            op_stats["latency_ms"] = self._histogram(
+                op["latency_ms"], op["latency_ms_total"] / op["count"]
+            )
+            op_stats["ru"] = self._histogram(op["ru"], op["ru_total"] / op["count"])
+            stats["operations"][name] = op_stats
+        return stats
+
+    def get_recent(self) -> list:
+        """Return the most recent request dicts, oldest first."""
+        return list(self.recent)
+
+    def reset(self) -> None:
+        self.operations = dict()
+        self.recent.clear()
+        self.started_at = time.time()
+
+    def _histogram(self, samples, mean: float) -> dict:
+        values = sorted(samples)
+        histogram = dict()
+        histogram["mean"] = mean
+        histogram["p50"] = percentile(values, 50)
+        histogram["p95"] = percentile(values, 95)
+        histogram["p99"] = percentile(values, 99)
+        histogram["max"] = float(values[-1]) if len(values) > 0 else 0.0
+        return histogram
+
+
+class ResponseHook:
+    """
+    A response_hook callable for one SDK operation.  Each invocation passes
+    the RU charge, latency, and activity id of the response to the given
+    recorder function, with the latency measured since the hook was created
+    or since its previous invocation, so that each page of a query is timed
+    separately.  The ru attribute is the total charge of the operation, and
+    the headers of the latest response are copied into the optional headers.
+    The SDK's query_items() invokes the hook once immediately, with the
+    stale headers of the client's previous response and the pager as the
+    result; that invocation is not a response, so it is ignored.
+    """
+
+    def __init__(self, recorder, operation: str, headers: dict = None):
+        self.recorder = recorder
+        self.operation = operation
+        self.headers = headers
+        self.ru = 0.0
+        self.start = time.perf_counter()
+
+    def __call__(self, response_headers, result=None) -> None:
+        if hasattr(result, "by_page"):
+            return  # the early call of query_items(), with an AsyncItemPaged
+        self._record(response_headers, None)
+
+    def failed(self, e) -> None:
+        """Record the given CosmosHttpResponseError."""
+        self._record(getattr(e, "headers", None), getattr(e, "status_code", None))
+
+    def _record(self, response_headers, status_code) -> None:
+        now = time.perf_counter()
+        if response_headers is None:
+            response_headers = dict()
+        if self.headers is not None:
+            self.headers.update(response_headers)
+        try:
+            ru = float(response_headers[REQUEST_CHARGE_HEADER])
+        except:
+            ru = 0.0
+        self.ru = self.ru + ru
+        self.recorder(
+            self.operation,
+            ru,
+            (now - self.start) * 1000.0,
+            response_headers.get(ACTIVITY_ID_HEADER),
+            status_code,
+            response_headers,
+        )
+        self.start = now
@@ -1,13 +1,23 @@
+import asyncio
+import contextvars
+import copy
 import logging
+import time
 import traceback
 
+from collections import deque
+
 from azure.cosmos.aio import CosmosClient
+from azure.cosmos import exceptions
 from azure.cosmos import ThroughputProperties
 from azure.cosmos.partition_key import PartitionKey
 
 #from azure.identity import ClientSecretCredential
 from azure.identity import DefaultAzureCredential
 
+from src.db.cosmos_metrics import CosmosRequestMetrics
+from src.db.cosmos_metrics import ResponseHook
+from src.db.query_cache import query_cache_key
 from src.os.env import Env
 
 # This class is used to access the Azure Cosmos DB NoSQL API
@@ -27,6 +37,136 @@ azure_logger = logging.getLogger("azure")
 azure_logger.setLevel(logging.WARNING)
 
 LAST_REQUEST_CHARGE_HEADER = "x-ms-request-charge"
+RETRY_AFTER_MS_HEADER = "x-ms-retry-after-ms"
+THROTTLE_RETRY_COUNT_HEADER = "x-ms-throttle-retry-count"
+THROTTLE_RETRY_WAIT_TIME_MS_HEADER = "x-ms-throttle-retry-wait-time-ms"
+THROTTLED_STATUS_CODE = 429
+MAX_BATCH_OPERATIONS = 100
+NOT_MODIFIED_STATUS_CODE = 304
+NOT_FOUND_STATUS_CODE = 404
+
+# the most recent request of the current asyncio task, or thread; see
+# CosmosNoSqlUtil#last_request_info()
+_last_request = contextvars.ContextVar("cosmos_last_request", default=None)
+
+
+class CosmosRateController:
+    """
+    An AIMD (additive-increase, multiplicative-decrease) rate controller
+    for concurrent Cosmos DB writes.  It tracks the RU charges of the
+    responses over a sliding one-second window against a target RU/sec,
+    which is typically a fraction of the provisioned container throughput.
+    The allowed concurrency grows by one after each full window of
+    successful requests, is halved on a 429, and all callers of acquire()
+    wait for the retry-after interval of the most recent 429.  The SDK
+    retries 429s internally by default, so a successful response with the
+    x-ms-throttle-retry-count or x-ms-throttle-retry-wait-time-ms headers
+    is also treated as throttled; the SDK has already waited, so there is
+    no additional pause in that case.
+    """
+
+    def __init__(
+        self,
+        ru_per_sec: float,
+        headroom: float = 0.9,
+        min_concurrency: int = 1,
+        max_concurrency: int = 64,
+        initial_concurrency: int = 4,
+    ):
+        self.provisioned_ru_per_sec = float(ru_per_sec)
+        self.target_ru_per_sec = float(ru_per_sec) * float(headroom)
+        self.min_concurrency = max(1, int(min_concurrency))
+        self.max_concurrency = max(self.min_concurrency, int(max_concurrency))
+        self.concurrency = min(
+            max(int(initial_concurrency), self.min_concurrency), self.max_concurrency
+        )
+        self.window = deque()  # (epoch, ru) tuples within the last second
+        self.window_ru = 0.0
+        self.pause_until = 0.0
+        self.successes = 0
+        self.throttled_count = 0
+        self.sdk_throttle_retries = 0
+        self.sdk_throttle_wait_ms = 0.0
+        self.paused_secs = 0.0
+
+    def current_ru_per_sec(self) -> float:
+        """Return the RU consumed within the last second."""
+        self._expire_window(time.time())
+        return self.window_ru
+
+    async def acquire(self) -> None:
+        """
+        Wait, without blocking the event loop, until a request may be sent;
+        that is until any retry-after interval has elapsed and the RU
+        consumed within the last second is under the target.
+        """
+        while True:
+            now = time.time()
+            if now < self.pause_until:
+                delay = self.pause_until - now
+            else:
+                self._expire_window(now)
+                if self.target_ru_per_sec <= 0 or self.window_ru < self.target_ru_per_sec:
+                    return
+                delay = max(0.001, self.window[0][0] + 1.0 - now)
+            self.paused_secs = self.paused_secs + delay
+            await asyncio.sleep(delay)
+
+    def record(self, headers: dict, throttled: bool = False) -> None:
+        """Record the response headers of a completed, or throttled, request."""
+        now = time.time()
+        ru = 0.0
+        try:
+            ru = float(headers[LAST_REQUEST_CHARGE_HEADER])
+        except:
+            pass
+        self.window.append((now, ru))
+        self.window_ru = self.window_ru + ru
+        sdk_retries, sdk_wait_ms = 0, 0.0
+        try:
+            sdk_retries = int(headers.get(THROTTLE_RETRY_COUNT_HEADER, 0))
+            sdk_wait_ms = float(headers.get(THROTTLE_RETRY_WAIT_TIME_MS_HEADER, 0))
+        except:
+            pass
+        self.sdk_throttle_retries = self.sdk_throttle_retries + sdk_retries
+        self.sdk_throttle_wait_ms = self.sdk_throttle_wait_ms + sdk_wait_ms
+        if throttled or sdk_retries > 0 or sdk_wait_ms > 0:
+            self.throttled_count = self.throttled_count + 1
+            self.successes = 0
+            self.concurrency = max(self.min_concurrency, self.concurrency // 2)
+        if throttled:
+            retry_after_ms = 100.0
+            try:
+                retry_after_ms = float(headers[RETRY_AFTER_MS_HEADER])
+            except:
+                pass
+            self.pause_until = max(self.pause_until, now + (retry_after_ms / 1000.0))
+        elif sdk_retries == 0 and sdk_wait_ms <= 0:
+            self.successes = self.successes + 1
+            if self.successes >= self.concurrency:
+                self.successes = 0
+                self._expire_window(now)
+                if self.window_ru < self.target_ru_per_sec:
+                    self.concurrency = min(self.max_concurrency, self.concurrency + 1)
+
+    def get_stats(self) -> dict:
+        stats = dict()
+        stats["provisioned_ru_per_sec"] = self.provisioned_ru_per_sec
+        stats["target_ru_per_sec"] = self.target_ru_per_sec
+        stats["current_ru_per_sec"] = self.current_ru_per_sec()
+        stats["concurrency"] = self.concurrency
+        stats["throttled_count"] = self.throttled_count
+        stats["sdk_throttle_retries"] = self.sdk_throttle_retries
+        stats["sdk_throttle_wait_ms"] = self.sdk_throttle_wait_ms
+        stats["paused_secs"] = self.paused_secs
+        return stats
+
+    def _expire_window(self, now: float) -> None:
+        while len(self.window) > 0 and self.window[0][0] <= now - 1.0:
+            _, ru = self.window.popleft()
+            self.window_ru = self.window_ru - ru
+        if len(self.window) == 0:
+            self.window_ru = 0.0
 
 
 class CosmosNoSqlUtil:
@@ -37,6 +177,14 @@ class CosmosNoSqlUtil:
         self._ctrproxy = None
         self._cname = None
         self._client = None
+        self._query_cache = None
+        self._point_read_cache = None
+        # registry of the database and container proxies of the shared client,
+        # keyed by dbname and by (dbname, cname); see for_container()
+        self._dbproxies = dict()
+        self._ctrproxies = dict()
+        self._is_handle = False
+        self._metrics = CosmosRequestMetrics()
         logging.info("CosmosNoSqlUtil - constructor")
 
     async def initialize(self):
@@ -63,6 +211,8 @@ class CosmosNoSqlUtil:
             )
 
     async def close(self):
+        if self._is_handle:
+            return  # the shared client is closed by the instance that created it
         if self._client is not None:
             await self._client.close()
             logging.info("CosmosNoSqlUtil - client closed")
@@ -95,6 +245,9 @@ class CosmosNoSqlUtil:
         result = True
         try:
             await self._client.delete_database(dbname)
+            self._dbproxies.pop(dbname, None)
+            for key in [k for k in self._ctrproxies.keys() if k[0] == dbname]:
+                self._ctrproxies.pop(key)
         except Exception as e:
             logging.critical(str(e))
             print(traceback.format_exc())
@@ -105,6 +258,7 @@ class CosmosNoSqlUtil:
         result = True
         try:
             await self._dbproxy.delete_container(cname)
+            self._ctrproxies.pop((self._dbname, cname), None)
         except Exception as e:
             logging.critical(str(e))
             print(traceback.format_exc())
@@ -148,7 +302,7 @@ class CosmosNoSqlUtil:
     def set_db(self, dbname):
         """Set the current database to the given dbname."""
         self._dbname = dbname
-        self._dbproxy = self._client.get_database_client(dbname)
+        self._dbproxy = self.get_database_proxy(dbname)
         return self._dbproxy  # <class 'azure.cosmos.aio._database.DatabaseProxy'>
 
     def get_current_dbname(self):
@@ -160,9 +314,47 @@ class CosmosNoSqlUtil:
     def set_container(self, cname):
         """Set the current container in the current database to the given cname."""
         self._cname = cname
-        self._ctrproxy = self._dbproxy.get_container_client(cname)
+        self._ctrproxy = self.get_container_proxy(self._dbname, cname)
         return self._ctrproxy  # <class 'azure.cosmos.aio._container.ContainerProxy'>
 
+    def get_database_proxy(self, dbname):
+        """Return the cached DatabaseProxy for the given dbname."""
+        if dbname not in self._dbproxies.keys():
+            self._dbproxies[dbname] = self._client.get_database_client(dbname)
+        return self._dbproxies[dbname]
+
+    def get_container_proxy(self, dbname, cname):
+        """Return the cached ContainerProxy for the given dbname and cname."""
+        key = (dbname, cname)
+        if key not in self._ctrproxies.keys():
+            dbproxy = self.get_database_proxy(dbname)
+            self._ctrproxies[key] = dbproxy.get_container_client(cname)
+        return self._ctrproxies[key]
+
+    def for_container(self, dbname=None, cname=None):
+        """
+        Return a lightweight CosmosNoSqlUtil handle for the given database and
+        container, defaulting to the current ones.  The handle shares this
+        instance's CosmosClient connection pool, proxy registry, and caches,
+        so it is cheap to create per request, and concurrent requests can
+        safely target different containers.  Closing a handle is a no-op.
+        """
+        handle = copy.copy(self)
+        handle._is_handle = True
+        handle._dbname = dbname if dbname is not None else self._dbname
+        handle._cname = cname if cname is not None else self._cname
+        handle._dbproxy = self.get_database_proxy(handle._dbname)
+        handle._ctrproxy = self.get_container_proxy(handle._dbname, handle._cname)
+        return handle
+
+    def get_registry_stats(self) -> dict:
+        stats = dict()
+        stats["databases"] = sorted(self._dbproxies.keys())
+        stats["containers"] = sorted(
+            ["{}/{}".format(db, c) for db, c in self._ctrproxies.keys()]
+        )
+        return stats
+
     def get_database_link(self):
         return self._dbproxy.database_link
 
@@ -196,21 +388,357 @@ class CosmosNoSqlUtil:
         return container_list
 
     async def point_read(self, id, pk):
-        return await self._ctrproxy.read_item(item=id, partition_key=pk)
+        if self._point_read_cache is not None:
+            return await self._cached_point_read(id, pk)
+        return await self._tracked(
+            "point_read", self._ctrproxy.read_item, item=id, partition_key=pk
+        )
+
+    async def _cached_point_read(self, id, pk):
+        """
+        Return the given document from the point-read cache if its entry is
+        fresh, else read it with an If-None-Match header for the cached _etag
+        so that an unchanged document costs only a 304 response.  A document
+        that has since been deleted is removed from the cache.
+        """
+        cache, container = self._point_read_cache, self._container_cache_key()
+        entry = cache.get(container, id, pk)
+        if entry is not None and entry["fresh"]:
+            return entry["doc"]
+        kwargs, headers, doc = dict(), dict(), None
+        token = cache.read_token()
+        if entry is not None:
+            kwargs["initial_headers"] = {"If-None-Match": entry["etag"]}
+        hook = self._response_hook("point_read", headers)
+        try:
+            doc = await self._ctrproxy.read_item(
+                item=id, partition_key=pk, response_hook=hook, **kwargs
+            )
+        except exceptions.CosmosHttpResponseError as e:
+            hook.failed(e)
+            if e.status_code == NOT_FOUND_STATUS_CODE:
+                cache.invalidate(container, id)
+            if entry is None or e.status_code != NOT_MODIFIED_STATUS_CODE:
+                raise
+        ru = self.request_charge_from_headers(headers)
+        if entry is not None and (doc is None or "id" not in doc):
+            cache.revalidated(container, id, ru)
+            return entry["doc"]
+        cache.put(container, id, pk, dict(doc), ru, token)
+        return doc
 
     async def create_item(self, doc):
-        return await self._ctrproxy.create_item(body=doc)
+        result = await self._tracked(
+            "create_item", self._ctrproxy.create_item, body=doc
+        )
+        await self.invalidate_caches(doc.get("id"))
+        return result
 
     async def upsert_item(self, doc):
-        return await self._ctrproxy.upsert_item(body=doc)
+        result = await self._tracked(
+            "upsert_item", self._ctrproxy.upsert_item, body=doc
+        )
+        await self.invalidate_caches(doc.get("id"))
+        return result
 
     async def delete_item(self, id, pk):
-        return await self._ctrproxy.delete_item(item=id, partition_key=pk)
+        result = await self._tracked(
+            "delete_item", self._ctrproxy.delete_item, item=id, partition_key=pk
+        )
+        await self.invalidate_caches(id)
+        return result
+
+    async def bulk_upsert(
+        self,
+        docs,
+        concurrency: int = 16,
+        stats: dict = None,
+        rate_controller: CosmosRateController = None,
+    ):
+        """
+        Upsert the given iterable (or async iterable) of documents into the
+        current container, keeping at most 'concurrency' upserts in flight.
+        This is an async generator that yields one result dict per document,
+        in completion order, like:
+          {"index": 0, "id": "...", "ok": True, "ru": 10.29, "error": None}
+        The optional stats dict is updated with the aggregate count, succeeded,
+        failed, ru, elapsed, and docs_per_sec values as the results stream back.
+        If a CosmosRateController is given it further limits the number of
+        upserts in flight and paces them, and throttled upserts are retried.
+        The query cache is invalidated once, after the upserts.
+        """
+        if stats is None:
+            stats = dict()
+        stats["count"], stats["succeeded"], stats["failed"] = 0, 0, 0
+        stats["ru"], stats["elapsed"], stats["docs_per_sec"] = 0.0, 0.0, 0.0
+        start_time = time.time()
+
+        async def upserts():
+            index = 0
+            async for doc in self._as_async_iter(docs):
+                yield self._bulk_upsert_one(index, doc, rate_controller)
+                index = index + 1
+
+        try:
+            async for result in self._dispatch_windowed(
+                upserts(), concurrency, rate_controller
+            ):
+                stats["count"] = stats["count"] + 1
+                if result["ok"]:
+                    stats["succeeded"] = stats["succeeded"] + 1
+                else:
+                    stats["failed"] = stats["failed"] + 1
+                stats["ru"] = stats["ru"] + result["ru"]
+                stats["elapsed"] = time.time() - start_time
+                if stats["elapsed"] > 0:
+                    stats["docs_per_sec"] = stats["count"] / stats["elapsed"]
+                yield result
+        finally:
+            await self.invalidate_caches()
+
+    async def batch_write(
+        self,
+        docs,
+        pk_path: str,
+        concurrency: int = 8,
+        stats: dict = None,
+        rate_controller: CosmosRateController = None,
+        batch_size: int = MAX_BATCH_OPERATIONS,
+    ):
+        """
+        Upsert the given iterable (or async iterable) of documents into the
+        current container with transactional batches.  The documents are
+        grouped by the value at the given partition key path, such as "/pk",
+        and each group is dispatched as a batch once it reaches batch_size
+        documents; the remaining partial groups are dispatched at the end.
+        At most 'concurrency' batches are in flight.  Note that two batches
+        for the same partition key value may execute concurrently.
+        This is an async generator that yields one result dict per batch,
+        in completion order, like:
+          {"pk": "...", "count": 100, "ids": [...], "ok": True, "ru": 1029.0, "error": None}
+        The optional stats dict is updated with the aggregate batches, count,
+        succeeded, failed, ru, elapsed, and docs_per_sec values.
+        The query cache is invalidated once, after the batches.
+        """
+        if stats is None:
+            stats = dict()
+        stats["batches"], stats["count"], stats["succeeded"], stats["failed"] = 0, 0, 0, 0
+        stats["ru"], stats["elapsed"], stats["docs_per_sec"] = 0.0, 0.0, 0.0
+        batch_size = min(max(1, int(batch_size)), MAX_BATCH_OPERATIONS)
+        start_time = time.time()
+
+        async def batches():
+            groups = dict()
+            async for doc in self._as_async_iter(docs):
+                pk = self.partition_key_value(doc, pk_path)
+                if pk not in groups.keys():
+                    groups[pk] = list()
+                groups[pk].append(doc)
+                if len(groups[pk]) >= batch_size:
+                    yield self._batch_upsert_group(pk, groups.pop(pk), rate_controller)
+            for pk in list(groups.keys()):
+                yield self._batch_upsert_group(pk, groups.pop(pk), rate_controller)
+
+        try:
+            async for result in self._dispatch_windowed(
+                batches(), concurrency, rate_controller
+            ):
+                stats["batches"] = stats["batches"] + 1
+                stats["count"] = stats["count"] + result["count"]
+                if result["ok"]:
+                    stats["succeeded"] = stats["succeeded"] + result["count"]
+                else:
+                    stats["failed"] = stats["failed"] + result["count"]
+                stats["ru"] = stats["ru"] + result["ru"]
+                stats["elapsed"] = time.time() - start_time
+                if stats["elapsed"] > 0:
+                    stats["docs_per_sec"] = stats["count"] / stats["elapsed"]
+                yield result
+        finally:
+            await self.invalidate_caches()
+
+    def partition_key_value(self, doc: dict, pk_path: str):
+        """
+        Return the value in the given document at the given partition key
+        path, such as "/pk" or "/address/state", or None if it is absent.
+        """
+        value = doc
+        for attr in pk_path.strip("/").split("/"):
+            if not isinstance(value, dict) or attr not in value.keys():
+                return None
+            value = value[attr]
+        return value
+
+    async def _as_async_iter(self, iterable):
+        if hasattr(iterable, "__aiter__"):
+            async for item in iterable:
+                yield item
+        else:
+            for item in iterable:
+                yield item
+
+    async def _dispatch_windowed(self, coroutines, concurrency: int, rate_controller):
+        """
+        Schedule the coroutines from the given async generator with at most
+        'concurrency' of them in flight, and yield their results in
+        completion order.
+        """
+        concurrency = max(1, int(concurrency))
+        exhausted, pending = False, set()
+        try:
+            while True:
+                while not exhausted and len(pending) < self._bulk_window_size(
+                    concurrency, rate_controller
+                ):
+                    try:
+                        coro = await anext(coroutines)
+                    except StopAsyncIteration:
+                        exhausted = True
+                        break
+                    if rate_controller is not None:
+                        await rate_controller.acquire()
+                    pending.add(asyncio.ensure_future(coro))
+                if len(pending) == 0:
+                    break
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    yield task.result()
+        finally:
+            # the caller may stop iterating early; don't leave orphaned requests
+            for task in pending:
+                task.cancel()
+
+    def _bulk_window_size(self, concurrency: int, rate_controller) -> int:
+        if rate_controller is None:
+            return concurrency
+        return min(concurrency, rate_controller.concurrency)
+
+    async def _bulk_upsert_one(
+        self, index: int, doc: dict, rate_controller=None, max_throttled_retries=8
+    ) -> dict:
+        result = dict()
+        result["index"] = index
+        result["id"] = doc.get("id") if isinstance(doc, dict) else None
+        result["ok"] = False
+        result["ru"] = 0.0
+        result["error"] = None
+        attempts = 0
+        while True:
+            attempts = attempts + 1
+            # capture the headers of this specific response rather than relying
+            # on the shared last_response_headers of the client connection
+            headers, throttled = dict(), False
+            hook = self._response_hook("bulk_upsert", headers)
+            try:
+                await self._ctrproxy.upsert_item(body=doc, response_hook=hook)
+                result["ok"] = True
+                result["error"] = None
+                await self.invalidate_caches(result["id"], query_cache=False)
+            except exceptions.CosmosHttpResponseError as e:
+                hook.failed(e)
+                throttled = e.status_code == THROTTLED_STATUS_CODE
+                result["status_code"] = e.status_code
+                result["error"] = str(e)
+            except Exception as e:
+                result["error"] = str(e)
+            result["ru"] = result["ru"] + self.request_charge_from_headers(headers)
+            if rate_controller is None:
+                return result
+            rate_controller.record(headers, throttled)
+            if not throttled or attempts > max_throttled_retries:
+                return result
+            await rate_controller.acquire()
+
+    async def _batch_upsert_group(
+        self, pk, docs: list, rate_controller=None, max_throttled_retries=8
+    ) -> dict:
+        result = dict()
+        result["pk"] = pk
+        result["count"] = len(docs)
+        result["ids"] = [doc.get("id") for doc in docs]
+        result["ok"] = False
+        result["ru"] = 0.0
+        result["error"] = None
+        operations = [("upsert", (doc,)) for doc in docs]
+        attempts = 0
+        while True:
+            attempts = attempts + 1
+            headers, throttled = dict(), False
+            hook = self._response_hook("batch_write", headers)
+            try:
+                await self._ctrproxy.execute_item_batch(
+                    batch_operations=operations, partition_key=pk, response_hook=hook
+                )
+                result["ok"] = True
+                result["error"] = None
+                await self.invalidate_caches(*result["ids"], query_cache=False)
+            except exceptions.CosmosBatchOperationError as e:
+                hook.failed(e)
+                throttled = e.status_code == THROTTLED_STATUS_CODE
+                result["status_code"] = e.status_code
+                result["error_index"] = e.error_index
+                result["error"] = str(e)
+            except exceptions.CosmosHttpResponseError as e:
+                hook.failed(e)
+                throttled = e.status_code == THROTTLED_STATUS_CODE
+                result["status_code"] = e.status_code
+                result["error"] = str(e)
+            except Exception as e:
+                result["error"] = str(e)
+            result["ru"] = result["ru"] + self.request_charge_from_headers(headers)
+            if rate_controller is None:
+                return result
+            rate_controller.record(headers, throttled)
+            if not throttled or attempts > max_throttled_retries:
+                return result
+            await rate_controller.acquire()
+
+    async def get_provisioned_throughput(self) -> int | None:
+        """
+        Return the provisioned RU/sec of the current container, or of the
+        current database if the throughput is shared at the database level.
+        For autoscale throughput the autoscale maximum is returned.
+        """
+        for proxy in [self._ctrproxy, self._dbproxy]:
+            try:
+                tp = await proxy.get_throughput()
+                if tp.auto_scale_max_throughput is not None:
+                    return int(tp.auto_scale_max_throughput)
+                if tp.offer_throughput is not None:
+                    return int(tp.offer_throughput)
+            except Exception as e:
+                logging.info("get_provisioned_throughput: {}".format(str(e)))
+        return None
+
+    async def create_rate_controller(
+        self, headroom: float = 0.9, max_concurrency: int = 64
+    ) -> CosmosRateController:
+        """
+        Return a CosmosRateController targeting the given fraction of the
+        provisioned throughput of the current container.  If the throughput
+        can't be read, such as on serverless accounts, the controller only
+        reacts to 429 responses.
+        """
+        ru_per_sec = await self.get_provisioned_throughput()
+        if ru_per_sec is None:
+            ru_per_sec = 0
+        logging.info(
+            "CosmosNoSqlUtil#create_rate_controller, ru_per_sec: {}".format(ru_per_sec)
+        )
+        return CosmosRateController(
+            ru_per_sec, headroom=headroom, max_concurrency=max_concurrency
+        )
 
     async def count_documents(self):
         docs = list()
         sql = "SELECT VALUE COUNT(1) FROM c"
-        items_paged = self._ctrproxy.query_items(query=sql, parameters=[])
+        items_paged = self._ctrproxy.query_items(
+            query=sql,
+            parameters=[],
+            response_hook=self._response_hook("count_documents"),
+        )
         async for item in items_paged:
             docs.append(item)
         return docs
@@ -220,23 +748,23 @@ class CosmosNoSqlUtil:
         #   [("create", (get_sales_order("create_item"),)), next op, next op, ...]
         # each operation is a 2-tuple, with the operation name as tup[0]
         # tup[1] is a nested 2-tuple , with the document as tup[0]
-        return await self._ctrproxy.execute_item_batch(
-            batch_operations=item_operations, partition_key=pk
+        result = await self._tracked(
+            "execute_item_batch",
+            self._ctrproxy.execute_item_batch,
+            batch_operations=item_operations,
+            partition_key=pk,
         )
+        await self.invalidate_caches(*[op[1][0].get("id") for op in item_operations])
+        return result
 
-    async def query_items(self, sql, cross_partition=False, pk=None, max_items=100):
-        parameters_list, results_list = list(), list()
+    async def query_items(self, sql, cross_partition=False, pk=None, max_items=None):
+        parameters_list = list()
         parameters_list.append(
             {"name": "@enable_cross_partition_query", "value": cross_partition}
         )
         if pk is not None:
             parameters_list.append({"name": "@partition_key", "value": pk})
-        query_results = self._ctrproxy.query_items(
-            query=sql, parameters=parameters_list
-        )
-        async for item in query_results:
-            results_list.append(item)
-        return results_list
+        return await self._cached_query(sql, parameters_list, max_items)
 
     async def parameterized_query(
         self,
@@ -244,9 +772,9 @@ class CosmosNoSqlUtil:
         sql_parameters,
         cross_partition=False,
         pk=None,
-        max_items=100,
+        max_items=None,
     ):
-        parameters_list, results_list = list(), list()
+        parameters_list = list()
         parameters_list.append(
             {"name": "@enable_cross_partition_query", "value": cross_partition}
         )
@@ -256,34 +784,323 @@ class CosmosNoSqlUtil:
         if sql_parameters is not None:
             for sql_param in sql_parameters:
                 parameters_list.append(sql_param)
+        return await self._cached_query(sql_template, parameters_list, max_items)
+
+    async def _cached_query(self, sql, parameters_list: list, max_items) -> list:
+        """
+        Execute the given query and return its results as a list, or at most
+        max_items of them if max_items isn't None, via the query cache if one
+        has been set with set_query_cache().
+        """
+        key, generation = None, None
+        if self._query_cache is not None:
+            key = query_cache_key("query", sql, parameters_list, max_items)
+            cached = await self._query_cache.get(self._container_cache_key(), key)
+            if cached is not None:
+                return cached
+            # read before the query, so a result that overlaps a write isn't cached
+            generation = await self._query_cache.generation(self._container_cache_key())
+        results_list, hook = list(), self._response_hook("query")
         query_results = self._ctrproxy.query_items(
-            query=sql_template, parameters=parameters_list
+            query=sql,
+            parameters=parameters_list,
+            max_item_count=max_items,
+            response_hook=hook,
         )
         async for item in query_results:
             results_list.append(item)
+            if max_items is not None and len(results_list) >= max_items:
+                break
+        if key is not None:
+            await self._query_cache.set(
+                self._container_cache_key(), key, results_list, hook.ru, generation
+            )
         return results_list
 
-    def last_response_headers(self) -> dict:
+    async def query_pages(
+        self,
+        sql,
+        parameters: list = None,
+        pk=None,
+        page_size=100,
+        continuation=None,
+        use_cache: bool = True,
+    ):
         """
-        The Cosmos DB response headers are an instance of class CIMultiDict,
-        which is not JSON serializable.  Convert these CIMultiDict headers
-        into a simple dict and return that dict.
+        Execute the given SQL query, with the optional list of
+        {"name": "@x", "value": x} parameters, and yield one dict per page
+        of results as each page arrives, like:
+          {"items": [...], "continuation": "...", "ru": 2.83}
+        The query is scoped to the given partition key value, if given,
+        otherwise it is a cross-partition query.  Each page has at most
+        page_size items.  The continuation value is None after the last page,
+        otherwise it can be passed to a subsequent call to resume the query.
+        The pages are read from, and written to, the query cache unless
+        use_cache is False, as for streaming a large result set.
         """
+        cache, container = self._query_cache, self._container_cache_key()
+        if not use_cache:
+            cache = None
+        if cache is not None:
+            # yield the cached pages, if any, then query from the first miss
+            while True:
+                key = query_cache_key("page", sql, parameters, pk, page_size, continuation)
+                page = await cache.get(container, key)
+                if page is None:
+                    break
+                page["ru"] = 0.0
+                yield page
+                continuation = page["continuation"]
+                if continuation is None:
+                    return
+        generation = None
+        if cache is not None:
+            # read before the query, so pages that overlap a write aren't cached
+            generation = await cache.generation(container)
+        kwargs = dict()
+        if pk is not None:
+            kwargs["partition_key"] = pk
+        hook = self._response_hook("query_page")
+        pager = self._ctrproxy.query_items(
+            query=sql,
+            parameters=parameters if parameters is not None else list(),
+            max_item_count=page_size,
+            response_hook=hook,
+            **kwargs,
+        )
+        pages = pager.by_page(continuation)
+        ru_before = hook.ru
+        async for page in pages:
+            # the response_hook has been invoked for each backend response of
+            # this page at this point, possibly several for a cross-partition
+            # query, so the page charge is the growth of the hook total
+            result = dict()
+            result["items"] = [item async for item in page]
+            result["continuation"] = pages.continuation_token
+            result["ru"] = hook.ru - ru_before
+            ru_before = hook.ru
+            if cache is not None:
+                key = query_cache_key("page", sql, parameters, pk, page_size, continuation)
+                await cache.set(container, key, result, result["ru"], generation)
+                continuation = result["continuation"]
+            yield result
+
+    async def query_items_stream(
+        self, sql, parameters: list = None, pk=None, page_size=100
+    ):
+        """
+        Execute the given SQL query and yield the result items one at a time,
+        so that at most one page of page_size items is held in memory; the
+        query cache isn't used.  See query_pages() for the parameters.
+        """
+        async for page in self.query_pages(
+            sql, parameters, pk, page_size, use_cache=False
+        ):
+            for item in page["items"]:
+                yield item
+
+    async def vector_search(
+        self,
+        embedding,
+        top_k: int = 10,
+        projection: list = None,
+        filters: dict = None,
+        pk=None,
+        embedding_attr: str = "embedding",
+        score_attr: str = "SimilarityScore",
+    ):
+        """
+        Execute a DiskANN vector search for the top_k documents most similar
+        to the given embedding, and yield each result document, with its
+        similarity score as the score_attr attribute, as it arrives.
+        The embedding is passed once as the @embedding query parameter rather
+        than being formatted into the SQL text.  See vector_search_query()
+        for the projection and filters.  The query is scoped to the given
+        partition key value, if given, otherwise it is a cross-partition query.
+        """
+        sql, parameters = self.vector_search_query(
+            top_k, projection, filters, embedding_attr, score_attr
+        )
+        if hasattr(embedding, "tolist"):
+            embedding = embedding.tolist()  # a NumPy array
+        parameters.append({"name": "@embedding", "value": embedding})
+        whole_document = projection is None or len(projection) == 0
+        async for item in self.query_items_stream(sql, parameters, pk, top_k):
+            if whole_document:
+                document = item["document"]
+                document[score_attr] = item[score_attr]
+                item = document
+            yield item
+
+    def vector_search_query(
+        self,
+        top_k: int = 10,
+        projection: list = None,
+        filters: dict = None,
+        embedding_attr: str = "embedding",
+        score_attr: str = "SimilarityScore",
+    ):
+        """
+        Return the (sql, parameters) of a vector search for the @embedding
+        parameter.  The projection is a list of the document attributes to
+        return, like ["id", "name"], and defaults to the whole document.
+        The filters are a dict of attribute names to values; a list value
+        matches any of its values.  All of the values are query parameters.
+        """
+        distance = "VectorDistance(c.{}, @embedding)".format(
+            self._attribute_path(embedding_attr)
+        )
+        if projection is None or len(projection) == 0:
+            selects = ["c AS document"]
+        else:
+            selects = ["c.{}".format(self._attribute_path(a)) for a in projection]
+        if not score_attr.isidentifier():
+            raise ValueError("invalid score attribute name: {}".format(score_attr))
+        selects.append("{} AS {}".format(distance, score_attr))
+        parameters = [{"name": "@top_k", "value": int(top_k)}]
+        conditions = list()
+        for idx, (attr, value) in enumerate((filters or dict()).items()):
+            name = "@filter{}".format(idx)
+            path = "c.{}".format(self._attribute_path(attr))
+            if isinstance(value, (list, tuple, set)):
+                conditions.append("ARRAY_CONTAINS({}, {})".format(name, path))
+                value = list(value)
+            else:
+                conditions.append("{} = {}".format(path, name))
+            parameters.append({"name": name, "value": value})
+        sql = "SELECT TOP @top_k {} FROM c".format(", ".join(selects))
+        if len(conditions) > 0:
+            sql = sql + " WHERE " + " AND ".join(conditions)
+        sql = sql + " ORDER BY " + distance
+        return sql, parameters
+
+    def _attribute_path(self, attr: str) -> str:
+        """Return the given attribute name, or dotted path, if it is valid SQL."""
+        for name in str(attr).split("."):
+            if not name.isidentifier():
+                raise ValueError("invalid attribute name: {}".format(attr))
+        return attr
+
+    def set_query_cache(self, query_cache) -> None:
+        """
+        Set the optional query-result cache, a MemoryQueryCache or RedisQueryCache,
+        used by query_items, parameterized_query, and query_pages.  The cached
+        results for a container are invalidated by writes to that container
+        through this instance.  Pass None to disable caching.
+        """
+        self._query_cache = query_cache
+
+    def get_query_cache_stats(self) -> dict:
+        if self._query_cache is None:
+            return dict()
+        return self._query_cache.get_stats()
+
+    def set_point_read_cache(self, point_read_cache) -> None:
+        """
+        Set the optional PointReadCache used by point_read.  Its entries are
+        invalidated by writes to the same document through this instance.
+        Pass None to disable caching.
+        """
+        self._point_read_cache = point_read_cache
+
+    def get_point_read_cache_stats(self) -> dict:
+        if self._point_read_cache is None:
+            return dict()
+        return self._point_read_cache.get_stats()
+
+    async def invalidate_caches(self, *ids, query_cache: bool = True) -> None:
+        """
+        Invalidate the query cache entries for the current container, unless
+        query_cache is False, and the point-read cache entries of the given
+        document ids, after a write.
+        """
+        container = self._container_cache_key()
+        if query_cache and self._query_cache is not None:
+            await self._query_cache.invalidate(container)
+        if self._point_read_cache is not None:
+            for id in ids:
+                self._point_read_cache.invalidate(container, id)
+
+    def _container_cache_key(self) -> str:
+        return "{}/{}".format(self._dbname, self._cname)
+
+    def _response_hook(self, operation: str, headers: dict = None) -> ResponseHook:
+        """
+        Return a ResponseHook to pass as the response_hook of an SDK method,
+        which records each response of the given operation name.
+        """
+        return ResponseHook(self._record_request, operation, headers)
+
+    async def _tracked(self, operation: str, method, **kwargs):
+        """Await the given SDK method with a ResponseHook for the operation."""
+        hook = self._response_hook(operation)
         try:
-            multidict_headers = self._ctrproxy.client_connection.last_response_headers
-            simple_headers = dict()
-            for key, value in multidict_headers.items():
-                simple_headers[key] = value
-            return simple_headers
-        except:
+            return await method(response_hook=hook, **kwargs)
+        except exceptions.CosmosHttpResponseError as e:
+            hook.failed(e)
+            raise
+
+    def _record_request(
+        self, operation, ru, latency_ms, activity_id, status_code, headers
+    ) -> None:
+        request = dict(
+            self._metrics.record(operation, ru, latency_ms, activity_id, status_code)
+        )
+        request["headers"] = headers
+        _last_request.set(request)
+
+    def last_request_info(self) -> dict | None:
+        """
+        Return the most recent request made by the current asyncio task, or
+        thread, as a dict with operation, ru, latency_ms, activity_id,
+        status_code, time, and headers keys.  Unlike the last_response_headers
+        of the client connection, this isn't affected by concurrent requests
+        in other tasks.  None is returned if no request has been made.
+        """
+        return _last_request.get()
+
+    def get_request_metrics(self) -> dict:
+        """
+        Return the per-operation request counts, RU totals, and the
+        p50/p95/p99 latency and RU histograms as a JSON-serializable dict.
+        The metrics are shared by the handles returned by for_container().
+        """
+        return self._metrics.get_stats()
+
+    def get_recent_requests(self) -> list:
+        """Return the most recent requests, with their activity ids, oldest first."""
+        return self._metrics.get_recent()
+
+    def reset_request_metrics(self) -> None:
+        self._metrics.reset()
+
+    def last_response_headers(self) -> dict:
+        """
+        Return the response headers of the most recent request made by the
+        current asyncio task as a simple dict, which is JSON serializable
+        unlike the CIMultiDict headers returned by the SDK.
+        """
+        request = self.last_request_info()
+        if request is None:
             return dict()
+        simple_headers = dict()
+        for key, value in request["headers"].items():
+            simple_headers[key] = value
+        return simple_headers
 
-    def last_request_charge(self):
+    def request_charge_from_headers(self, headers) -> float:
+        """Return the RU charge in the given response headers, or 0.0."""
         try:
-            return float(
-                self._ctrproxy.client_connection.last_response_headers[
-                    LAST_REQUEST_CHARGE_HEADER
-                ]
-            )
+            return float(headers[LAST_REQUEST_CHARGE_HEADER])
         except:
+            return 0.0
+
+    def last_request_charge(self):
+        """
+        Return the RU charge of the most recent request made by the current
+        asyncio task, or -1.0 if no request has been made.
+        """
+        request = self.last_request_info()
+        if request is None:
             return -1.0
+        return request["ru"]
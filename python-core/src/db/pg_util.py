@@ -1,9 +1,16 @@
 import asyncio
+import contextlib
 import logging
 import os
+import uuid
 
+import numpy as np
 import psycopg_pool
 
+from psycopg import sql as pgsql
+from psycopg.rows import dict_row
+from psycopg.rows import tuple_row
+
 from src.os.env import Env
 
 # This class is used to access an Azure PostgreSQL account
@@ -16,17 +23,28 @@ class PGUtil:
     pool = None
 
     @classmethod
-    async def initialze_pool(cls) -> psycopg_pool.AsyncConnectionPool:
+    async def initialze_pool(
+        cls, min_size: int = None, max_size: int = None
+    ) -> psycopg_pool.AsyncConnectionPool:
         """
         Create and open a psycopg_pool.AsyncConnectionPool
-        which is used throughout this module.
+        which is used throughout this module.  The pool sizes default
+        to the AZURE_PG_POOL_MIN_SIZE and AZURE_PG_POOL_MAX_SIZE values.
         """
         if PGUtil.pool is not None:
             logging.info("PGUtil#initialze_pool already exists...")
             return PGUtil.pool
 
-        conn_pool_max_size = 1
-        logging.info("PGUtil#initialze_pool creating new...")
+        if min_size is None:
+            min_size = Env.postgresql_pool_min_size()
+        if max_size is None:
+            max_size = Env.postgresql_pool_max_size()
+        max_size = max(min_size, max_size)
+        logging.info(
+            "PGUtil#initialze_pool creating new, min_size: {}, max_size: {}".format(
+                min_size, max_size
+            )
+        )
         conn_str = Env.pg_connection_str()
         conn_str_tokens = conn_str.split("password")
         logging.info(
@@ -35,7 +53,7 @@ class PGUtil:
             )
         )
         PGUtil.pool = psycopg_pool.AsyncConnectionPool(
-            conninfo=conn_str, open=False, min_size=1, max_size=conn_pool_max_size
+            conninfo=conn_str, open=False, min_size=min_size, max_size=max_size
         )
         logging.info(
             "PGUtil#initialze_pool, pool created: {}".format(PGUtil.pool)
@@ -60,6 +78,42 @@ class PGUtil:
             except:
                 pass
 
+    @classmethod
+    def get_pool_stats(cls) -> dict:
+        """
+        Return the psycopg_pool statistics of the pool, such as pool_size,
+        pool_available, requests_waiting, requests_num and requests_wait_ms,
+        plus the average wait time in milliseconds for a connection.
+        """
+        if PGUtil.pool is None:
+            return dict()
+        stats = PGUtil.pool.get_stats()
+        stats["requests_wait_ms_avg"] = 0.0
+        if stats.get("requests_num", 0) > 0:
+            stats["requests_wait_ms_avg"] = (
+                stats.get("requests_wait_ms", 0) / stats["requests_num"]
+            )
+        return stats
+
+    @classmethod
+    async def check_pool_health(cls) -> dict:
+        """
+        Check the idle connections of the pool, which discards the broken
+        ones, and return the pool stats with a "healthy" boolean.
+        """
+        healthy = False
+        if PGUtil.pool is not None:
+            try:
+                await PGUtil.pool.check()
+                async with PGUtil.pool.connection(timeout=10.0) as conn:
+                    await conn.execute("SELECT 1")
+                healthy = True
+            except Exception as e:
+                logging.critical((str(e)))
+        stats = cls.get_pool_stats()
+        stats["healthy"] = healthy
+        return stats
+
     @classmethod
     async def close_pool(cls) -> None:
         """
@@ -101,6 +155,50 @@ class PGUtil:
                     logging.critical((str(e)))
         return result_objects
 
+    @classmethod
+    async def execute_query_stream(
+        cls, sql, params=None, itersize: int = 1000, row_factory="tuple"
+    ):
+        """
+        Execute the given SQL query with a named server-side cursor, and
+        yield its results as they are fetched, itersize rows per round trip,
+        so that the memory use is independent of the size of the result set.
+        row_factory is "tuple" or "dict" to yield each row as a tuple or a
+        dict, "numpy" to yield a NumPy record array of each batch of up to
+        itersize rows, or a psycopg row factory function.  An exception
+        raised while streaming is logged and re-raised, so that a truncated
+        result set isn't mistaken for a complete one.
+        """
+        logging.info("PGUtil#execute_query_stream, stmt: {}".format(sql[0:400]))
+        numpy_batches = row_factory == "numpy"
+        if row_factory in ("tuple", "numpy"):
+            row_factory = tuple_row
+        elif row_factory == "dict":
+            row_factory = dict_row
+        name = "pgutil_cursor_{}".format(uuid.uuid4().hex)
+
+        async with cls.pool.connection() as conn:
+            async with conn.cursor(name=name, row_factory=row_factory) as cursor:
+                cursor.itersize = max(1, int(itersize))
+                try:
+                    await asyncio.wait_for(
+                        cursor.execute(sql, params), timeout=30.0
+                    )  # timeout in seconds
+                    if not numpy_batches:
+                        async for row in cursor:
+                            yield row
+                        return
+                    names = None
+                    while True:
+                        rows = await cursor.fetchmany(cursor.itersize)
+                        if len(rows) == 0:
+                            return
+                        if names is None:
+                            names = [d.name for d in cursor.description]
+                        yield np.rec.fromrecords(rows, names=names)
+                except Exception as e:
+                    logging.critical((str(e)))
+                    raise
 
     @classmethod
     async def execute_insert(cls, 
@@ -116,7 +214,7 @@ class PGUtil:
             tablename,
             ", ".join(columns),
             ", ".join(placeholders_list))
-        logging.error("PGUtil#execute_insert, sql: {}".format(sql))
+        logging.info("PGUtil#execute_insert, sql: {}".format(sql))
 
         async with cls.pool.connection() as conn:
             async with conn.cursor() as cursor:
@@ -127,3 +225,130 @@ class PGUtil:
                 except Exception as e:
                     logging.critical((str(e)))
         return rowcount
+
+    @classmethod
+    async def execute_many(cls, sql: str, params_seq: list) -> int:
+        """
+        Execute the given parameterized SQL statement, such as an INSERT,
+        once per tuple of params_seq, in a single transaction, and return
+        the total rowcount.  psycopg sends the statements in pipeline mode,
+        so N statements cost roughly one network round trip.
+        """
+        rowcount = 0
+        logging.info(
+            "PGUtil#execute_many, sql: {}, count: {}".format(sql, len(params_seq))
+        )
+        async with cls.pool.connection() as conn:
+            async with conn.cursor() as cursor:
+                try:
+                    async with conn.transaction():
+                        await asyncio.wait_for(
+                            cursor.executemany(sql, params_seq), timeout=30.0
+                        )
+                    rowcount = cursor.rowcount
+                except Exception as e:
+                    logging.critical((str(e)))
+        return rowcount
+
+    @classmethod
+    async def execute_pipeline(cls, statements: list) -> list[int]:
+        """
+        Execute the given list of (sql, params) tuples, where params may be
+        None, in psycopg pipeline mode and in a single transaction, so that
+        the statements are sent without waiting for each result.  Return
+        the rowcount of each statement, or an empty list if the transaction
+        failed and was rolled back.
+        """
+        rowcounts = list()
+        logging.info("PGUtil#execute_pipeline, count: {}".format(len(statements)))
+        async with cls.pool.connection() as conn:
+            try:
+                cursors = list()
+                async with conn.transaction():
+                    # the cursors are closed by the exit stack, after their
+                    # results are available when the pipeline is synced
+                    async with contextlib.AsyncExitStack() as stack:
+                        async with conn.pipeline():
+                            for sql, params in statements:
+                                cursor = await stack.enter_async_context(
+                                    conn.cursor()
+                                )
+                                await cursor.execute(sql, params)
+                                cursors.append(cursor)
+                        rowcounts = [cursor.rowcount for cursor in cursors]
+            except Exception as e:
+                logging.critical((str(e)))
+        return rowcounts
+
+    @classmethod
+    async def copy_rows(
+        cls,
+        tablename: str,
+        columns: list[str],
+        rows,
+        binary: bool = False,
+        chunk_size: int = 10000,
+    ) -> int:
+        """
+        Stream the given rows, an iterable or async iterable of tuples in
+        the order of the given columns, into the given table with
+        COPY ... FROM STDIN, in a single transaction, and return the number
+        of rows copied.  The rows are taken from the iterable chunk_size at a
+        time, with a progress log message per chunk; psycopg buffers the COPY
+        data and sends it as the buffer fills, not per chunk, and nothing is
+        committed until all of the rows are copied.  With binary=True the
+        binary COPY format is used, with the column types read from the table.
+        """
+        rowcount = 0
+        table = pgsql.Identifier(*tablename.split("."))
+        column_list = pgsql.SQL(", ").join([pgsql.Identifier(c) for c in columns])
+        stmt = pgsql.SQL("COPY {} ({}) FROM STDIN").format(table, column_list)
+        if binary:
+            stmt = pgsql.SQL("{} (FORMAT BINARY)").format(stmt)
+        logging.info("PGUtil#copy_rows, table: {}, binary: {}".format(tablename, binary))
+
+        async with cls.pool.connection() as conn:
+            async with conn.cursor() as cursor:
+                try:
+                    async with conn.transaction():
+                        types = None
+                        if binary:
+                            await cursor.execute(
+                                pgsql.SQL("SELECT {} FROM {} LIMIT 0").format(
+                                    column_list, table
+                                )
+                            )
+                            types = [d.type_code for d in cursor.description]
+                        async with cursor.copy(stmt) as copy:
+                            if types is not None:
+                                copy.set_types(types)
+                            async for chunk in cls._chunks(rows, chunk_size):
+                                for row in chunk:
+                                    await copy.write_row(row)
+                                rowcount = rowcount + len(chunk)
+                                logging.info(
+                                    "PGUtil#copy_rows, {} rows queued".format(rowcount)
+                                )
+                except Exception as e:
+                    logging.critical((str(e)))
+                    rowcount = 0  # the transaction was rolled back
+        return rowcount
+
+    @classmethod
+    async def _chunks(cls, rows, chunk_size: int):
+        """Yield lists of up to chunk_size rows from the given (async) iterable."""
+        chunk = list()
+        if hasattr(rows, "__aiter__"):
+            async for row in rows:
+                chunk.append(row)
+                if len(chunk) >= chunk_size:
+                    yield chunk
+                    chunk = list()
+        else:
+            for row in rows:
+                chunk.append(row)
+                if len(chunk) >= chunk_size:
+                    yield chunk
+                    chunk = list()
+        if len(chunk) > 0:
+            yield chunk
@@ -0,0 +1,295 @@
+import hashlib
+import json
+import time
+
+from collections import OrderedDict
+
+# This module contains the optional query-result caches that can be
+# used by class CosmosNoSqlUtil, via its set_query_cache() method.
+# Class MemoryQueryCache is an in-process cache with TTL and LRU-by-bytes
+# eviction, while class RedisQueryCache uses the redis.asyncio client of
+# the RCache Redis wrapper.  The get, set, and invalidate methods of both
+# query caches are coroutines, so that Redis I/O doesn't block the event loop.
+# Class PointReadCache is the optional cache for CosmosNoSqlUtil#point_read,
+# via its set_point_read_cache() method.
+#
+# Each cached value is stored as JSON, along with the RU charge of the
+# query that produced it.  Both query caches invalidate the entries of a
+# container by incrementing a per-container generation number, which is
+# part of every MemoryQueryCache key and stored within every RedisQueryCache
+# entry, so that stale entries become unreachable and age out via TTL
+# (and LRU eviction, for MemoryQueryCache).  The generation is read with
+# generation() before a query runs and passed to set(), so that the result
+# of a query which overlapped a write isn't cached as current.
+# Chris Joakim, 2025
+
+
+def query_cache_key(*args) -> str:
+    """Return a sha256 hex digest of the JSON of the given query arguments."""
+    return hashlib.sha256(
+        json.dumps(args, sort_keys=True, default=str).encode("utf-8")
+    ).hexdigest()
+
+
+class MemoryQueryCache:
+    def __init__(self, max_bytes: int = 64 * 1024 * 1024, ttl_secs: float = 60.0):
+        self.max_bytes = int(max_bytes)
+        self.ttl_secs = float(ttl_secs)
+        self.entries = OrderedDict()  # key -> (expires_at, ru, json bytes)
+        self.generations = dict()  # container -> int
+        self.current_bytes = 0
+        self.stats = self._initial_stats()
+
+    async def get(self, container: str, key: str):
+        """Return the cached value for the given container and key, or None."""
+        full_key = self._full_key(container, key)
+        entry = self.entries.get(full_key)
+        if entry is not None:
+            expires_at, ru, data = entry
+            if time.time() < expires_at:
+                self.entries.move_to_end(full_key)
+                self.stats["hits"] = self.stats["hits"] + 1
+                self.stats["ru_saved"] = self.stats["ru_saved"] + ru
+                return json.loads(data)
+            self._remove(full_key)
+            self.stats["expirations"] = self.stats["expirations"] + 1
+        self.stats["misses"] = self.stats["misses"] + 1
+        return None
+
+    async def set(
+        self, container: str, key: str, value, ru: float = 0.0, generation: int = None
+    ) -> bool:
+        """
+        Cache the given JSON-serializable value, evicting the least recently
+        used entries as necessary.  Values larger than max_bytes, and values
+        read at a generation that has since been invalidated, aren't cached.
+        """
+        if generation is not None and generation != self.generations.get(container, 0):
+            return False
+        data = json.dumps(value).encode("utf-8")
+        if len(data) > self.max_bytes:
+            return False
+        full_key = self._full_key(container, key)
+        self._remove(full_key)
+        self.entries[full_key] = (time.time() + self.ttl_secs, float(ru), data)
+        self.current_bytes = self.current_bytes + len(data)
+        while self.current_bytes > self.max_bytes:
+            oldest_key = next(iter(self.entries))
+            self._remove(oldest_key)
+            self.stats["evictions"] = self.stats["evictions"] + 1
+        return True
+
+    async def generation(self, container: str) -> int:
+        """Return the current generation of the given container; see set()."""
+        return self.generations.get(container, 0)
+
+    async def invalidate(self, container: str) -> None:
+        """Invalidate all of the cached entries for the given container."""
+        self.generations[container] = self.generations.get(container, 0) + 1
+        self.stats["invalidations"] = self.stats["invalidations"] + 1
+
+    def get_stats(self) -> dict:
+        stats = dict(self.stats)
+        stats["entries"] = len(self.entries)
+        stats["bytes"] = self.current_bytes
+        stats["max_bytes"] = self.max_bytes
+        return stats
+
+    def _full_key(self, container: str, key: str) -> str:
+        return "{}|{}|{}".format(container, self.generations.get(container, 0), key)
+
+    def _remove(self, full_key: str) -> None:
+        entry = self.entries.pop(full_key, None)
+        if entry is not None:
+            self.current_bytes = self.current_bytes - len(entry[2])
+
+    def _initial_stats(self) -> dict:
+        stats = dict()
+        stats["hits"] = 0
+        stats["misses"] = 0
+        stats["ru_saved"] = 0.0
+        stats["evictions"] = 0
+        stats["expirations"] = 0
+        stats["invalidations"] = 0
+        return stats
+
+
+class RedisQueryCache:
+    """
+    A query-result cache in Redis, via the redis.asyncio client of the given
+    RCache instance.  Entries expire per the given ttl_secs; eviction by size
+    is left to the maxmemory-policy of the Redis server, such as allkeys-lru.
+    Each entry holds the container generation it was cached at, so that a
+    get() reads both the generation and the entry with a single MGET.
+    """
+
+    def __init__(self, rcache, ttl_secs: float = 60.0, prefix: str = "cosmos_query"):
+        self.client = rcache.async_client()
+        self.ttl_secs = max(1, int(ttl_secs))
+        self.prefix = prefix
+        self.stats = dict()
+        self.stats["hits"] = 0
+        self.stats["misses"] = 0
+        self.stats["ru_saved"] = 0.0
+        self.stats["invalidations"] = 0
+
+    async def get(self, container: str, key: str):
+        """Return the cached value for the given container and key, or None."""
+        generation, data = await self.client.mget(
+            self._generation_key(container), self._entry_key(container, key)
+        )
+        if data is not None:
+            entry = json.loads(data)
+            if entry["generation"] == int(generation or 0):
+                self.stats["hits"] = self.stats["hits"] + 1
+                self.stats["ru_saved"] = self.stats["ru_saved"] + entry["ru"]
+                return entry["value"]
+        self.stats["misses"] = self.stats["misses"] + 1
+        return None
+
+    async def set(
+        self, container: str, key: str, value, ru: float = 0.0, generation: int = None
+    ) -> bool:
+        """
+        Cache the given JSON-serializable value at the given generation, or
+        the current one; an entry of an invalidated generation is never read.
+        """
+        if generation is None:
+            generation = await self.generation(container)
+        entry = dict()
+        entry["generation"] = int(generation)
+        entry["ru"] = float(ru)
+        entry["value"] = value
+        await self.client.set(
+            self._entry_key(container, key), json.dumps(entry), ex=self.ttl_secs
+        )
+        return True
+
+    async def generation(self, container: str) -> int:
+        """Return the current generation of the given container; see set()."""
+        generation = await self.client.get(self._generation_key(container))
+        return int(generation or 0)
+
+    async def invalidate(self, container: str) -> None:
+        """Invalidate all of the cached entries for the given container."""
+        await self.client.incr(self._generation_key(container))
+        self.stats["invalidations"] = self.stats["invalidations"] + 1
+
+    def get_stats(self) -> dict:
+        return dict(self.stats)
+
+    def _generation_key(self, container: str) -> str:
+        return "{}:gen:{}".format(self.prefix, container)
+
+    def _entry_key(self, container: str, key: str) -> str:
+        return "{}:{}:{}".format(self.prefix, container, key)
+
+
+class PointReadCache:
+    """
+    A bounded in-process LRU cache of point-read documents and their _etag
+    values.  An entry is served without a request for ttl_secs after it was
+    read or revalidated; after that CosmosNoSqlUtil revalidates it with an
+    If-None-Match request, which returns a cheap 304 if it is unchanged.
+    A read_token() taken before a read is passed to put(), so that a
+    document read before a concurrent write isn't cached after the write
+    invalidated its entry.
+    """
+
+    def __init__(self, max_entries: int = 10000, ttl_secs: float = 5.0):
+        self.max_entries = max(1, int(max_entries))
+        self.ttl_secs = float(ttl_secs)
+        self.entries = OrderedDict()  # container|id -> dict
+        # container|id -> the sequence number of its latest invalidation
+        self.invalidated = OrderedDict()
+        self.sequence = 0
+        self.min_token = 0  # tokens before this may miss a dropped invalidation
+        self.stats = dict()
+        self.stats["hits"] = 0
+        self.stats["revalidated"] = 0
+        self.stats["misses"] = 0
+        self.stats["evictions"] = 0
+        self.stats["invalidations"] = 0
+        self.stats["ru"] = 0.0
+
+    def get(self, container: str, id: str, pk):
+        """
+        Return the entry dict, with doc, etag, and fresh keys, for the given
+        document or None.  The doc is a copy of the cached document.
+        """
+        entry = self.entries.get(self._key(container, id))
+        if entry is None or entry["pk"] != pk:
+            return None
+        self.entries.move_to_end(self._key(container, id))
+        result = dict()
+        result["doc"] = json.loads(entry["data"])
+        result["etag"] = entry["etag"]
+        result["fresh"] = time.time() < entry["expires_at"]
+        if result["fresh"]:
+            self.stats["hits"] = self.stats["hits"] + 1
+        return result
+
+    def read_token(self) -> int:
+        """Return the token to pass to put() for a read that starts now."""
+        return self.sequence
+
+    def put(
+        self, container: str, id: str, pk, doc: dict, ru: float = 0.0, token: int = None
+    ) -> None:
+        """
+        Cache the given document, as just read with the given RU charge,
+        unless it was invalidated after the given read_token() was taken.
+        """
+        self.stats["misses"] = self.stats["misses"] + 1
+        self.stats["ru"] = self.stats["ru"] + ru
+        etag = doc.get("_etag")
+        if etag is None:
+            return
+        if token is not None and self._invalidated_since(container, id, token):
+            return
+        entry = dict()
+        entry["pk"] = pk
+        entry["etag"] = etag
+        entry["data"] = json.dumps(doc)
+        entry["expires_at"] = time.time() + self.ttl_secs
+        key = self._key(container, id)
+        self.entries[key] = entry
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+            self.stats["evictions"] = self.stats["evictions"] + 1
+
+    def revalidated(self, container: str, id: str, ru: float = 0.0) -> None:
+        """Record a 304 Not Modified response, restarting the entry TTL."""
+        self.stats["revalidated"] = self.stats["revalidated"] + 1
+        self.stats["ru"] = self.stats["ru"] + ru
+        entry = self.entries.get(self._key(container, id))
+        if entry is not None:
+            entry["expires_at"] = time.time() + self.ttl_secs
+
+    def invalidate(self, container: str, id: str) -> None:
+        """Remove the given document, in any partition, from the cache."""
+        key = self._key(container, id)
+        self.sequence = self.sequence + 1
+        self.invalidated[key] = self.sequence
+        self.invalidated.move_to_end(key)
+        while len(self.invalidated) > self.max_entries:
+            _, sequence = self.invalidated.popitem(last=False)
+            self.min_token = max(self.min_token, sequence)
+        if self.entries.pop(key, None) is not None:
+            self.stats["invalidations"] = self.stats["invalidations"] + 1
+
+    def get_stats(self) -> dict:
+        stats = dict(self.stats)
+        stats["entries"] = len(self.entries)
+        stats["max_entries"] = self.max_entries
+        return stats
+
+    def _key(self, container: str, id: str) -> str:
+        return "{}|{}".format(container, id)
+
+    def _invalidated_since(self, container: str, id: str, token: int) -> bool:
+        if token < self.min_token:
+            return True
+        return self.invalidated.get(self._key(container, id), 0) > token
+
@@ -1,4 +1,5 @@
 import redis
+import redis.asyncio
 
 # This class is used to access a Redis cache server, sush as
 # a local Redis server, or Azure Cache for Redis.
@@ -9,7 +10,10 @@ import redis
 class RCache:
 
     def __init__(self, host, port):
+        self.host = host
+        self.port = port
         self.redis_client = redis.Redis(host=host, port=port)
+        self.redis_async_client = None
 
     def set(self, key: str, value):
         """Set the given cache key to the given value."""
@@ -37,3 +41,11 @@ class RCache:
     def client(self):
         """Return the redis.Redis client object."""
         return self.redis_client
+
+    def async_client(self):
+        """Return the redis.asyncio.Redis client object, for use in coroutines."""
+        if self.redis_async_client is None:
+            self.redis_async_client = redis.asyncio.Redis(
+                host=self.host, port=self.port
+            )
+        return self.redis_async_client
@@ -7,14 +7,21 @@ from datetime import datetime
 from typing import List
 from typing import Optional
 
+from sqlalchemy import Column
 from sqlalchemy import create_engine
 from sqlalchemy import DateTime
 from sqlalchemy import ForeignKey
 from sqlalchemy import Integer
+from sqlalchemy import MetaData
 from sqlalchemy import String
+from sqlalchemy import Table
 
+from sqlalchemy import insert
 from sqlalchemy import select
-from sqlalchemy.orm import Session
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.ext.asyncio import create_async_engine
 
 from sqlalchemy.orm import DeclarativeBase
 from sqlalchemy.orm import Mapped
@@ -72,6 +79,64 @@ class AppEngine():
             logging.warning("AppEngine.dispose() completed")
 
 
+class AsyncAppEngine():
+    """
+    Class AsyncAppEngine is the asyncio counterpart of class AppEngine.
+    It creates and manages the singleton instance of the SQLAlchemy
+    AsyncEngine, which uses the async mode of the psycopg driver, and
+    the sessionmaker for the AsyncSession objects used in async code.
+    """
+    engine = None  # singleton instance of the SQLAlchemy AsyncEngine
+    sessionmaker = None
+
+    @classmethod
+    def initialize(cls):
+        AsyncAppEngine.engine = cls.get_engine()
+
+    @classmethod
+    def get_engine(cls):
+        """ Lazy initialization getter method for the SQLAlchemy AsyncEngine singleton. """
+        if AsyncAppEngine.engine is None:
+            try:
+                engine_url = Env.sqlalchemy_engine_url()
+                logging.info("AsyncAppEngine#engine_url: {}".format(engine_url))
+                pool_size = Env.sqlalchemy_pool_size()
+                max_overflow = Env.sqlalchemy_max_overflow()
+                AsyncAppEngine.engine = create_async_engine(
+                    engine_url, pool_size=pool_size, max_overflow=max_overflow)
+                # expire_on_commit=False, so that the loaded objects can be
+                # used after the session is closed
+                AsyncAppEngine.sessionmaker = async_sessionmaker(
+                    AsyncAppEngine.engine, expire_on_commit=False)
+            except Exception as e:
+                logging.critical(str(e))
+        logging.info("AsyncAppEngine.get_engine, engine: {}".format(AsyncAppEngine.engine))
+        return AsyncAppEngine.engine
+
+    @classmethod
+    def session(cls) -> AsyncSession:
+        """
+        Return a new AsyncSession, to be used as an async context manager:
+          async with AsyncAppEngine.session() as session:
+        """
+        if AsyncAppEngine.sessionmaker is None:
+            cls.get_engine()
+        return AsyncAppEngine.sessionmaker()
+
+    @classmethod
+    async def dispose(cls):
+        """ Close or dispose of the SQLAlchemy AsyncEngine object. """
+        if AsyncAppEngine.engine is not None:
+            try:
+                await AsyncAppEngine.engine.dispose()
+            except Exception as e:
+                logging.error("Error disposing AsyncAppEngine:")
+                logging.error(str(e))
+            AsyncAppEngine.engine = None
+            AsyncAppEngine.sessionmaker = None
+            logging.warning("AsyncAppEngine.dispose() completed")
+
+
 class Base(DeclarativeBase):
     pass
 
@@ -149,6 +214,10 @@ class ExtractedQA(Base):
     # TODO: Define the fields for the ExtractedQA model
 
 
+# the natural key of a document; see the unique index idx_documents_source_key
+DOCUMENT_KEY_COLUMNS = ["source_system", "source_path", "raw_container", "raw_file_name"]
+
+
 class TeamsQA(Base):
     __tablename__ = "teams_qa"
     #__table_args__ = {'extend_existing': True}
@@ -168,7 +237,9 @@ class ApplicationEvent(Base):
 class CommonOperations():
     """
     Common database operations that can be used thoughtout the application
-    in a reusable way.
+    in a reusable way.  These use the AsyncSession objects of AsyncAppEngine,
+    so that they don't block the event loop, and so that concurrent calls
+    execute concurrently on the connections of the engine pool.
     """
     
     @classmethod
@@ -178,12 +249,11 @@ class CommonOperations():
         Return the JSON object from the JSONB 'data' column.
         TODO: Consider returning a Pydantic model instead of a dict.
         """
-        await asyncio.sleep(0.1)  # Simulate some async work for now
         obj = None
         try:
             stmt = select(Configuration).where(Configuration.name == config_name)
-            with Session(AppEngine.get_engine()) as session:
-                c = session.execute(stmt).scalar_one_or_none()
+            async with AsyncAppEngine.session() as session:
+                c = (await session.execute(stmt)).scalar_one_or_none()
                 obj = c.data
         except Exception as e:
             logging.critical(str(e))
@@ -191,7 +261,6 @@ class CommonOperations():
     
     @classmethod
     async def read_document(cls, d: Document):
-        await asyncio.sleep(0.1)  # Simulate some async work for now
         obj = None
         try:
             stmt = select(Document).where(
@@ -200,8 +269,61 @@ class CommonOperations():
                 Document.raw_container == d.raw_container,
                 Document.raw_file_name == d.raw_file_name
             )
-            with Session(AppEngine.get_engine()) as session:
-                obj = session.execute(stmt).scalar_one_or_none()
+            async with AsyncAppEngine.session() as session:
+                obj = (await session.execute(stmt)).scalar_one_or_none()
         except Exception as e:
             logging.critical(str(e))
         return obj
+
+    @classmethod
+    async def read_documents(cls, docs: List[Document]) -> list:
+        """
+        Read the given documents concurrently, at most one per connection of
+        the engine pool at a time, and return the existing Document, or None,
+        of each, in the same order.
+        """
+        semaphore = asyncio.Semaphore(
+            max(1, Env.sqlalchemy_pool_size() + Env.sqlalchemy_max_overflow()))
+
+        async def read(d: Document):
+            async with semaphore:
+                return await cls.read_document(d)
+
+        return await asyncio.gather(*[read(d) for d in docs])
+
+    @classmethod
+    async def reconcile_documents(cls, docs: List[Document]) -> int:
+        """
+        Insert those of the given documents that are not already in the
+        documents table, per their DOCUMENT_KEY_COLUMNS, as a set-based
+        operation in a single transaction; the documents are inserted into
+        a temporary staging table with multi-row VALUES statements, then
+        copied with one INSERT ... SELECT ... ON CONFLICT DO NOTHING, which
+        requires the unique index idx_documents_source_key.
+        Return the number of documents inserted.
+        """
+        columns = [c for c in Document.__table__.columns if c.name != "id"]
+        names = ", ".join([c.name for c in columns])
+        staging = Table(
+            "documents_staging", MetaData(), *[Column(c.name, c.type) for c in columns])
+        rows = [{c.name: getattr(d, c.name) for c in columns} for d in docs]
+        async with AsyncAppEngine.session() as session:
+            await session.execute(text(
+                "CREATE TEMPORARY TABLE documents_staging ON COMMIT DROP AS "
+                "SELECT {} FROM documents WITH NO DATA".format(names)))
+            if len(rows) > 0:
+                # executed as batched multi-row VALUES by the psycopg dialect
+                await session.execute(insert(staging), rows)
+            result = await session.execute(text(
+                "INSERT INTO documents ({}) SELECT {} FROM documents_staging "
+                "ON CONFLICT ({}) DO NOTHING".format(
+                    names, names, ", ".join(DOCUMENT_KEY_COLUMNS))))
+            await session.commit()
+            return result.rowcount
+
+    @classmethod
+    async def add_all(cls, objects: list) -> None:
+        """ Insert the given ORM objects in a single transaction. """
+        async with AsyncAppEngine.session() as session:
+            session.add_all(objects)
+            await session.commit()
@@ -0,0 +1,139 @@
+import json
+import logging
+import os
+
+# This class implements the resumable checkpoint journal of the bulk
+# loaders.  The outcome of each work item, such as a file path or a
+# document id, is appended to the journal file as a compact JSON line;
+# either {"key": k, "ok": true} or {"key": k, "ok": false, "error": reason}.
+# The last line for a key wins, so a failed item that succeeds on a retry
+# is completed.  A rerun of a loader can then skip the completed items
+# (mode "resume") or process only the failed items (mode "retry_failed").
+# Chris Joakim, 2025
+
+MODE_ALL = "all"
+MODE_RESUME = "resume"
+MODE_RETRY_FAILED = "retry_failed"
+
+
+class Checkpoint:
+    def __init__(self, filename: str, flush_interval: int = 100):
+        self.filename = filename
+        self.flush_interval = max(1, int(flush_interval))
+        self.completed = set()
+        self.failed = dict()  # key -> error reason
+        self.unflushed = 0
+        self.file = None
+        self.load()
+
+    @classmethod
+    def mode_from_args(cls, args: list) -> str:
+        """Return the journal mode per the --resume or --retry-failed args."""
+        if "--retry-failed" in args:
+            return MODE_RETRY_FAILED
+        if "--resume" in args:
+            return MODE_RESUME
+        return MODE_ALL
+
+    def load(self) -> int:
+        """Read the outcomes of the items from the file, if it exists."""
+        self.completed, self.failed = set(), dict()
+        if os.path.exists(self.filename):
+            with open(self.filename, encoding="utf-8", mode="rt") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                        self._apply(record)
+                    except:
+                        pass  # a partial last line, from an interrupted run
+        logging.info(
+            "Checkpoint#load {} completed and {} failed keys from {}".format(
+                len(self.completed), len(self.failed), self.filename
+            )
+        )
+        return len(self.completed)
+
+    def pending(self, keys, mode: str = MODE_RESUME) -> list:
+        """
+        Return the given keys which are to be processed in the given mode;
+        all of them, those not completed, or only those that failed.
+        """
+        return [key for key in keys if self.is_pending(key, mode)]
+
+    def is_pending(self, key: str, mode: str = MODE_RESUME) -> bool:
+        if mode == MODE_RETRY_FAILED:
+            return key in self.failed
+        if mode == MODE_RESUME:
+            return key not in self.completed
+        return True
+
+    def is_completed(self, key: str) -> bool:
+        return key in self.completed
+
+    def is_failed(self, key: str) -> bool:
+        return key in self.failed
+
+    def mark_completed(self, key: str) -> None:
+        """Record the given key as completed."""
+        if key in self.completed:
+            return
+        self._append({"key": key, "ok": True})
+
+    def mark_failed(self, key: str, error: str) -> None:
+        """Record the given key as failed, with the given error reason."""
+        self._append({"key": key, "ok": False, "error": str(error)})
+
+    def get_stats(self) -> dict:
+        stats = dict()
+        stats["filename"] = self.filename
+        stats["completed"] = len(self.completed)
+        stats["failed"] = len(self.failed)
+        return stats
+
+    def flush(self) -> None:
+        if self.file is not None:
+            self.file.flush()
+        self.unflushed = 0
+
+    def close(self) -> None:
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+        self.unflushed = 0
+
+    def compact(self) -> None:
+        """Rewrite the file with only the latest outcome of each key."""
+        self.close()
+        tmp_filename = self.filename + ".tmp"
+        with open(tmp_filename, encoding="utf-8", mode="wt") as f:
+            for key in sorted(self.completed):
+                f.write(json.dumps({"key": key, "ok": True}) + "\n")
+            for key in sorted(self.failed.keys()):
+                record = {"key": key, "ok": False, "error": self.failed[key]}
+                f.write(json.dumps(record) + "\n")
+        os.replace(tmp_filename, self.filename)
+
+    def reset(self) -> None:
+        """Delete the checkpoint file, so that all items are loaded again."""
+        self.close()
+        if os.path.exists(self.filename):
+            os.remove(self.filename)
+        self.completed, self.failed = set(), dict()
+
+    def _apply(self, record: dict) -> None:
+        key = record["key"]
+        if record["ok"]:
+            self.completed.add(key)
+            self.failed.pop(key, None)
+        else:
+            self.completed.discard(key)
+            self.failed[key] = record.get("error")
+
+    def _append(self, record: dict) -> None:
+        if self.file is None:
+            self.file = open(self.filename, encoding="utf-8", mode="at")
+        self._apply(record)
+        self.file.write(json.dumps(record) + "\n")
+        self.unflushed = self.unflushed + 1
+        if self.unflushed >= self.flush_interval:
+            self.flush()
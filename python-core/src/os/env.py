@@ -29,6 +29,18 @@ class Env:
         """
         return flag_arg in sys.argv
 
+    @classmethod
+    def flag_arg(cls, flag_arg: str, default=None) -> str | None:
+        """
+        Return the command-line value that follows the given flag arg,
+        such as "8" for --concurrency 8, or the given default value.
+        """
+        if flag_arg in sys.argv:
+            idx = sys.argv.index(flag_arg)
+            if idx + 1 < len(sys.argv):
+                return sys.argv[idx + 1]
+        return default
+
     @classmethod
     def username(cls) -> str | None:
         """
@@ -100,6 +112,10 @@ class Env:
     def cosmosdb_nosql_default_container(cls) -> str:
         return cls.envvar("AZURE_COSMOSDB_NOSQL_DEFAULT_CONTAINER", "test")
 
+    @classmethod
+    def cosmosdb_nosql_bulk_concurrency(cls) -> int:
+        return int(cls.envvar("AZURE_COSMOSDB_NOSQL_BULK_CONCURRENCY", "16"))
+
     @classmethod
     def cosmosdb_emulator_mongo_conn_str(cls) -> str:
         return "mongodb://localhost:C2y6yDjf5%2FR%2Bob0N8A7Cgv30VRDJIWEHLM%2B4QDU5DE2nQ9nDuVTqobD4b8mGGyPMbIZnqyMsEcaGQy67XIw%2FJw%3D%3D@localhost:10255/admin?ssl=true"
@@ -136,6 +152,14 @@ class Env:
     def postgresql_password(cls) -> str:
         return cls.envvar("AZURE_PG_FLEX_PASS", None)
 
+    @classmethod
+    def postgresql_pool_min_size(cls) -> int:
+        return int(cls.envvar("AZURE_PG_POOL_MIN_SIZE", "1"))
+
+    @classmethod
+    def postgresql_pool_max_size(cls) -> int:
+        return int(cls.envvar("AZURE_PG_POOL_MAX_SIZE", "8"))
+
     @classmethod
     def pg_connection_str(cls):
         """
@@ -0,0 +1,195 @@
+import logging
+import os
+
+import duckdb
+
+# This class reads the OpenFlights airports and routes data, in the
+# data/openflights directory of this repo, in columnar form with DuckDB.
+# The type coercion, the filtering of the airports with \N null values,
+# and the GeoJSON construction are done as set-based SQL operations rather
+# than per document in Python, and the documents are then yielded in
+# batches from the DuckDB result.  The untyped columns keep the \N values
+# of the source data, as strings, like the documents loaded previously.
+# Note that airports.dat has one more airport than airports.json, id 1.
+# See https://openflights.org/data.php
+# Chris Joakim, 2025
+
+AIRPORT_COLUMNS = [
+    "AirportID",
+    "Name",
+    "City",
+    "Country",
+    "IATA",
+    "ICAO",
+    "Latitude",
+    "Longitude",
+    "Altitude",
+    "Timezone",
+    "DST",
+    "Tz",
+    "AType",
+    "Source",
+]
+
+ROUTE_COLUMNS = [
+    "Airline",
+    "AirlineID",
+    "SourceAirport",
+    "SourceAirportID",
+    "DestAirport",
+    "DestAirportID",
+    "Codeshare",
+    "Stops",
+    "Equipment",
+]
+
+# the default SQL type of each non-VARCHAR airport column
+AIRPORT_COLUMN_TYPES = {
+    "AirportID": "INTEGER",
+    "Latitude": "DOUBLE",
+    "Longitude": "DOUBLE",
+    "Altitude": "DOUBLE",
+}
+
+
+class OpenFlights:
+    def __init__(self, data_dir: str = "../data/openflights"):
+        self.data_dir = data_dir
+        self.con = duckdb.connect()
+
+    def close(self) -> None:
+        self.con.close()
+
+    def airport_documents(
+        self,
+        source: str = "json",
+        lowercase_keys: bool = True,
+        pk_attr: str = "pk",
+        require_iata: bool = True,
+        geojson: bool = True,
+        batch_size: int = 1000,
+        column_types: dict = None,
+        require_country: bool = True,
+    ):
+        """
+        Yield the airports as ready-to-upsert documents, with a deterministic
+        id like "airport_3876", the Country as the pk_attr partition key
+        value, and a GeoJSON Point location.  The source is either "json",
+        for airports.json, or "raw", for airports.dat.  The column_types dict
+        is the SQL type of each non-VARCHAR column, AIRPORT_COLUMN_TYPES by
+        default, and airports whose typed values can't be cast are excluded.
+        Airports without a Country if require_country, or without an IATA
+        code if require_iata, are also excluded.
+        """
+        sql = self.airport_documents_sql(
+            source,
+            lowercase_keys,
+            pk_attr,
+            require_iata,
+            geojson,
+            column_types,
+            require_country,
+        )
+        cursor = self.con.execute(sql)
+        names = [d[0] for d in cursor.description]
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if len(rows) == 0:
+                return
+            for row in rows:
+                yield dict(zip(names, row))
+
+    def airport_documents_sql(
+        self,
+        source: str = "json",
+        lowercase_keys: bool = True,
+        pk_attr: str = "pk",
+        require_iata: bool = True,
+        geojson: bool = True,
+        column_types: dict = None,
+        require_country: bool = True,
+    ) -> str:
+        def key(name):
+            return name.lower() if lowercase_keys else name
+
+        if column_types is None:
+            column_types = AIRPORT_COLUMN_TYPES
+
+        selects = list()
+        selects.append("'airport_' || CAST(AirportID AS VARCHAR) AS id")
+        for name in AIRPORT_COLUMNS:
+            selects.append('{} AS "{}"'.format(name, key(name)))
+        selects.append('Country AS "{}"'.format(pk_attr))
+        if geojson:
+            # See https://learn.microsoft.com/en-us/azure/cosmos-db/nosql/query/geospatial
+            selects.append(
+                "struct_pack(type := 'Point', coordinates := [Longitude, Latitude])"
+                " AS location"
+            )
+        filters = ["{} IS NOT NULL".format(name) for name in column_types.keys()]
+        if require_country:
+            filters.append("Country <> '\\N'")
+        if require_iata:
+            filters.append("IATA <> '\\N'")
+        return "SELECT {} FROM ({}) WHERE {} ORDER BY AirportID".format(
+            ", ".join(selects),
+            self.airports_sql(source, column_types),
+            " AND ".join(filters),
+        )
+
+    def airports_sql(self, source: str = "json", column_types: dict = None) -> str:
+        """
+        Return the SQL for the airports table of the given source, with the
+        given column_types, or AIRPORT_COLUMN_TYPES.  Typed values that can't
+        be cast, such as \\N, are NULL; the other values are left as is.
+        """
+        if column_types is None:
+            column_types = AIRPORT_COLUMN_TYPES
+        columns = list()
+        for name in AIRPORT_COLUMNS:
+            value = name
+            if name in column_types:
+                value = "TRY_CAST({} AS {})".format(name, column_types[name])
+            columns.append("{} AS {}".format(value, name))
+        return "SELECT {} FROM {}".format(
+            ", ".join(columns), self._read_sql("airports", AIRPORT_COLUMNS, source)
+        )
+
+    def routes_columns(self) -> dict:
+        """
+        Return the routes.dat routes with known source and destination
+        airport ids as a dict of NumPy column arrays; SourceAirportID,
+        DestAirportID, and Stops are int32, the other columns are objects.
+        """
+        sql = """
+SELECT Airline,
+  TRY_CAST(AirlineID AS INTEGER) AS AirlineID,
+  SourceAirport,
+  CAST(SourceAirportID AS INTEGER) AS SourceAirportID,
+  DestAirport,
+  CAST(DestAirportID AS INTEGER) AS DestAirportID,
+  Codeshare,
+  COALESCE(TRY_CAST(Stops AS INTEGER), 0) AS Stops,
+  Equipment
+ FROM {}
+ WHERE TRY_CAST(SourceAirportID AS INTEGER) IS NOT NULL
+   AND TRY_CAST(DestAirportID AS INTEGER) IS NOT NULL
+""".format(
+            self._read_sql("routes", ROUTE_COLUMNS, "raw")
+        )
+        return self.con.execute(sql).fetchnumpy()
+
+    def _read_sql(self, name: str, column_names: list, source: str) -> str:
+        columns = ", ".join(["'{}': 'VARCHAR'".format(c) for c in column_names])
+        columns = "{" + columns + "}"
+        if source == "json":
+            path = os.path.join(self.data_dir, "json", name + ".json")
+            return "read_json('{}', format = 'newline_delimited', columns = {})".format(
+                path, columns
+            )
+        path = os.path.join(self.data_dir, "raw", name + ".dat")
+        logging.debug("OpenFlights reading {}".format(path))
+        return (
+            "read_csv('{}', header = false, delim = ',', quote = '\"', "
+            "escape = '\"', columns = {})".format(path, columns)
+        )
@@ -0,0 +1,209 @@
+import os
+
+import numpy as np
+
+# This class is a compact in-memory adjacency index of the OpenFlights
+# routes, in CSR (compressed sparse row) form.  The airports are numbered
+# 0..n-1 in AirportID order, and the destinations of airport i are
+# indices[indptr[i]:indptr[i + 1]].  The routes are joined against the
+# airports of airports.dat, so routes to unknown airports are excluded,
+# and duplicate routes (i.e. - several airlines) are a single edge.
+# The arrays, and those of the reverse index used by shortest_hops(),
+# can be saved as .npy files and memory-mapped by load(), for a
+# near-instant startup.
+# Chris Joakim, 2025
+
+ARRAY_NAMES = ["airport_ids", "iata", "indptr", "indices"]
+REVERSE_ARRAY_NAMES = ["indptr", "indices"]
+
+
+class RouteGraph:
+    def __init__(self, airport_ids, iata, indptr, indices):
+        self.airport_ids = airport_ids  # sorted int32 AirportIDs
+        self.iata = iata  # the IATA code, or "", of each airport
+        self.indptr = indptr
+        self.indices = indices
+        self._iata_index = None
+        self._reverse_graph = None
+
+    @classmethod
+    def from_openflights(cls, openflights) -> "RouteGraph":
+        """Build the index from the airports.dat and routes.dat data."""
+        airports = openflights.con.execute(
+            "SELECT AirportID, COALESCE(NULLIF(IATA, '\\N'), '') AS IATA FROM ({}) "
+            "WHERE AirportID IS NOT NULL ORDER BY AirportID".format(
+                openflights.airports_sql("raw")
+            )
+        ).fetchnumpy()
+        routes = openflights.routes_columns()
+        return cls.from_arrays(
+            np.asarray(airports["AirportID"], dtype=np.int32),
+            np.asarray(airports["IATA"], dtype="U4"),
+            np.asarray(routes["SourceAirportID"], dtype=np.int32),
+            np.asarray(routes["DestAirportID"], dtype=np.int32),
+        )
+
+    @classmethod
+    def from_arrays(cls, airport_ids, iata, source_ids, dest_ids) -> "RouteGraph":
+        """
+        Build the index from the given sorted airport id and IATA arrays,
+        and the parallel route source and destination airport id arrays.
+        """
+        n = len(airport_ids)
+        src = np.searchsorted(airport_ids, source_ids)
+        dst = np.searchsorted(airport_ids, dest_ids)
+        # join; keep only the routes where both airports are known
+        src_ok = (src < n) & (airport_ids[np.minimum(src, n - 1)] == source_ids)
+        dst_ok = (dst < n) & (airport_ids[np.minimum(dst, n - 1)] == dest_ids)
+        keep = src_ok & dst_ok
+        # dedupe the edges, which also sorts them by source then destination
+        edges = np.unique(src[keep].astype(np.int64) * n + dst[keep])
+        src, dst = edges // n, edges % n
+        indptr = np.zeros(n + 1, dtype=np.int32)
+        np.cumsum(np.bincount(src, minlength=n), out=indptr[1:])
+        return cls(airport_ids, iata, indptr, dst.astype(np.int32))
+
+    @classmethod
+    def load(cls, directory: str, mmap: bool = True) -> "RouteGraph":
+        """Load the arrays saved by save(), memory-mapped by default."""
+        mmap_mode = "r" if mmap else None
+        arrays = dict()
+        for name in ARRAY_NAMES:
+            path = os.path.join(directory, name + ".npy")
+            arrays[name] = np.load(path, mmap_mode=mmap_mode)
+        graph = cls(**arrays)
+        reverse = dict()
+        for name in REVERSE_ARRAY_NAMES:
+            path = os.path.join(directory, "reverse_" + name + ".npy")
+            reverse[name] = np.load(path, mmap_mode=mmap_mode)
+        graph._reverse_graph = cls(graph.airport_ids, graph.iata, **reverse)
+        return graph
+
+    def save(self, directory: str) -> None:
+        os.makedirs(directory, exist_ok=True)
+        for name in ARRAY_NAMES:
+            np.save(os.path.join(directory, name + ".npy"), getattr(self, name))
+        for name in REVERSE_ARRAY_NAMES:
+            path = os.path.join(directory, "reverse_" + name + ".npy")
+            np.save(path, getattr(self._reverse(), name))
+
+    def airport_count(self) -> int:
+        return len(self.airport_ids)
+
+    def route_count(self) -> int:
+        return len(self.indices)
+
+    def index_of(self, airport) -> int | None:
+        """Return the index of the given AirportID or IATA code, or None."""
+        if isinstance(airport, str):
+            if self._iata_index is None:
+                self._iata_index = dict()
+                for idx, code in enumerate(self.iata.tolist()):
+                    if code != "":
+                        self._iata_index[code] = idx
+            return self._iata_index.get(airport.upper())
+        idx = int(np.searchsorted(self.airport_ids, airport))
+        if idx < len(self.airport_ids) and self.airport_ids[idx] == airport:
+            return idx
+        return None
+
+    def neighbors(self, airport) -> list:
+        """Return the AirportIDs with a direct route from the given airport."""
+        idx = self.index_of(airport)
+        if idx is None:
+            return list()
+        return self.airport_ids[self._targets(idx)].tolist()
+
+    def shortest_hops(self, source, dest) -> list | None:
+        """
+        Return a path with the fewest hops from the source to the dest
+        airport, as a list of AirportIDs, or None if there is no path.
+        This is a bidirectional breadth-first search; the reverse search
+        follows the routes backwards via the reverse index.
+        """
+        s, d = self.index_of(source), self.index_of(dest)
+        if s is None or d is None:
+            return None
+        if s == d:
+            return [int(self.airport_ids[s])]
+        reverse = self._reverse()
+        # node -> (parent node, depth) of the forward and backward searches
+        fwd, bwd = {s: (-1, 0)}, {d: (-1, 0)}
+        fwd_frontier, bwd_frontier = [s], [d]
+        while len(fwd_frontier) > 0 and len(bwd_frontier) > 0:
+            # expand the smaller frontier by one full level
+            if len(fwd_frontier) <= len(bwd_frontier):
+                fwd_frontier, meets = self._expand(fwd_frontier, fwd, bwd, self)
+            else:
+                bwd_frontier, meets = self._expand(bwd_frontier, bwd, fwd, reverse)
+            if len(meets) > 0:
+                meet = min(meets, key=lambda m: fwd[m][1] + bwd[m][1])
+                path = list()
+                node = meet
+                while node != -1:
+                    path.append(node)
+                    node = fwd[node][0]
+                path.reverse()
+                node = bwd[meet][0]
+                while node != -1:
+                    path.append(node)
+                    node = bwd[node][0]
+                return self.airport_ids[path].tolist()
+        return None
+
+    def within_hops(self, airport, k: int) -> list:
+        """
+        Return the sorted AirportIDs reachable from the given airport in
+        at most k hops, excluding the airport itself.
+        """
+        idx = self.index_of(airport)
+        if idx is None:
+            return list()
+        visited = np.zeros(len(self.airport_ids), dtype=bool)
+        visited[idx] = True
+        frontier = np.array([idx], dtype=np.int32)
+        for _ in range(int(k)):
+            if len(frontier) == 0:
+                break
+            starts, ends = self.indptr[frontier], self.indptr[frontier + 1]
+            targets = np.concatenate(
+                [self.indices[a:b] for a, b in zip(starts.tolist(), ends.tolist())]
+            )
+            frontier = np.unique(targets[~visited[targets]])
+            visited[frontier] = True
+        visited[idx] = False
+        return self.airport_ids[np.flatnonzero(visited)].tolist()
+
+    def _targets(self, idx: int):
+        return self.indices[self.indptr[idx] : self.indptr[idx + 1]]
+
+    def _reverse(self) -> "RouteGraph":
+        """Return the graph with every route reversed, computed once."""
+        if self._reverse_graph is None:
+            counts = np.diff(self.indptr)
+            n = len(self.airport_ids)
+            sources = np.repeat(np.arange(n, dtype=np.int32), counts)
+            self._reverse_graph = RouteGraph.from_arrays(
+                self.airport_ids,
+                self.iata,
+                self.airport_ids[self.indices],
+                self.airport_ids[sources],
+            )
+        return self._reverse_graph
+
+    def _expand(self, frontier: list, visited: dict, other_visited: dict, graph):
+        """
+        Expand the given frontier by one level, and return the next frontier
+        and the list of the nodes also visited by the other search.
+        """
+        next_frontier, meets = list(), list()
+        indices, indptr = graph.indices, graph.indptr
+        for node in frontier:
+            depth = visited[node][1] + 1
+            for target in indices[indptr[node] : indptr[node + 1]].tolist():
+                if target not in visited:
+                    visited[target] = (node, depth)
+                    next_frontier.append(target)
+                    if target in other_visited:
+                        meets.append(target)
+        return next_frontier, meets
@@ -0,0 +1,58 @@
+import os
+
+from src.io.checkpoint import Checkpoint
+from src.io.checkpoint import MODE_ALL, MODE_RESUME, MODE_RETRY_FAILED
+
+# pytest -v tests/test_checkpoint.py
+
+
+def test_checkpoint(tmp_path):
+    filename = str(tmp_path / "checkpoint.jsonl")
+    cp = Checkpoint(filename, flush_interval=2)
+    assert cp.is_completed("a") is False
+    cp.mark_completed("a")
+    cp.mark_completed("b")
+    cp.mark_completed("b")
+    cp.mark_completed("c")
+    cp.close()
+    assert cp.is_completed("a") is True
+
+    # append a partial line, as from an interrupted run
+    with open(filename, "at") as f:
+        f.write('{"key": "d')
+    cp = Checkpoint(filename)
+    assert sorted(cp.completed) == ["a", "b", "c"]
+    cp.reset()
+    assert os.path.exists(filename) is False
+    assert cp.is_completed("a") is False
+
+
+def test_failed_keys_and_modes(tmp_path):
+    filename = str(tmp_path / "checkpoint.jsonl")
+    cp = Checkpoint(filename)
+    cp.mark_completed("a")
+    cp.mark_failed("b", "throttled")
+    cp.mark_failed("c", "bad request")
+    cp.mark_completed("c")  # a retry that succeeded
+    cp.close()
+
+    cp = Checkpoint(filename)
+    assert cp.get_stats()["completed"] == 2
+    assert cp.failed == {"b": "throttled"}
+    assert cp.is_failed("b") is True
+    assert cp.is_failed("c") is False
+    keys = ["a", "b", "c", "d"]
+    assert cp.pending(keys, MODE_ALL) == keys
+    assert cp.pending(keys, MODE_RESUME) == ["b", "d"]
+    assert cp.pending(keys, MODE_RETRY_FAILED) == ["b"]
+
+    cp.compact()
+    with open(filename, "rt") as f:
+        assert len(f.readlines()) == 3
+    assert Checkpoint(filename).failed == {"b": "throttled"}
+
+
+def test_mode_from_args():
+    assert Checkpoint.mode_from_args(["x", "--load"]) == MODE_ALL
+    assert Checkpoint.mode_from_args(["x", "--resume"]) == MODE_RESUME
+    assert Checkpoint.mode_from_args(["x", "--retry-failed"]) == MODE_RETRY_FAILED
@@ -1,9 +1,13 @@
 import asyncio
 import pytest
 
+from azure.cosmos import exceptions
+
 from src.os.env import Env
 from src.io.fs import FS
 from src.db.cosmos_nosql_util import CosmosNoSqlUtil
+from src.db.query_cache import MemoryQueryCache
+from src.db.query_cache import PointReadCache
 from src.util.data_gen import DataGenerator
 
 # pytest -v tests/test_cosmos.py
@@ -119,6 +123,10 @@ async def test_all(cosmos_util):
         result["ru"] = cosmos_util.last_request_charge()
         results.append(result)
     FS.write_json(results, "tmp/test_cosmos_util_create_item_results.json")
+    assert cosmos_util.last_request_info()["operation"] == "create_item"
+    create_metrics = cosmos_util.get_request_metrics()["operations"]["create_item"]
+    assert create_metrics["count"] == 5
+    assert create_metrics["latency_ms"]["p99"] > 0.0
 
     # test count_documents
     count_result = await cosmos_util.count_documents()
@@ -164,9 +172,7 @@ async def test_all(cosmos_util):
 
     # query all items and write them to a tmp file for visual verification
     sql = "select * from c"
-    docs = await cosmos_util.query_items(
-        sql, cross_partition=True, pk="/pk", max_items=100
-    )
+    docs = await cosmos_util.query_items(sql, cross_partition=True, pk="/pk")
     FS.write_json(docs, "tmp/test_cosmos_util_query_all_docs.json")
 
     # test parameterized_query
@@ -212,3 +218,188 @@ async def test_all(cosmos_util):
             sql, cross_partition=True, pk="/pk", max_items=100
         )
         assert len(docs) == 3
+
+    # test bulk_upsert
+    stats = dict()
+    docs = [create_random_document(None, "bulk_upsert_pk") for n in range(25)]
+    results = list()
+    async for result in cosmos_util.bulk_upsert(docs, 4, stats):
+        results.append(result)
+    assert len(results) == 25
+    assert sorted([r["index"] for r in results]) == list(range(25))
+    assert stats["count"] == 25
+    assert stats["succeeded"] == 25
+    assert stats["failed"] == 0
+    assert stats["ru"] > 0.0
+
+    # test batch_write, with two partition key values and a partial batch
+    stats = dict()
+    docs = [create_random_document(None, "batch_pk_a") for n in range(120)]
+    docs.extend([create_random_document(None, "batch_pk_b") for n in range(5)])
+    results = list()
+    async for result in cosmos_util.batch_write(docs, "/pk", 4, stats):
+        results.append(result)
+    assert len(results) == 3
+    assert stats["batches"] == 3
+    assert stats["count"] == 125
+    assert stats["succeeded"] == 125
+    assert sorted([r["count"] for r in results]) == [5, 20, 100]
+    sql = "select * from c where c.pk = 'batch_pk_a'"
+    docs = await cosmos_util.query_items(sql, cross_partition=True)
+    assert len(docs) == 120
+
+    # test query_pages and query_items_stream, with continuation tokens
+    sql = "select * from c where c.pk = @pk"
+    parameters = [{"name": "@pk", "value": "batch_pk_a"}]
+    pages = list()
+    async for page in cosmos_util.query_pages(sql, parameters, page_size=50):
+        pages.append(page)
+    assert [len(p["items"]) for p in pages] == [50, 50, 20]
+    assert pages[-1]["continuation"] is None
+    assert pages[0]["ru"] > 0.0
+    resumed = list()
+    async for page in cosmos_util.query_pages(
+        sql, parameters, page_size=50, continuation=pages[0]["continuation"]
+    ):
+        resumed.append(page)
+    assert [len(p["items"]) for p in resumed] == [50, 20]
+    count = 0
+    async for item in cosmos_util.query_items_stream(sql, parameters, "batch_pk_a", 7):
+        assert item["pk"] == "batch_pk_a"
+        count = count + 1
+    assert count == 120
+
+    # test for_container handles, which share the client and proxy registry
+    handle = cosmos_util.for_container("dev", "test")
+    assert handle._client is cosmos_util._client
+    assert handle.get_current_cname() == "test"
+    assert handle is not cosmos_util
+    await handle.close()  # a no-op for handles
+    doc = await handle.point_read(docs[0]["id"], docs[0]["pk"])
+    assert doc["id"] == docs[0]["id"]
+    assert "dev/test" in cosmos_util.get_registry_stats()["containers"]
+
+
+def test_vector_search_query():
+    util = CosmosNoSqlUtil()
+    sql, parameters = util.vector_search_query(
+        5, ["id", "name"], {"pk": "pypi", "tags": ["web", "orm"]}
+    )
+    assert sql == (
+        "SELECT TOP @top_k c.id, c.name, VectorDistance(c.embedding, @embedding)"
+        " AS SimilarityScore FROM c WHERE c.pk = @filter0"
+        " AND ARRAY_CONTAINS(@filter1, c.tags)"
+        " ORDER BY VectorDistance(c.embedding, @embedding)"
+    )
+    assert parameters == [
+        {"name": "@top_k", "value": 5},
+        {"name": "@filter0", "value": "pypi"},
+        {"name": "@filter1", "value": ["web", "orm"]},
+    ]
+    sql, parameters = util.vector_search_query(3, None, None, "doc.vector", "score")
+    assert sql == (
+        "SELECT TOP @top_k c AS document, VectorDistance(c.doc.vector, @embedding)"
+        " AS score FROM c ORDER BY VectorDistance(c.doc.vector, @embedding)"
+    )
+    with pytest.raises(ValueError):
+        util.vector_search_query(3, ["id; DROP"])
+
+
+@pytest.mark.asyncio
+async def test_point_read_cache_not_found():
+    class FakeContainer:
+        id = "pytest"
+        deleted = False
+
+        async def read_item(self, item, partition_key, response_hook, **kwargs):
+            if self.deleted:
+                raise exceptions.CosmosHttpResponseError(status_code=404)
+            return {"id": item, "pk": partition_key, "_etag": "e1"}
+
+    util = CosmosNoSqlUtil()
+    util._ctrproxy = FakeContainer()
+    util.set_point_read_cache(PointReadCache(ttl_secs=0.0))
+    doc = await util.point_read("1", "NC")
+    assert doc["_etag"] == "e1"
+    assert util.get_point_read_cache_stats()["entries"] == 1
+    util._ctrproxy.deleted = True
+    with pytest.raises(exceptions.CosmosHttpResponseError):
+        await util.point_read("1", "NC")
+    stats = util.get_point_read_cache_stats()
+    assert stats["entries"] == 0
+    assert stats["invalidations"] == 1
+
+
+@pytest.mark.asyncio
+async def test_query_cache_write_during_query():
+    class FakeContainer:
+        id = "pytest"
+
+        def __init__(self):
+            self.doc = {"id": "1", "v": "old"}
+            self.util = None
+
+        def query_items(self, **kwargs):
+            container = self
+
+            async def items():
+                doc = dict(container.doc)  # read before the concurrent write
+                await container.util.upsert_item({"id": "1", "v": "new"})
+                yield doc
+
+            return items()
+
+        async def upsert_item(self, body, response_hook):
+            self.doc = dict(body)
+            return body
+
+    util = CosmosNoSqlUtil()
+    util._ctrproxy = FakeContainer()
+    util._ctrproxy.util = util
+    util.set_query_cache(MemoryQueryCache())
+    docs = await util.query_items("select * from c")
+    assert docs == [{"id": "1", "v": "old"}]
+    # the overlapping result wasn't cached, so the next query reads the new value
+    util._ctrproxy.query_items = lambda **kwargs: FakeItems([dict(util._ctrproxy.doc)])
+    docs = await util.query_items("select * from c")
+    assert docs == [{"id": "1", "v": "new"}]
+
+
+class FakeItems:
+    def __init__(self, items):
+        self.items = items
+
+    async def __aiter__(self):
+        for item in self.items:
+            yield item
+
+
+@pytest.mark.asyncio
+async def test_point_read_cache_write_during_read():
+    class FakeContainer:
+        id = "pytest"
+
+        def __init__(self):
+            self.doc = {"id": "1", "pk": "NC", "_etag": "e1"}
+            self.util = None
+
+        async def read_item(self, item, partition_key, response_hook, **kwargs):
+            doc = dict(self.doc)  # read before the concurrent write
+            if self.util is not None:
+                util, self.util = self.util, None
+                await util.upsert_item({"id": "1", "pk": "NC", "_etag": "e2"})
+            return doc
+
+        async def upsert_item(self, body, response_hook):
+            self.doc = dict(body)
+            return body
+
+    util = CosmosNoSqlUtil()
+    util._ctrproxy = FakeContainer()
+    util._ctrproxy.util = util
+    util.set_point_read_cache(PointReadCache(ttl_secs=60.0))
+    doc = await util.point_read("1", "NC")
+    assert doc["_etag"] == "e1"
+    # the document read before the write wasn't cached
+    doc = await util.point_read("1", "NC")
+    assert doc["_etag"] == "e2"
@@ -0,0 +1,81 @@
+import asyncio
+import json
+
+import pytest
+
+from src.db.cosmos_file_ingest import CosmosFileIngest
+from src.io.checkpoint import Checkpoint
+
+# pytest -v tests/test_cosmos_file_ingest.py
+
+
+class FakeNoSqlUtil:
+    """Implements the bulk_upsert interface of CosmosNoSqlUtil, in memory."""
+
+    def __init__(self):
+        self.docs = dict()
+
+    async def bulk_upsert(self, docs, concurrency=16, stats=None, rate_controller=None):
+        index = 0
+        async for doc in docs:
+            await asyncio.sleep(0)
+            result = dict()
+            result["index"] = index
+            result["id"] = doc["id"]
+            result["ok"] = doc["id"] != "bad"
+            result["ru"] = 1.0
+            result["error"] = None if result["ok"] else "bad doc"
+            if result["ok"]:
+                self.docs[doc["id"]] = doc
+            index = index + 1
+            yield result
+
+
+def write_files(tmp_path, count: int) -> list:
+    paths = list()
+    for n in range(count):
+        path = str(tmp_path / "doc{}.json".format(n))
+        with open(path, "wt") as f:
+            f.write(json.dumps({"id": str(n)}))
+        paths.append(path)
+    return paths
+
+
+def parse(path: str):
+    if path.endswith("doc3.json"):
+        return None
+    if path.endswith("doc4.json"):
+        raise ValueError("unparseable")
+    with open(path, "rt") as f:
+        doc = json.loads(f.read())
+    if path.endswith("doc5.json"):
+        doc["id"] = "bad"
+    return doc
+
+
+@pytest.mark.asyncio
+async def test_pipeline_with_checkpoint(tmp_path):
+    paths = write_files(tmp_path, 50)
+    checkpoint = Checkpoint(str(tmp_path / "checkpoint.jsonl"))
+    util = FakeNoSqlUtil()
+    pipeline = CosmosFileIngest(util, read_workers=3, queue_size=2, checkpoint=checkpoint)
+    stats = await pipeline.run(paths, parse)
+    assert stats["files"] == 50
+    assert stats["read"] == 48
+    assert stats["ignored"] == 1
+    assert stats["read_errors"] == 1
+    assert stats["written"] == 47
+    assert stats["failed"] == 1
+    assert stats["ru"] == 48.0
+    assert stats["max_queue_depth"] <= 2
+    assert len(util.docs) == 47
+
+    # a rerun skips the files that were loaded
+    util = FakeNoSqlUtil()
+    pipeline = CosmosFileIngest(util, checkpoint=checkpoint)
+    stats = await pipeline.run(paths, parse)
+    checkpoint.close()
+    assert stats["skipped"] == 47
+    assert stats["written"] == 0
+    assert stats["failed"] == 1
+    assert sorted(checkpoint.failed.values()) == ["bad doc", "unparseable"]
@@ -0,0 +1,79 @@
+from src.db.cosmos_metrics import CosmosRequestMetrics
+from src.db.cosmos_metrics import ResponseHook
+from src.db.cosmos_metrics import percentile
+
+# pytest -v tests/test_cosmos_metrics.py
+
+
+def test_percentile():
+    assert percentile([], 50) == 0.0
+    values = list(range(1, 101))
+    assert percentile(values, 0) == 1.0
+    assert percentile(values, 50) == 50.0
+    assert percentile(values, 95) == 95.0
+    assert percentile(values, 99) == 99.0
+    assert percentile(values, 100) == 100.0
+
+
+def test_record_and_stats():
+    metrics = CosmosRequestMetrics(max_samples=50, max_recent=3)
+    for n in range(100):
+        metrics.record("upsert_item", float(n), float(n) / 10.0, str(n))
+    metrics.record("point_read", 1.0, 2.0, "x", 404)
+    stats = metrics.get_stats()
+    assert sorted(stats["operations"].keys()) == ["point_read", "upsert_item"]
+    upserts = stats["operations"]["upsert_item"]
+    assert upserts["count"] == 100
+    assert upserts["errors"] == 0
+    assert upserts["ru_total"] == 4950.0
+    assert upserts["ru"]["mean"] == 49.5
+    assert upserts["ru"]["max"] == 99.0
+    assert upserts["ru"]["p50"] == 74.0  # only the last 50 samples are retained
+    assert stats["operations"]["point_read"]["errors"] == 1
+    recent = metrics.get_recent()
+    assert [r["activity_id"] for r in recent] == ["98", "99", "x"]
+    metrics.reset()
+    assert metrics.get_stats()["operations"] == dict()
+    assert metrics.get_recent() == list()
+
+
+def test_response_hook():
+    recorded, headers = list(), dict()
+    hook = ResponseHook(lambda *args: recorded.append(args), "query_page", headers)
+    hook({"x-ms-request-charge": "2.5", "x-ms-activity-id": "a1"}, None)
+    hook({"x-ms-request-charge": "1.5", "x-ms-activity-id": "a2"}, None)
+    assert hook.ru == 4.0
+    assert headers["x-ms-activity-id"] == "a2"
+    assert [r[0] for r in recorded] == ["query_page", "query_page"]
+    assert [r[1] for r in recorded] == [2.5, 1.5]
+    assert [r[3] for r in recorded] == ["a1", "a2"]
+    assert recorded[0][2] >= 0.0
+
+
+def test_response_hook_ignores_pager():
+    class FakePager:
+        def by_page(self, continuation_token=None):
+            return iter([])
+
+    recorded, headers = list(), dict()
+    hook = ResponseHook(lambda *args: recorded.append(args), "query", headers)
+    stale_headers = {"x-ms-request-charge": "9.0", "x-ms-activity-id": "stale"}
+    hook(stale_headers, FakePager())
+    assert hook.ru == 0.0
+    assert recorded == list()
+    assert headers == dict()
+    hook({"x-ms-request-charge": "2.5", "x-ms-activity-id": "a1"}, [{"id": "1"}])
+    assert hook.ru == 2.5
+    assert [r[3] for r in recorded] == ["a1"]
+
+
+def test_response_hook_failed():
+    class FakeError(Exception):
+        headers = {"x-ms-request-charge": "1.0", "x-ms-retry-after-ms": "10"}
+        status_code = 429
+
+    recorded = list()
+    hook = ResponseHook(lambda *args: recorded.append(args), "bulk_upsert")
+    hook.failed(FakeError())
+    assert recorded[0][1] == 1.0
+    assert recorded[0][4] == 429
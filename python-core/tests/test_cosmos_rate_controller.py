@@ -0,0 +1,87 @@
+import time
+
+import pytest
+
+from src.db.cosmos_nosql_util import CosmosRateController
+
+# pytest -v tests/test_cosmos_rate_controller.py
+
+
+def test_constructor():
+    rc = CosmosRateController(1000, headroom=0.9, max_concurrency=32)
+    assert rc.provisioned_ru_per_sec == 1000.0
+    assert rc.target_ru_per_sec == 900.0
+    assert rc.concurrency == 4
+    assert rc.current_ru_per_sec() == 0.0
+
+    rc = CosmosRateController(1000, initial_concurrency=100, max_concurrency=8)
+    assert rc.concurrency == 8
+
+
+def test_additive_increase():
+    rc = CosmosRateController(10000, initial_concurrency=2)
+    for n in range(2):
+        rc.record({"x-ms-request-charge": "10.0"})
+    assert rc.concurrency == 3
+    assert rc.current_ru_per_sec() == 20.0
+
+
+def test_no_increase_when_over_target():
+    rc = CosmosRateController(100, headroom=0.5, initial_concurrency=2)
+    for n in range(4):
+        rc.record({"x-ms-request-charge": "30.0"})
+    assert rc.concurrency == 2
+
+
+def test_multiplicative_decrease_on_throttle():
+    rc = CosmosRateController(10000, initial_concurrency=16)
+    rc.record({"x-ms-request-charge": "1.0", "x-ms-retry-after-ms": "50"}, True)
+    assert rc.concurrency == 8
+    assert rc.throttled_count == 1
+    assert rc.pause_until > time.time()
+    for n in range(10):
+        rc.record({}, True)
+    assert rc.concurrency == 1
+    assert rc.get_stats()["throttled_count"] == 11
+
+
+@pytest.mark.asyncio
+async def test_acquire_waits_for_retry_after():
+    rc = CosmosRateController(10000)
+    rc.record({"x-ms-retry-after-ms": "100"}, True)
+    t1 = time.time()
+    await rc.acquire()
+    assert time.time() - t1 >= 0.09
+    assert rc.get_stats()["paused_secs"] > 0.0
+
+
+@pytest.mark.asyncio
+async def test_acquire_waits_for_ru_window():
+    rc = CosmosRateController(100, headroom=1.0)
+    rc.record({"x-ms-request-charge": "150.0"})
+    t1 = time.time()
+    await rc.acquire()
+    assert time.time() - t1 >= 0.9
+    assert rc.current_ru_per_sec() == 0.0
+
+
+def test_sdk_throttle_retry_headers():
+    rc = CosmosRateController(10000, initial_concurrency=16)
+    headers = dict()
+    headers["x-ms-request-charge"] = "5.0"
+    headers["x-ms-throttle-retry-count"] = "2"
+    headers["x-ms-throttle-retry-wait-time-ms"] = "120"
+    rc.record(headers)
+    assert rc.concurrency == 8
+    assert rc.throttled_count == 1
+    assert rc.pause_until == 0.0  # the SDK has already waited
+    rc.record({"x-ms-request-charge": "5.0", "x-ms-throttle-retry-wait-time-ms": "30"})
+    assert rc.concurrency == 4
+    stats = rc.get_stats()
+    assert stats["sdk_throttle_retries"] == 2
+    assert stats["sdk_throttle_wait_ms"] == 150.0
+    assert stats["throttled_count"] == 2
+    # responses without the retry headers grow the concurrency again
+    for n in range(4):
+        rc.record({"x-ms-request-charge": "5.0", "x-ms-throttle-retry-count": "0"})
+    assert rc.concurrency == 5
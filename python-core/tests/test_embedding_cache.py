@@ -0,0 +1,87 @@
+import numpy as np
+import pytest
+
+from src.ai.embedding_cache import EmbeddingCache
+
+# pytest -v tests/test_embedding_cache.py
+
+
+def test_get_and_put(tmp_path):
+    cache = EmbeddingCache(str(tmp_path), max_memory_items=2)
+    assert cache.get("embeddings", "hello") is None
+    cache.put("embeddings", "hello", [1.0, 2.0, 3.0])
+    cache.put("embeddings", "world", np.array([4.0, 5.0, 6.0]))
+    cache.put("other_dep", "hello", [7.0, 8.0])
+    cache.put("embeddings", "hello", [1.0, 2.0, 3.0])  # already present
+    assert cache.size() == 3
+    assert cache.get("other_dep", "hello").tolist() == [7.0, 8.0]
+    vector = cache.get("embeddings", "world")
+    assert vector.dtype == np.float32
+    assert vector.tolist() == [4.0, 5.0, 6.0]
+    # "world", then "hello", were evicted from the memory tier, so are read
+    # from the memory-mapped file
+    assert cache.get("embeddings", "hello").tolist() == [1.0, 2.0, 3.0]
+    stats = cache.get_stats()
+    assert stats["puts"] == 3
+    assert stats["misses"] == 1
+    assert stats["disk_hits"] == 2
+    assert stats["memory_hits"] == 1
+    assert stats["evictions"] == 4
+    assert stats["memory_items"] == 2
+    cache.close()
+
+
+def test_reload(tmp_path):
+    cache = EmbeddingCache(str(tmp_path))
+    for i in range(100):
+        cache.put("embeddings", "text {}".format(i), np.full(8, i, dtype=np.float32))
+    cache.close()
+    # simulate an interrupted append, with no index entry
+    with open(cache.vectors_filename, mode="ab") as f:
+        f.write(b"\x00\x00")
+    with open(cache.index_filename, mode="at") as f:
+        f.write('{"key": "partial')
+
+    cache = EmbeddingCache(str(tmp_path), max_memory_items=0)
+    assert cache.size() == 100
+    assert cache.get("embeddings", "text 42").tolist() == [42.0] * 8
+    assert cache.get("embeddings", "text 100") is None
+    assert cache.get_stats()["hit_ratio"] == pytest.approx(0.5)
+    cache.close()
+
+
+def test_append_after_reload(tmp_path):
+    cache = EmbeddingCache(str(tmp_path))
+    cache.put("embeddings", "a", [1.0, 1.0])
+    cache.close()
+    with open(cache.vectors_filename, mode="ab") as f:
+        f.write(b"\x00\x00\x00")  # unindexed bytes, from an interrupted run
+    cache = EmbeddingCache(str(tmp_path))
+    cache.put("embeddings", "b", [2.0, 2.0])
+    assert cache.get("embeddings", "a").tolist() == [1.0, 1.0]
+    cache.close()
+    cache = EmbeddingCache(str(tmp_path))
+    assert cache.get("embeddings", "b").tolist() == [2.0, 2.0]
+    cache.close()
+
+
+def test_append_after_torn_index_line(tmp_path):
+    cache = EmbeddingCache(str(tmp_path))
+    cache.put("embeddings", "a", [1.0, 1.0])
+    cache.close()
+    # simulate a crash while writing the next vector and its index line
+    with open(cache.vectors_filename, mode="ab") as f:
+        f.write(b"\x00\x00\x80\x3f")
+    with open(cache.index_filename, mode="at") as f:
+        f.write('{"key": "embeddings:torn", "off')
+    cache = EmbeddingCache(str(tmp_path))
+    assert cache.size() == 1
+    cache.put("embeddings", "b", [2.0, 2.0])
+    cache.put("embeddings", "c", [3.0, 3.0])
+    cache.close()
+    cache = EmbeddingCache(str(tmp_path))
+    assert cache.size() == 3
+    assert cache.get("embeddings", "a").tolist() == [1.0, 1.0]
+    assert cache.get("embeddings", "b").tolist() == [2.0, 2.0]
+    assert cache.get("embeddings", "c").tolist() == [3.0, 3.0]
+    cache.close()
@@ -19,6 +19,13 @@ def test_boolean_arg():
     assert Env.boolean_arg("--some-other-flag") is False
 
 
+def test_flag_arg():
+    assert Env.flag_arg("--some-int") == "42"
+    assert int(Env.flag_arg("--some-int")) == 42
+    assert Env.flag_arg("--some-other-int") is None
+    assert Env.flag_arg("--some-other-int", "8") == "8"
+
+
 def test_cosmosdb_emulator_mongo_conn_str():
     expected = "mongodb://localhost:C2y6yDjf5%2FR%2Bob0N8A7Cgv30VRDJIWEHLM%2B4QDU5DE2nQ9nDuVTqobD4b8mGGyPMbIZnqyMsEcaGQy67XIw%2FJw%3D%3D@localhost:10255/admin?ssl=true"
     assert Env.cosmosdb_emulator_mongo_conn_str() == expected
@@ -87,6 +94,15 @@ def test_mongodb_conn_str():
     assert Env.mongodb_conn_str() == expected
 
 
+def test_postgresql_pool_sizes(monkeypatch):
+    monkeypatch.delenv("AZURE_PG_POOL_MIN_SIZE", raising=False)
+    monkeypatch.delenv("AZURE_PG_POOL_MAX_SIZE", raising=False)
+    assert Env.postgresql_pool_min_size() == 1
+    assert Env.postgresql_pool_max_size() == 8
+    monkeypatch.setenv("AZURE_PG_POOL_MAX_SIZE", "20")
+    assert Env.postgresql_pool_max_size() == 20
+
+
 def test_redis_host():
     expected = "127.0.0.1"
     assert Env.redis_host() == expected
@@ -0,0 +1,65 @@
+from src.util.openflights import AIRPORT_COLUMN_TYPES
+from src.util.openflights import OpenFlights
+
+# pytest -v tests/test_openflights.py
+
+
+def test_airport_documents():
+    openflights = OpenFlights()
+    docs = list(openflights.airport_documents())
+    assert len(docs) == 6071
+    clt = [doc for doc in docs if doc["iata"] == "CLT"][0]
+    assert clt["id"] == "airport_3876"
+    assert clt["airportid"] == 3876
+    assert clt["pk"] == "United States"
+    assert clt["country"] == "United States"
+    assert clt["altitude"] == 748.0
+    assert clt["timezone"] == "-5"
+    assert clt["location"]["type"] == "Point"
+    assert clt["location"]["coordinates"] == [clt["longitude"], clt["latitude"]]
+    for doc in docs:
+        assert doc["iata"] != "\\N"
+        assert doc["country"] != "\\N"
+    # airports.dat also has airport 1, which airports.json lacks
+    raw_docs = list(openflights.airport_documents("raw"))
+    assert len(raw_docs) == 6072
+    assert raw_docs[0]["id"] == "airport_1"
+    assert raw_docs[1] == docs[0]
+    openflights.close()
+
+
+def test_airport_documents_column_types():
+    openflights = OpenFlights()
+    column_types = dict(AIRPORT_COLUMN_TYPES)
+    column_types["Altitude"] = "INTEGER"
+    column_types["Timezone"] = "DOUBLE"
+    docs = list(
+        openflights.airport_documents(
+            "json",
+            lowercase_keys=False,
+            pk_attr="partition",
+            require_iata=False,
+            column_types=column_types,
+            require_country=False,
+        )
+    )
+    assert len(docs) == 7344  # those with a \\N Timezone are excluded
+    doc = docs[0]
+    assert doc["AirportID"] == 2
+    assert doc["partition"] == "Papua New Guinea"
+    assert isinstance(doc["Latitude"], float)
+    assert doc["Altitude"] == 20
+    assert doc["Timezone"] == 10.0
+    # the \\N values of the untyped columns are kept, as in the source data
+    assert len([doc for doc in docs if doc["IATA"] == "\\N"]) > 1000
+    openflights.close()
+
+
+def test_routes_columns():
+    openflights = OpenFlights()
+    routes = openflights.routes_columns()
+    assert len(routes["SourceAirportID"]) > 67000
+    assert len(routes["SourceAirportID"]) == len(routes["DestAirportID"])
+    assert str(routes["SourceAirportID"].dtype) == "int32"
+    assert routes["SourceAirport"][0] == "AER"
+    openflights.close()
@@ -0,0 +1,157 @@
+import time
+
+import pytest
+
+from src.db.query_cache import MemoryQueryCache
+from src.db.query_cache import PointReadCache
+from src.db.query_cache import RedisQueryCache
+from src.db.query_cache import query_cache_key
+from src.db.rcache import RCache
+from src.os.env import Env
+
+# pytest -v tests/test_query_cache.py
+
+
+def test_query_cache_key():
+    k1 = query_cache_key("query", "select * from c", [{"name": "@id", "value": 1}])
+    k2 = query_cache_key("query", "select * from c", [{"name": "@id", "value": 1}])
+    k3 = query_cache_key("query", "select * from c", [{"name": "@id", "value": 2}])
+    assert len(k1) == 64
+    assert k1 == k2
+    assert k1 != k3
+
+
+@pytest.mark.asyncio
+async def test_memory_get_and_set():
+    cache = MemoryQueryCache(max_bytes=1024, ttl_secs=60)
+    assert await cache.get("dev/test", "k1") is None
+    assert await cache.set("dev/test", "k1", [{"id": "1"}], 2.5) is True
+    value = await cache.get("dev/test", "k1")
+    assert value == [{"id": "1"}]
+    value.append("mutated")
+    assert await cache.get("dev/test", "k1") == [{"id": "1"}]
+    assert await cache.get("dev/other", "k1") is None
+
+    stats = cache.get_stats()
+    assert stats["hits"] == 2
+    assert stats["misses"] == 2
+    assert stats["ru_saved"] == 5.0
+    assert stats["entries"] == 1
+    assert stats["bytes"] == len('[{"id": "1"}]')
+
+
+@pytest.mark.asyncio
+async def test_memory_ttl():
+    cache = MemoryQueryCache(ttl_secs=0.05)
+    await cache.set("dev/test", "k1", [1, 2, 3])
+    assert await cache.get("dev/test", "k1") == [1, 2, 3]
+    time.sleep(0.1)
+    assert await cache.get("dev/test", "k1") is None
+    assert cache.get_stats()["expirations"] == 1
+    assert cache.get_stats()["entries"] == 0
+
+
+@pytest.mark.asyncio
+async def test_memory_lru_by_bytes():
+    cache = MemoryQueryCache(max_bytes=30, ttl_secs=60)
+    await cache.set("c", "k1", "aaaaaaaa")  # 10 bytes of json
+    await cache.set("c", "k2", "bbbbbbbb")
+    await cache.set("c", "k3", "cccccccc")
+    assert await cache.get("c", "k1") == "aaaaaaaa"  # k1 is now the most recently used
+    await cache.set("c", "k4", "dddddddd")
+    assert await cache.get("c", "k2") is None
+    assert await cache.get("c", "k1") == "aaaaaaaa"
+    assert await cache.get("c", "k4") == "dddddddd"
+    assert cache.get_stats()["evictions"] == 1
+    assert cache.get_stats()["bytes"] <= 30
+    assert await cache.set("c", "big", "x" * 100) is False
+
+
+@pytest.mark.asyncio
+async def test_memory_invalidate():
+    cache = MemoryQueryCache()
+    await cache.set("dev/a", "k1", [1])
+    await cache.set("dev/b", "k1", [2])
+    await cache.invalidate("dev/a")
+    assert await cache.get("dev/a", "k1") is None
+    assert await cache.get("dev/b", "k1") == [2]
+    await cache.set("dev/a", "k1", [3])
+    assert await cache.get("dev/a", "k1") == [3]
+    assert cache.get_stats()["invalidations"] == 1
+
+
+@pytest.mark.asyncio
+async def test_memory_generation():
+    cache = MemoryQueryCache()
+    generation = await cache.generation("dev/a")
+    assert generation == 0
+    await cache.invalidate("dev/a")  # a write while the query was running
+    assert await cache.set("dev/a", "k1", [1], 1.0, generation) is False
+    assert await cache.get("dev/a", "k1") is None
+    generation = await cache.generation("dev/a")
+    assert await cache.set("dev/a", "k1", [2], 1.0, generation) is True
+    assert await cache.get("dev/a", "k1") == [2]
+
+
+def test_point_read_cache():
+    cache = PointReadCache(max_entries=2, ttl_secs=0.05)
+    assert cache.get("dev/test", "1", "NC") is None
+    cache.put("dev/test", "1", "NC", {"id": "1", "pk": "NC", "_etag": "e1"}, 1.0)
+    entry = cache.get("dev/test", "1", "NC")
+    assert entry["fresh"] is True
+    assert entry["etag"] == "e1"
+    assert entry["doc"]["pk"] == "NC"
+    assert cache.get("dev/test", "1", "SC") is None
+
+    time.sleep(0.1)
+    assert cache.get("dev/test", "1", "NC")["fresh"] is False
+    cache.revalidated("dev/test", "1", 0.5)
+    assert cache.get("dev/test", "1", "NC")["fresh"] is True
+
+    cache.put("dev/test", "2", "NC", {"id": "2", "_etag": "e2"})
+    cache.put("dev/test", "3", "NC", {"id": "3", "_etag": "e3"})
+    assert cache.get("dev/test", "1", "NC") is None
+    cache.invalidate("dev/test", "3")
+    assert cache.get("dev/test", "3", "NC") is None
+
+    stats = cache.get_stats()
+    assert stats["hits"] == 2
+    assert stats["revalidated"] == 1
+    assert stats["misses"] == 3
+    assert stats["evictions"] == 1
+    assert stats["invalidations"] == 1
+    assert stats["ru"] == 1.5
+    assert stats["entries"] == 1
+
+
+def test_point_read_cache_token():
+    cache = PointReadCache(max_entries=2)
+    token = cache.read_token()
+    cache.invalidate("dev/test", "1")  # a write while the read was in flight
+    cache.put("dev/test", "1", "NC", {"id": "1", "_etag": "e1"}, 1.0, token)
+    assert cache.get("dev/test", "1", "NC") is None
+    cache.put("dev/test", "2", "NC", {"id": "2", "_etag": "e2"}, 1.0, token)
+    assert cache.get("dev/test", "2", "NC")["etag"] == "e2"
+    token = cache.read_token()
+    cache.put("dev/test", "1", "NC", {"id": "1", "_etag": "e3"}, 1.0, token)
+    assert cache.get("dev/test", "1", "NC")["etag"] == "e3"
+    # once the invalidation of an id has been dropped, older tokens are refused
+    for id in ["3", "4", "5"]:
+        cache.invalidate("dev/test", id)
+    cache.put("dev/test", "6", "NC", {"id": "6", "_etag": "e6"}, 1.0, token)
+    assert cache.get("dev/test", "6", "NC") is None
+
+
+@pytest.mark.skip(reason="this test requires a local redis server")
+@pytest.mark.asyncio
+async def test_redis_get_set_and_invalidate():
+    cache = RedisQueryCache(RCache(Env.redis_host(), Env.redis_port()), ttl_secs=10)
+    container = "dev/test-{}".format(Env.epoch())
+    assert await cache.get(container, "k1") is None
+    await cache.set(container, "k1", [{"id": "1"}], 3.0)
+    assert await cache.get(container, "k1") == [{"id": "1"}]
+    await cache.invalidate(container)
+    assert await cache.get(container, "k1") is None
+    stats = cache.get_stats()
+    assert stats["hits"] == 1
+    assert stats["ru_saved"] == 3.0
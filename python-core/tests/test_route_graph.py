@@ -0,0 +1,62 @@
+import numpy as np
+
+from src.util.openflights import OpenFlights
+from src.util.route_graph import RouteGraph
+
+# pytest -v tests/test_route_graph.py
+
+
+def small_graph() -> RouteGraph:
+    # 10 -> 20 -> 30 -> 40, 10 -> 30, and a route to the unknown airport 99
+    airport_ids = np.array([10, 20, 30, 40, 50], dtype=np.int32)
+    iata = np.array(["AAA", "BBB", "CCC", "DDD", ""], dtype="U4")
+    source_ids = np.array([10, 20, 30, 10, 10, 10, 40], dtype=np.int32)
+    dest_ids = np.array([20, 30, 40, 30, 30, 99, 10], dtype=np.int32)
+    return RouteGraph.from_arrays(airport_ids, iata, source_ids, dest_ids)
+
+
+def test_from_arrays():
+    graph = small_graph()
+    assert graph.airport_count() == 5
+    assert graph.route_count() == 5  # the duplicate and the 99 routes are excluded
+    assert graph.indptr.tolist() == [0, 2, 3, 4, 5, 5]
+    assert graph.neighbors(10) == [20, 30]
+    assert graph.neighbors("aaa") == [20, 30]
+    assert graph.neighbors(50) == []
+    assert graph.neighbors(99) == []
+    assert graph.index_of("CCC") == 2
+
+
+def test_shortest_hops_and_within_hops():
+    graph = small_graph()
+    assert graph.shortest_hops(10, 40) == [10, 30, 40]
+    assert graph.shortest_hops("DDD", "BBB") == [40, 10, 20]
+    assert graph.shortest_hops(10, 10) == [10]
+    assert graph.shortest_hops(10, 50) is None
+    assert graph.shortest_hops(10, 99) is None
+    assert graph.within_hops(10, 1) == [20, 30]
+    assert graph.within_hops(10, 2) == [20, 30, 40]
+    assert graph.within_hops(20, 0) == []
+
+
+def test_save_and_load(tmp_path):
+    graph = small_graph()
+    graph.save(str(tmp_path))
+    loaded = RouteGraph.load(str(tmp_path))
+    assert isinstance(loaded.indices, np.memmap)
+    assert loaded.shortest_hops("DDD", "BBB") == [40, 10, 20]
+    assert loaded.within_hops(10, 2) == [20, 30, 40]
+
+
+def test_openflights_routes():
+    openflights = OpenFlights()
+    graph = RouteGraph.from_openflights(openflights)
+    openflights.close()
+    assert graph.airport_count() > 7000
+    assert graph.route_count() > 30000
+    path = graph.shortest_hops("CLT", "GKA")
+    assert path[0] == 3876
+    assert path[-1] == 1
+    for a, b in zip(path, path[1:]):
+        assert b in graph.neighbors(a)
+    assert len(graph.within_hops("CLT", 1)) == len(graph.neighbors("CLT"))
@@ -0,0 +1,124 @@
+import asyncio
+
+import numpy as np
+import pytest
+
+pytest.importorskip("semantic_kernel")
+pytest.importorskip("tiktoken")
+
+from src.ai.embedding_cache import EmbeddingCache
+from src.ai.sk_util import SKUtil
+
+# pytest -v tests/test_sk_util.py
+
+
+class FakeEmbeddingService:
+    """An AzureTextEmbedding stand-in, with a [len(text), first char] vector per text."""
+
+    def __init__(self, fail_text: str = None):
+        self.fail_text = fail_text
+        self.batches = list()
+
+    async def generate_embeddings(self, texts, batch_size=None):
+        self.batches.append(list(texts))
+        await asyncio.sleep(0.01 * (len(self.batches) % 3))  # complete out of order
+        if self.fail_text in texts:
+            raise RuntimeError("simulated embedding failure")
+        return np.array([[len(t), ord(t[0])] for t in texts], dtype=np.float64)
+
+
+def word_count(text: str) -> int:
+    return len(text.split())
+
+
+def test_count_tokens():
+    sk_util = SKUtil()
+    assert sk_util.count_tokens("") == 0
+    assert sk_util.count_tokens("hello world") == 2
+    assert sk_util.count_tokens("<|endoftext|>") > 0  # special tokens are plain text
+
+
+def test_embedding_batches(monkeypatch):
+    sk_util = SKUtil()
+    monkeypatch.setattr(sk_util, "count_tokens", word_count)
+    texts = ["a b c", "d e", "f", "g h i j k l", "m", "n", "o"]
+    # the token limit
+    batches = sk_util.embedding_batches(texts, max_batch_tokens=5)
+    assert batches == [["a b c", "d e"], ["f"], ["g h i j k l"], ["m", "n", "o"]]
+    # the size limit
+    batches = sk_util.embedding_batches(texts, max_batch_tokens=100, max_batch_size=3)
+    assert batches == [["a b c", "d e", "f"], ["g h i j k l", "m", "n"], ["o"]]
+    assert sk_util.embedding_batches([], 5) == []
+
+
+@pytest.mark.asyncio
+async def test_generate_embeddings_batch(monkeypatch, tmp_path):
+    sk_util = SKUtil()
+    service = FakeEmbeddingService()
+    monkeypatch.setattr(sk_util, "count_tokens", word_count)
+    monkeypatch.setattr(sk_util, "get_embedding_instance", lambda dep_name: service)
+    sk_util.set_embedding_cache(EmbeddingCache(str(tmp_path)))
+    texts = ["alpha beta", "gamma", "alpha beta", "delta epsilon zeta", "eta", "theta"]
+    matrix = await sk_util.generate_embeddings_batch(texts, "dep", max_batch_tokens=3)
+    assert matrix.dtype == np.float32
+    assert matrix.shape == (6, 2)
+    assert matrix.tolist() == [[len(t), ord(t[0])] for t in texts]
+    assert len(service.batches) == 3  # the duplicate text is sent once
+
+    # the second call sends only the new text
+    service.batches.clear()
+    matrix = await sk_util.generate_embeddings_batch(texts + ["iota"], "dep")
+    assert service.batches == [["iota"]]
+    assert matrix[6].tolist() == [4.0, float(ord("i"))]
+    sk_util.embedding_cache.close()
+
+
+@pytest.mark.asyncio
+async def test_generate_embeddings_batch_failure(monkeypatch, tmp_path):
+    sk_util = SKUtil()
+    service = FakeEmbeddingService(fail_text="bad")
+    monkeypatch.setattr(sk_util, "count_tokens", word_count)
+    monkeypatch.setattr(sk_util, "get_embedding_instance", lambda dep_name: service)
+    sk_util.set_embedding_cache(EmbeddingCache(str(tmp_path)))
+    texts = ["one", "two", "bad", "three", "four"]
+    assert await sk_util.generate_embeddings_batch(texts, "dep", max_batch_size=2) is None
+    # the successful batches are cached, so a retry only sends the failed one
+    assert sk_util.embedding_cache.size() == 3
+    service.batches.clear()
+    service.fail_text = None
+    matrix = await sk_util.generate_embeddings_batch(texts, "dep", max_batch_size=2)
+    assert service.batches == [["bad", "three"]]
+    assert matrix.tolist() == [[len(t), ord(t[0])] for t in texts]
+    sk_util.embedding_cache.close()
+
+
+def test_service_instances_are_shared(monkeypatch):
+    monkeypatch.setenv("AZURE_OPENAI_URL", "https://example.openai.azure.com/")
+    monkeypatch.setenv("AZURE_OPENAI_KEY", "test-key")
+    sk_util = SKUtil()
+    completion = sk_util.get_completion_instance("gpt-4o")
+    embedding = sk_util.get_embedding_instance("text-embedding-3-small")
+    assert sk_util.get_completion_instance("gpt-4o") is completion
+    assert sk_util.get_embedding_instance("text-embedding-3-small") is embedding
+    assert embedding is not completion
+    # both instances use the one AsyncAzureOpenAI client, and its httpx.AsyncClient
+    assert len(sk_util.openai_clients) == 1
+    assert completion.client is embedding.client
+    assert embedding.client._client is sk_util.http_client
+    stats = sk_util.get_service_stats()
+    assert stats["instances_created"] == 2
+    assert stats["instances_reused"] == 2
+
+
+@pytest.mark.asyncio
+async def test_close(monkeypatch):
+    monkeypatch.setenv("AZURE_OPENAI_URL", "https://example.openai.azure.com/")
+    monkeypatch.setenv("AZURE_OPENAI_KEY", "test-key")
+    sk_util = SKUtil()
+    sk_util.get_embedding_instance("text-embedding-3-small")
+    await sk_util.close()
+    assert sk_util.http_client is None
+    assert sk_util.service_instances == dict()
+    with pytest.raises(RuntimeError):
+        sk_util.get_embedding_instance("text-embedding-3-small")
+    await sk_util.close()  # closing again is harmless
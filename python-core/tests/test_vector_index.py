@@ -0,0 +1,65 @@
+import numpy as np
+import pytest
+
+from src.ai.vector_index import VectorIndex
+
+# pytest -v tests/test_vector_index.py
+
+
+def random_documents(count: int, dims: int = 32, seed: int = 7) -> list:
+    rng = np.random.default_rng(seed)
+    vectors = rng.normal(size=(count, dims)).astype(np.float32)
+    docs = list()
+    for i, vector in enumerate(vectors):
+        docs.append({"id": "d{}".format(i), "embedding": vector.tolist()})
+    return docs
+
+
+def test_from_documents():
+    docs = random_documents(10, 4)
+    docs.append({"id": "no_embedding"})
+    docs.append({"id": "wrong_dims", "embedding": [1.0, 2.0]})
+    index = VectorIndex.from_documents(docs)
+    assert index.size() == 10
+    assert index.dimensions() == 4
+    assert index.matrix.dtype == np.float32
+    assert np.allclose(np.linalg.norm(index.matrix, axis=1), 1.0)
+    assert index.vector("no_embedding") is None
+
+
+def test_search_and_similar():
+    index = VectorIndex(["a", "b", "c", "d"], [[1, 0], [0, 1], [1, 1], [-1, 0]])
+    results = index.search([[2, 0], [0, 3]], k=2)
+    assert [r[0] for r in results[0]] == ["a", "c"]
+    assert [r[0] for r in results[1]] == ["b", "c"]
+    assert results[0][0][1] == pytest.approx(1.0)
+    assert results[0][1][1] == pytest.approx(np.sqrt(0.5))
+    assert [r[0] for r in index.similar("a", 3)] == ["c", "b", "d"]
+    assert index.similar("missing") == []
+    assert len(index.search([1, 0], k=100)[0]) == 4
+
+
+def test_ivf_search():
+    docs = random_documents(2000)
+    index = VectorIndex.from_documents(docs)
+    exact = index.similar("d42", 10)
+    index.build_ivf(nlist=20)
+    assert len(index.centroids) == 20
+    assert sorted(index.ivf_rows.tolist()) == list(range(2000))
+    assert index.ivf_offsets[-1] == 2000
+    # probing every cluster is an exact search
+    assert index.similar("d42", 10, nprobe=20) == exact
+    approx = index.similar("d42", 10, nprobe=5)
+    assert len(approx) == 10
+    assert approx[0][1] <= exact[0][1] + 1e-6
+
+
+def test_save_and_load(tmp_path):
+    index = VectorIndex.from_documents(random_documents(200))
+    index.build_ivf(nlist=10)
+    outfile = str(tmp_path / "index.npz")
+    index.save(outfile)
+    loaded = VectorIndex.load(outfile)
+    assert loaded.ids == index.ids
+    assert np.array_equal(loaded.matrix, index.matrix)
+    assert loaded.similar("d7", 5, nprobe=3) == index.similar("d7", 5, nprobe=3)
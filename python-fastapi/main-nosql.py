@@ -29,6 +29,8 @@ from src.io.fs import FS
 from src.os.env import Env
 from src.db.cosmos_nosql_util import CosmosNoSqlUtil
 from src.util.data_gen import DataGenerator
+from src.util.openflights import AIRPORT_COLUMN_TYPES
+from src.util.openflights import OpenFlights
 
 fake = Faker()
 
@@ -58,21 +60,39 @@ async def load_openflights():
         nosql_util.set_db(dbname)
         nosql_util.set_container(cname)
         
-        # parsing loop
-        json_lines = FS.read_lines("../data/openflights/json/airports.json")
-        parsed_airports = list()
-        for json_line in json_lines:
-            doc = parse_reformat_airport(json_line)
-            if doc is not None:
-                parsed_airports.append(doc)
+        # the airports are read, typed, and filtered in columnar form by DuckDB,
+        # with an integer Altitude and a float Timezone
+        openflights = OpenFlights()
+        column_types = dict(AIRPORT_COLUMN_TYPES)
+        column_types["Altitude"] = "INTEGER"
+        column_types["Timezone"] = "DOUBLE"
+        parsed_airports = list(
+            openflights.airport_documents(
+                "json",
+                lowercase_keys=False,
+                require_iata=False,
+                geojson=False,
+                column_types=column_types,
+                require_country=False,
+            )
+        )
+        openflights.close()
         FS.write_json(parsed_airports, "tmp/parsed_airports.json")
         print("{} parsed airports".format(len(parsed_airports)))
 
-        # loading loop.  intentionally inefficient (i.e - not bulk-loaded),
-        # so as to enable 1000-RU free Cosmos DB accounts.
-        for idx, doc in enumerate(parsed_airports):
-            await nosql_util.upsert_item(doc)
-            print("airport loaded: {} {}".format(idx + 1, doc["IATA"]))
+        # loading loop.  the number of concurrent upserts is bounded by
+        # AZURE_COSMOSDB_NOSQL_BULK_CONCURRENCY; set it to 1 for the
+        # serial behavior suitable for 1000-RU free Cosmos DB accounts.
+        stats = dict()
+        concurrency = Env.cosmosdb_nosql_bulk_concurrency()
+        controller = await nosql_util.create_rate_controller(max_concurrency=concurrency)
+        async for result in nosql_util.bulk_upsert(
+            parsed_airports, concurrency, stats, controller
+        ):
+            if not result["ok"]:
+                print("airport failed: {} {}".format(result["id"], result["error"]))
+        print("bulk_upsert stats: {}".format(json.dumps(stats)))
+        print("rate controller stats: {}".format(json.dumps(controller.get_stats())))
 
     except Exception as e:
         logging.info(str(e))
@@ -81,41 +101,6 @@ async def load_openflights():
         if nosql_util is not None:
             await nosql_util.close()
 
-def parse_reformat_airport(json_line):
-    try:
-        # The documents look like this.  Cast the numeric attributes
-        # to integers and floats in this method.
-        # {
-        #   "AType": "airport",
-        #   "AirportID": "3876",
-        #   "Altitude": "748",
-        #   "City": "Charlotte",
-        #   "Country": "United States",
-        #   "DST": "A",
-        #   "IATA": "CLT",
-        #   "ICAO": "KCLT",
-        #   "Latitude": "35.2140007019043",
-        #   "Longitude": "-80.94309997558594",
-        #   "Name": "Charlotte Douglas International Airport",
-        #   "Source": "OurAirports",
-        #   "Timezone": "-5",
-        #   "Tz": "America/New_York"
-        # }
-        doc = json.loads(json_line)
-        doc["AirportID"] = int(doc["AirportID"])
-        doc["Altitude"] = int(doc["Altitude"])
-        doc["Latitude"] = float(doc["Latitude"])
-        doc["Longitude"] = float(doc["Longitude"])
-        doc["Timezone"] = float(doc["Timezone"])
-        doc["id"] = str(uuid.uuid4())
-        doc["pk"] = doc["Country"]
-        if doc['IATA'] == "CLT":
-            print(json.dumps(doc, sort_keys=True, indent=2))
-        return doc
-    except Exception as e:
-        print("parse_reformat_airport - unable to parse line:\n{}".format(json_line))
-        return None
-
 async def test_cosmos_nosql(
     dbname: str, db_ru: int, cname: str, c_ru: int, pkpath: str):
     nosql_util = None
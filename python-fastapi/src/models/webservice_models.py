@@ -22,12 +22,27 @@ class HealthResponseModel(BaseModel):
     alive: bool
     rows_read: int
 
+class PointReadResponseModel(BaseModel):
+    id: str
+    pk: str
+    doc: Any = None
+    elapsed: float
+    error: str | None
+
 class CosmosQueryRequestModel(BaseModel):
     sql: str
+    dbname: str | None = None
+    cname: str | None = None
+    page_size: int | None = None
+    continuation: str | None = None
+    stream: bool = False
 
 class CosmosQueryResponseModel(BaseModel):
     sql: str
     results: Any = None
+    continuation: str | None = None
+    response_bytes: int = 0
+    suggested_page_size: int | None = None
     ru: float
     elapsed: float
     error: str | None
@@ -90,6 +90,10 @@ class Env:
     def cosmosdb_nosql_default_container(cls) -> str:
         return cls.envvar("AZURE_COSMOSDB_NOSQL_DEFAULT_CONTAINER", 'test')
 
+    @classmethod
+    def cosmosdb_nosql_bulk_concurrency(cls) -> int:
+        return int(cls.envvar("AZURE_COSMOSDB_NOSQL_BULK_CONCURRENCY", "16"))
+
     @classmethod
     def cosmosdb_emulator_mongo_conn_str(cls) -> str:
         return "mongodb://localhost:C2y6yDjf5%2FR%2Bob0N8A7Cgv30VRDJIWEHLM%2B4QDU5DE2nQ9nDuVTqobD4b8mGGyPMbIZnqyMsEcaGQy67XIw%2FJw%3D%3D@localhost:10255/admin?ssl=true"
@@ -110,6 +114,40 @@ class Env:
     def redis_port(cls) -> str:
         return cls.envvar("REDIS_PORT", "6379")
 
+    @classmethod
+    def web_query_default_page_size(cls) -> int:
+        return int(cls.envvar("WEB_QUERY_DEFAULT_PAGE_SIZE", "100"))
+
+    @classmethod
+    def web_query_max_page_size(cls) -> int:
+        return int(cls.envvar("WEB_QUERY_MAX_PAGE_SIZE", "1000"))
+
+    @classmethod
+    def web_query_max_response_bytes(cls) -> int:
+        return int(cls.envvar("WEB_QUERY_MAX_RESPONSE_BYTES", str(4 * 1024 * 1024)))
+
+    @classmethod
+    def web_query_cache(cls) -> str:
+        """Return the /query_cosmos cache type; none, memory, or redis."""
+        return cls.envvar("WEB_QUERY_CACHE", "none").strip().lower()
+
+    @classmethod
+    def web_query_cache_ttl_secs(cls) -> float:
+        return float(cls.envvar("WEB_QUERY_CACHE_TTL_SECS", "60"))
+
+    @classmethod
+    def web_query_cache_max_bytes(cls) -> int:
+        return int(cls.envvar("WEB_QUERY_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+
+    @classmethod
+    def web_point_read_cache_max_entries(cls) -> int:
+        """Return the max entries of the point-read cache; 0 disables it."""
+        return int(cls.envvar("WEB_POINT_READ_CACHE_MAX_ENTRIES", "0"))
+
+    @classmethod
+    def web_point_read_cache_ttl_secs(cls) -> float:
+        return float(cls.envvar("WEB_POINT_READ_CACHE_TTL_SECS", "5"))
+
     @classmethod
     def log_standard_env_vars(cls) -> bool:
         for key in sorted(cls.standard_env_vars().keys()):
@@ -22,6 +22,7 @@ from contextlib import asynccontextmanager
 from dotenv import load_dotenv
 
 from fastapi import FastAPI, Request, Response, Form, status
+from fastapi.responses import StreamingResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 
@@ -30,10 +31,15 @@ from src.models.webservice_models import PingResponseModel
 from src.models.webservice_models import HealthResponseModel
 from src.models.webservice_models import CosmosQueryRequestModel
 from src.models.webservice_models import CosmosQueryResponseModel
+from src.models.webservice_models import PointReadResponseModel
 
 from src.io.fs import FS
 from src.os.env import Env
 from src.db.cosmos_nosql_util import CosmosNoSqlUtil
+from src.db.query_cache import MemoryQueryCache
+from src.db.query_cache import PointReadCache
+from src.db.query_cache import RedisQueryCache
+from src.db.rcache import RCache
 
 
 # standard initialization
@@ -67,6 +73,12 @@ async def lifespan(app: FastAPI):
         print("CosmosNoSqlUtil using dbname: {}, cname: {}".format(dbname, cname))
         nosql_util.set_db(dbname)
         nosql_util.set_container(cname)
+        nosql_util.set_query_cache(create_query_cache())
+        max_entries = Env.web_point_read_cache_max_entries()
+        if max_entries > 0:
+            nosql_util.set_point_read_cache(
+                PointReadCache(max_entries, Env.web_point_read_cache_ttl_secs())
+            )
     except Exception as e:
         logging.error("FastAPI lifespan exception: {}".format(str(e)))
         logging.error(traceback.format_exc())
@@ -78,6 +90,21 @@ async def lifespan(app: FastAPI):
     logging.info("FastAPI lifespan, pool closed")
 
 
+def create_query_cache():
+    """
+    Return the optional query-result cache per the WEB_QUERY_CACHE
+    environment variable; none (the default), memory, or redis.
+    """
+    cache_type = Env.web_query_cache()
+    ttl_secs = Env.web_query_cache_ttl_secs()
+    logging.warning("query cache type: {}, ttl_secs: {}".format(cache_type, ttl_secs))
+    if cache_type == "memory":
+        return MemoryQueryCache(Env.web_query_cache_max_bytes(), ttl_secs)
+    if cache_type == "redis":
+        return RedisQueryCache(RCache(Env.redis_host(), Env.redis_port()), ttl_secs)
+    return None
+
+
 app = FastAPI(lifespan=lifespan)
 app.mount("/static", StaticFiles(directory="static"), name="static")
 views = Jinja2Templates(directory="views")
@@ -108,10 +135,83 @@ async def get_health(req: Request, resp: Response) -> HealthResponseModel:
     return liveness_data
 
 
+@app.get("/query_cache_stats")
+async def get_query_cache_stats() -> dict:
+    """Return the hit, miss, and RU-saved statistics of the query cache."""
+    return nosql_util.get_query_cache_stats()
+
+
+@app.get("/cosmos_request_metrics")
+async def get_cosmos_request_metrics(recent: bool = False) -> dict:
+    """
+    Return the per-operation Cosmos DB request counts, RU totals, and the
+    p50/p95/p99 latency and RU histograms, and optionally the recent requests.
+    """
+    metrics = nosql_util.get_request_metrics()
+    if recent:
+        metrics["recent"] = nosql_util.get_recent_requests()
+    return metrics
+
+
+@app.get("/container_registry_stats")
+async def get_container_registry_stats() -> dict:
+    """Return the database and container proxies cached by the shared client."""
+    return nosql_util.get_registry_stats()
+
+
+@app.get("/point_read_cache_stats")
+async def get_point_read_cache_stats() -> dict:
+    """Return the hit, revalidation, miss, and RU statistics of the point-read cache."""
+    return nosql_util.get_point_read_cache_stats()
+
+
+@app.get("/document/{pk}/{id}")
+async def get_document(
+    pk: str, id: str, dbname: str | None = None, cname: str | None = None
+) -> PointReadResponseModel:
+    """
+    Return the given document via a point read, which is served from the
+    point-read cache if WEB_POINT_READ_CACHE_MAX_ENTRIES is greater than 0.
+    The optional dbname and cname query parameters default to the
+    AZURE_COSMOSDB_NOSQL_DEFAULT_DB and _CONTAINER values.
+    """
+    global nosql_util
+    start_time = time.time()
+    response_data = dict()
+    response_data["id"] = id
+    response_data["pk"] = pk
+    response_data["doc"] = None
+    response_data["error"] = None
+    try:
+        container_util = nosql_util.for_container(dbname, cname)
+        response_data["doc"] = await container_util.point_read(id, pk)
+    except Exception as e:
+        response_data["error"] = str(e)
+    response_data["elapsed"] = time.time() - start_time
+    return response_data
+
+
 @app.post("/query_cosmos")
 async def post_sparql_console(req: CosmosQueryRequestModel) -> CosmosQueryResponseModel:
+    """
+    Execute the given SQL query and return one page of its results, plus the
+    continuation token for the next page, or None if this is the last page.
+    Pass the continuation token, and the same sql, in the next request to
+    read the next page.  The page size is bounded by WEB_QUERY_MAX_PAGE_SIZE
+    and the size of the results by WEB_QUERY_MAX_RESPONSE_BYTES; a larger
+    page is not returned, and the response instead has a suggested_page_size,
+    scaled by the average document size, to retry the same continuation with.
+    If the request specifies "stream": true, then all of the results are
+    instead returned as newline-delimited JSON; see stream_cosmos_query().
+    The optional dbname and cname default to the AZURE_COSMOSDB_NOSQL_DEFAULT_DB
+    and _CONTAINER values.
+    """
     global nosql_util
     logging.info("/query_cosmos request: {}".format(req))
+    if req.stream:
+        return StreamingResponse(
+            stream_cosmos_query(req), media_type="application/x-ndjson"
+        )
 
     start_time = time.time()
     response_data = dict()
@@ -122,13 +222,44 @@ async def post_sparql_console(req: CosmosQueryRequestModel) -> CosmosQueryRespon
     try:
         response_data["sql"] = req.sql
         response_data["results"] = None
+        response_data["continuation"] = None
 
-        query_results = await nosql_util.query_items(req.sql, True)
-        response_results = list()
-        for idx, result in enumerate(query_results):
-            response_results.append(result)
-        response_data["results"] = response_results
-        response_data["ru"] = float(nosql_util.last_request_charge())
+        page_size = req.page_size
+        if page_size is None or page_size < 1:
+            page_size = Env.web_query_default_page_size()
+        page_size = min(page_size, Env.web_query_max_page_size())
+        container_util = nosql_util.for_container(req.dbname, req.cname)
+        pages = container_util.query_pages(
+            req.sql, page_size=page_size, continuation=req.continuation
+        )
+        try:
+            page = await anext(pages, None)
+        finally:
+            await pages.aclose()
+        if page is not None:
+            response_bytes = len(json.dumps(page["items"]).encode("utf-8"))
+            response_data["response_bytes"] = response_bytes
+            response_data["ru"] = page["ru"]
+            max_bytes = Env.web_query_max_response_bytes()
+            if response_bytes > max_bytes:
+                if len(page["items"]) > 1:
+                    # scale the page size by the average document size
+                    suggested = max(1, len(page["items"]) * max_bytes // response_bytes)
+                    response_data["suggested_page_size"] = suggested
+                    response_data["error"] = (
+                        "page of {} bytes exceeds the {} byte limit; "
+                        "retry with a page_size of {} or less"
+                    ).format(response_bytes, max_bytes, suggested)
+                else:
+                    response_data["error"] = (
+                        "the document of {} bytes exceeds the {} byte limit; "
+                        "narrow the SELECT list of the query"
+                    ).format(response_bytes, max_bytes)
+            else:
+                response_data["results"] = page["items"]
+                response_data["continuation"] = page["continuation"]
+        else:
+            response_data["results"] = list()
     except Exception as e:
         response_data["error"] = str(e)
 
@@ -136,3 +267,52 @@ async def post_sparql_console(req: CosmosQueryRequestModel) -> CosmosQueryRespon
     response_data["finish_time"] = finish_time
     response_data["elapsed"] = finish_time - start_time
     return response_data
+
+
+async def stream_cosmos_query(req: CosmosQueryRequestModel):
+    """
+    Yield the results of the given query as newline-delimited JSON, one line
+    per document as each page arrives from Cosmos DB, followed by a final
+    trailer line like:
+      {"trailer": true, "count": 123, "ru": 8.5, "elapsed": 0.42, "error": null, ...}
+    The full result set is never held in memory, so the query cache is
+    bypassed.  The HTTP status is sent before the query executes, so errors
+    are reported in the trailer.
+    """
+    global nosql_util
+    start_time = time.time()
+    trailer = dict()
+    trailer["trailer"] = True
+    trailer["sql"] = req.sql
+    trailer["count"] = 0
+    trailer["ru"] = 0.0
+    trailer["continuation"] = None
+    trailer["error"] = None
+    page_size = req.page_size
+    if page_size is None or page_size < 1:
+        page_size = Env.web_query_default_page_size()
+    page_size = min(page_size, Env.web_query_max_page_size())
+    try:
+        container_util = nosql_util.for_container(req.dbname, req.cname)
+        async for page in container_util.query_pages(
+            req.sql,
+            page_size=page_size,
+            continuation=req.continuation,
+            use_cache=False,
+        ):
+            trailer["ru"] = trailer["ru"] + page["ru"]
+            trailer["continuation"] = page["continuation"]
+            lines = list()
+            for item in page["items"]:
+                lines.append(json.dumps(item))
+            trailer["count"] = trailer["count"] + len(lines)
+            if len(lines) > 0:
+                yield "\n".join(lines) + "\n"
+    except Exception as e:
+        logging.error("stream_cosmos_query exception: {}".format(str(e)))
+        trailer["error"] = str(e)
+    trailer["start_time"] = start_time
+    trailer["finish_time"] = time.time()
+    trailer["elapsed"] = trailer["finish_time"] - start_time
+    yield json.dumps(trailer) + "\n"
+